@@ -1,55 +1,109 @@
+import threading
 import time
-import pyautogui
+from typing import Optional
 import serial
 from serial import SerialException
 from serial.tools import list_ports
 from config import CONFIG
-from detection import REGIONS, BOARD_RECOGNIZER
+from detection import REGIONS, BOARD_RECOGNIZER, CAPTURE
+from lazy import Lazy
+from serial_link import SerialLink
+from metrics import METRICS, log
+from tuning import TUNER
+
+def select_port(interactive: bool = True) -> Optional[str]:
+    """列出串口供选择；非交互模式不提示，直接使用已保存的串口。"""
+    if not interactive:
+        if REGIONS.serial_port:
+            log(f'[STEP] 使用已保存串口 {REGIONS.serial_port}')
+        return REGIONS.serial_port
+    ports = list(list_ports.comports())
+    if not ports:
+        log('[WARN] 未发现任何串口设备，无法使用Arduino移动')
+        return None
+    print('[INFO] 可用串口列表:')
+    for idx, p in enumerate(ports, start=1):
+        print(f'  {idx}. {p.device} - {p.description}')
+    while True:
+        inp = input(f'请选择串口编号(1-{len(ports)})，或直接回车使用已有配置: ').strip()
+        if inp == '' and REGIONS.serial_port:
+            log(f'[STEP] 使用已保存串口 {REGIONS.serial_port}')
+            return REGIONS.serial_port
+        try:
+            num = int(inp)
+            if 1 <= num <= len(ports):
+                selected = ports[num-1].device
+                log(f'[STEP] 选择串口 {selected}')
+                REGIONS.set_serial_port(selected)
+                return selected
+            else:
+                log('[WARN] 编号超出范围')
+        except ValueError:
+            log('[WARN] 请输入有效数字或直接回车')
 
 class MouseActions:
-    def __init__(self):
+    def __init__(self, port: Optional[str] = None):
+        # 断线重连时沿用同一串口，不再提示选择
+        self.port = port
         self.ser = None
+        self.link = None
+        self.protocol = 1
+        # 首次交换完成的时刻，用于统计启动到首次交换的用时
+        self.first_move_at: Optional[float] = None
         self._open_serial()
 
-    def _open_serial(self):
-        # 列出端口供选择
-        ports = list(list_ports.comports())
-        if not ports:
-            print('[WARN] 未发现任何串口设备，无法使用Arduino移动')
-            self.ser = None
+    def _negotiate(self):
+        """探测固件协议：v2 固件回复版本后同步一次光标坐标，旧固件无回复则退回 v1。"""
+        self.protocol = 1
+        if self.link:
+            self.link.close()
+            self.link = None
+        if CONFIG.serial_protocol < 2:
             return
-        print('[INFO] 可用串口列表:')
-        for idx, p in enumerate(ports, start=1):
-            print(f'  {idx}. {p.device} - {p.description}')
-        selected = None
-        while True:
-            inp = input(f'请选择串口编号(1-{len(ports)})，或直接回车使用已有配置: ').strip()
-            if inp == '' and REGIONS.serial_port:
-                selected = REGIONS.serial_port
-                print(f'[STEP] 使用已保存串口 {selected}')
-                break
+        import pyautogui
+        link = SerialLink(self.ser, CONFIG.serial_max_inflight)
+        if not link.handshake(CONFIG.serial_ack_timeout):
+            link.close()
+            log('[INFO] 固件未响应 v2 握手，使用旧版逐条命令协议')
+            return
+        x, y = pyautogui.position()
+        if link.call('P', x, y, timeout=CONFIG.serial_ack_timeout) is None:
+            link.close()
+            log('[WARN] 光标同步失败，使用旧版逐条命令协议')
+            return
+        self.link = link
+        self.protocol = 2
+        log(f'[STEP] 固件协议 v2，光标同步到 ({x},{y})')
+
+    def _close_serial(self):
+        if self.link:
+            self.link.close()
+            self.link = None
+        if self.ser is not None:
+            # 重连前必须先关闭旧句柄，否则 Windows 上再次打开同一 COM 口会被拒绝访问
             try:
-                num = int(inp)
-                if 1 <= num <= len(ports):
-                    selected = ports[num-1].device
-                    print(f'[STEP] 选择串口 {selected}')
-                    REGIONS.set_serial_port(selected)
-                    break
-                else:
-                    print('[WARN] 编号超出范围')
-            except ValueError:
-                print('[WARN] 请输入有效数字或直接回车')
+                self.ser.close()
+            except Exception:
+                pass
+            self.ser = None
+
+    def _open_serial(self):
+        self._close_serial()
+        self.protocol = 1
+        selected = self.port
         if not selected:
-            print('[WARN] 未选择串口，使用本机点击备用方案')
+            log('[WARN] 未选择串口，使用本机点击备用方案')
             self.ser = None
             return
         try:
             self.ser = serial.Serial(selected, CONFIG.serial_baud, timeout=0.1)
             time.sleep(0.5)
-            print(f"[STEP] 已连接 Arduino 串口 {selected} @ {CONFIG.serial_baud}")
+            log(f"[STEP] 已连接 Arduino 串口 {selected} @ {CONFIG.serial_baud}")
         except SerialException as e:
-            print(f"[WARN] 串口 {selected} 打开失败: {e}")
+            log(f"[WARN] 串口 {selected} 打开失败: {e}")
             self.ser = None
+            return
+        self._negotiate()
 
     def _arduino_click(self):
         if self.ser and self.ser.is_open:
@@ -59,20 +113,18 @@ class MouseActions:
                 self.ser.flush()
                 return True
             except SerialException as e:
-                print(f"[WARN] 串口写入失败: {e}，尝试重连")
-                try:
-                    self.ser.close()
-                except Exception:
-                    pass
+                log(f"[WARN] 串口写入失败: {e}，尝试重连")
                 self._open_serial()
         return False
 
     def _pc_click(self):
+        import pyautogui
         pyautogui.click()
 
     def _arduino_move_to(self, x_target: int, y_target: int) -> bool:
         # 使用相对移动，将当前坐标与目标坐标的差值通过串口发送
         if self.ser and self.ser.is_open:
+            import pyautogui
             try:
                 curx, cury = pyautogui.position()
                 dx = int(x_target - curx)
@@ -82,49 +134,218 @@ class MouseActions:
                 self.ser.flush()
                 return True
             except SerialException as e:
-                print(f"[WARN] 串口移动失败: {e}")
+                log(f"[WARN] 串口移动失败: {e}")
         return False
 
-    def swap_tiles(self, a, b):
-        if not REGIONS.board_ready():
-            print('[ERROR] 尚未设置棋盘区域')
-            return
-        (r1,c1),(r2,c2) = a,b
-        left, top, right, bottom = REGIONS.board_region
+    def _tile_point(self, r: int, c: int, regions=REGIONS, recognizer=BOARD_RECOGNIZER):
+        left, top, right, bottom = regions.board_region
         tile_w = (right - left)/CONFIG.cols
         tile_h = (bottom - top)/CONFIG.rows
         # 使用检测阶段记录的中心偏移 (crx, cry)
-        if BOARD_RECOGNIZER.center_ratios is not None:
-            crx1, cry1 = BOARD_RECOGNIZER.center_ratios[r1, c1]
-            crx2, cry2 = BOARD_RECOGNIZER.center_ratios[r2, c2]
+        if recognizer.center_ratios is not None:
+            crx, cry = recognizer.center_ratios[r, c]
+        else:
+            crx = cry = 0.5
+        return int(left + c*tile_w + crx*tile_w), int(top + r*tile_h + cry*tile_h)
+
+    def resync_cursor(self):
+        """按系统光标位置重新同步固件记录的坐标；指针加速或用户动过鼠标后固件坐标会偏离。"""
+        if self.protocol < 2 or not self.link:
+            return
+        import pyautogui
+        x, y = pyautogui.position()
+        try:
+            ok = self.link.call('P', x, y, timeout=CONFIG.serial_ack_timeout) is not None
+        except SerialException:
+            ok = False
+        if ok:
+            log(f'[STEP] 光标重新同步到 ({x},{y})')
         else:
-            crx1 = cry1 = crx2 = cry2 = 0.5
-        x1 = int(left + c1*tile_w + crx1*tile_w)
-        y1 = int(top + r1*tile_h + cry1*tile_h)
-        x2 = int(left + c2*tile_w + crx2*tile_w)
-        y2 = int(top + r2*tile_h + cry2*tile_h)
-        print(f'[STEP] 移动到 ({r1},{c1}) -> 屏幕({x1},{y1}) 并点击')
+            log('[WARN] 光标重新同步失败')
+
+    def _swap_v2(self, p1, p2) -> Optional[bool]:
+        """v2 协议：一条命令完成两次移动与点击，等待固件回执。
+
+        返回 True 成功，False 命令未写出（可安全重试），None 已写出但未收到回执（固件可能已执行）。
+        """
+        try:
+            cid = self.link.send('S', *p1, *p2, CONFIG.swap_click_interval * 1000)
+        except SerialException as e:
+            log(f"[WARN] 串口写入失败: {e}")
+            return False
+        if self.link.wait(cid, CONFIG.serial_ack_timeout + CONFIG.swap_click_interval) is None:
+            log('[WARN] 交换命令未收到回执')
+            METRICS.incr('serial_ack_timeouts')
+            return None
+        return True
+
+    def _grab_tile(self, r: int, c: int, regions=REGIONS):
+        left, top, right, bottom = regions.board_region
+        tile_w = (right - left)/CONFIG.cols
+        tile_h = (bottom - top)/CONFIG.rows
+        region = (int(left + c*tile_w), int(top + r*tile_h), int(left + (c+1)*tile_w), int(top + (r+1)*tile_h))
+        return CAPTURE.grab_region(region, 'other')
+
+    def _swap_v2_probe(self, p1, p2, cell, regions=REGIONS) -> Optional[bool]:
+        """v2 协议下拆成 A/C 命令执行交换，第一次点击后测量选中延迟；返回值含义同 _swap_v2。"""
+        t = CONFIG.serial_ack_timeout
+        try:
+            if self.link.call('A', *p1, timeout=t) is None:
+                return False
+        except SerialException as e:
+            log(f"[WARN] 串口写入失败: {e}")
+            return False
+        # 第一次点击已发出后，任何失败都无法确定格子是否已选中/已交换
+        try:
+            TUNER.probe_select(lambda: self._grab_tile(*cell, regions), lambda: self.link.call('C', timeout=t),
+                               CONFIG.swap_click_interval)
+            if self.link.call('A', *p2, timeout=t) is not None and self.link.call('C', timeout=t) is not None:
+                return True
+        except SerialException as e:
+            log(f"[WARN] 串口写入失败: {e}")
+        return None
+
+    def swap_tiles(self, a, b, regions=REGIONS, recognizer=BOARD_RECOGNIZER):
+        """交换两个格子；regions/recognizer 缺省为全局棋盘，多棋盘模式下传入对应棋盘的实例。"""
+        if not regions.board_ready():
+            log('[ERROR] 尚未设置棋盘区域')
+            return
+        (r1,c1),(r2,c2) = a,b
+        x1, y1 = self._tile_point(r1, c1, regions, recognizer)
+        x2, y2 = self._tile_point(r2, c2, regions, recognizer)
+        probe = TUNER.want_probe()
+        if self.protocol >= 2 and self.link:
+            log(f'[STEP] 交换 ({r1},{c1})->屏幕({x1},{y1}) 与 ({r2},{c2})->屏幕({x2},{y2})')
+            if probe:
+                done = self._swap_v2_probe((x1, y1), (x2, y2), (r1, c1), regions)
+            else:
+                done = self._swap_v2((x1, y1), (x2, y2))
+            if done:
+                return
+            if done is None:
+                # 固件可能已执行过交换，重放会把格子换回去；只重连，结果交给下一次识别判断
+                log('[WARN] v2 交换结果未知，重连串口，不重放本次交换')
+                self._open_serial()
+                return
+            log('[WARN] v2 交换失败，重连后改用逐条命令')
+            self._open_serial()
+        log(f'[STEP] 移动到 ({r1},{c1}) -> 屏幕({x1},{y1}) 并点击')
         moved = self._arduino_move_to(x1, y1)
         if not moved:
-            print('[WARN] 串口移动失败，尝试重连后重试一次')
+            log('[WARN] 串口移动失败，尝试重连后重试一次')
             self._open_serial()
             time.sleep(0.1)
             if not self._arduino_move_to(x1, y1):
-                print('[ERROR] 无法移动到第一个格子，放弃本次交换')
+                log('[ERROR] 无法移动到第一个格子，放弃本次交换')
                 return
-        if not self._arduino_click():
-            self._pc_click()
-        time.sleep(CONFIG.swap_click_interval)
-        print(f'[STEP] 移动到 ({r2},{c2}) -> 屏幕({x2},{y2}) 并点击')
+        def click():
+            if not self._arduino_click():
+                self._pc_click()
+        if probe:
+            TUNER.probe_select(lambda: self._grab_tile(r1, c1, regions), click, CONFIG.swap_click_interval)
+        else:
+            click()
+            time.sleep(CONFIG.swap_click_interval)
+        log(f'[STEP] 移动到 ({r2},{c2}) -> 屏幕({x2},{y2}) 并点击')
         moved2 = self._arduino_move_to(x2, y2)
         if not moved2:
-            print('[WARN] 串口移动失败，尝试重连后重试一次')
+            log('[WARN] 串口移动失败，尝试重连后重试一次')
             self._open_serial()
             time.sleep(0.1)
             if not self._arduino_move_to(x2, y2):
-                print('[ERROR] 无法移动到第二个格子，放弃本次交换')
+                log('[ERROR] 无法移动到第二个格子，放弃本次交换')
                 return
         if not self._arduino_click():
             self._pc_click()
 
-ACTIONS = MouseActions()
+    def _swap_batch_v2(self, moves, regions=REGIONS, recognizer=BOARD_RECOGNIZER):
+        """v2 协议：先同步光标，再把整批 S 命令连续写出（在途数受 serial_max_inflight 限制），最后统一等待回执。
+
+        批内间隔 plan_swap_gap 由固件在下一条 S 开始前等待；需要测量选中延迟的那一步先等前面的回执，再单独执行。
+        返回需要重连后逐条重试的交换（命令未写出）；结果未知时已重连，返回 None，不重放。
+        """
+        import pyautogui
+        timeout = CONFIG.serial_ack_timeout + CONFIG.swap_click_interval + CONFIG.plan_swap_gap
+        pending = []
+
+        def settle() -> bool:
+            # 固件按顺序执行，逐个等待即可；不短路，确保每个 id 都被取走
+            return all([self.link.wait(cid, timeout) is not None for cid in pending])
+
+        def unknown():
+            log('[WARN] v2 交换未收到回执，结果未知，重连串口，不重放本批交换')
+            METRICS.incr('serial_ack_timeouts')
+            self._open_serial()
+
+        try:
+            pending.append(self.link.send('P', *pyautogui.position()))
+        except SerialException as e:
+            log(f"[WARN] 串口写入失败: {e}")
+            return list(moves)
+        for i, (a, b) in enumerate(moves):
+            p1 = self._tile_point(*a, regions, recognizer)
+            p2 = self._tile_point(*b, regions, recognizer)
+            log(f'[STEP] 交换 {tuple(a)}->屏幕{p1} 与 {tuple(b)}->屏幕{p2}')
+            probe = TUNER.want_probe()
+            if probe:
+                if not settle():
+                    unknown()
+                    return None
+                pending = []
+                if i:
+                    time.sleep(CONFIG.plan_swap_gap)
+                done = self._swap_v2_probe(p1, p2, a, regions)
+                if done is None:
+                    unknown()
+                    return None
+                if not done:
+                    return list(moves[i:])
+                continue
+            wait_ms = CONFIG.plan_swap_gap * 1000 if i else 0
+            try:
+                pending.append(self.link.send('S', *p1, *p2, CONFIG.swap_click_interval * 1000, wait_ms))
+            except SerialException as e:
+                log(f"[WARN] 串口写入失败: {e}")
+                if not settle():
+                    unknown()
+                    return None
+                return list(moves[i:])
+        if not settle():
+            unknown()
+            return None
+        return []
+
+    def swap_batch(self, moves, regions=REGIONS, recognizer=BOARD_RECOGNIZER):
+        """执行一批互不干扰的交换，两次交换之间间隔 plan_swap_gap；v2 协议下整批流水写出，见 _swap_batch_v2。"""
+        rest = moves
+        if self.protocol >= 2 and self.link and regions.board_ready():
+            rest = self._swap_batch_v2(moves, regions, recognizer) or []
+            if rest:
+                log('[WARN] v2 交换失败，重连后逐条执行剩余交换')
+                self._open_serial()
+        for i, (a, b) in enumerate(rest):
+            if i:
+                time.sleep(CONFIG.plan_swap_gap)
+            self.swap_tiles(a, b, regions, recognizer)
+        if self.first_move_at is None:
+            self.first_move_at = time.perf_counter()
+            METRICS.observe('time_to_first_move', self.first_move_at - METRICS.started)
+            log(f'[INFO] 启动到首次交换用时 {self.first_move_at - METRICS.started:.2f}s')
+
+def _make_actions(port: Optional[str] = None):
+    return METRICS.instrument(MouseActions(port), 'swap_tiles', 'swap_batch')
+
+# 首次交换时才选择并打开串口；connect_async 可提前在后台完成
+ACTIONS = Lazy(lambda: _make_actions(select_port()))
+
+def connect_async(port: Optional[str] = None, interactive: bool = True) -> threading.Thread:
+    """在当前线程选好串口（交互式提示不能放到后台），再在后台线程打开串口并握手。
+
+    打开后的等待与握手和模板加载等启动工作并行；后台未完成时访问 ACTIONS 会等待其完成。
+    """
+    if port is None:
+        port = select_port(interactive)
+    ACTIONS._lazy_bind(lambda: _make_actions(port))
+    thread = threading.Thread(target=ACTIONS._lazy_get, name='serial-connect', daemon=True)
+    thread.start()
+    return thread
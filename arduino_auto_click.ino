@@ -1,58 +1,138 @@
-// Arduino HID 鼠标控制：支持点击与相对移动
+// Arduino HID 鼠标控制：支持点击、相对/绝对移动与单条交换命令（协议 v2）
 #include <Mouse.h>
 
+// 固件内记录的光标绝对坐标，由主机用 "P" 命令同步
+long cur_x = 0;
+long cur_y = 0;
+
 void setup() {
   Serial.begin(115200);
   Mouse.begin();
   delay(1000);
 }
 
+void clickLeft() {
+  Mouse.press(MOUSE_LEFT);
+  delay(random(5, 11));
+  Mouse.release(MOUSE_LEFT);
+}
+
+// 逐像素/小批次相对移动，避免加速度导致偏差
+void moveRelative(long dx, long dy) {
+  int sx = (dx > 0) ? 1 : -1;
+  int sy = (dy > 0) ? 1 : -1;
+  long ax = abs(dx);
+  long ay = abs(dy);
+  long i = 0, j = 0;
+  // 若距离较大，使用批次加速：每次移动最多 batch_step 像素
+  const int batch_step = 5; // 可调：1=最精确, >1更快但可能受加速度影响
+  while (i < ax || j < ay) {
+    int mx = 0;
+    int my = 0;
+    if (i < ax) {
+      long remainx = ax - i;
+      mx = sx * (remainx >= batch_step ? batch_step : (int)remainx);
+      i += (remainx >= batch_step ? batch_step : remainx);
+    }
+    if (j < ay) {
+      long remainy = ay - j;
+      my = sy * (remainy >= batch_step ? batch_step : (int)remainy);
+      j += (remainy >= batch_step ? batch_step : remainy);
+    }
+    Mouse.move(mx, my, 0);
+    // 小延时保证系统处理，避免合并为大加速度
+    delay(1);
+  }
+  cur_x += dx;
+  cur_y += dy;
+}
+
+void moveAbsolute(long x, long y) {
+  moveRelative(x - cur_x, y - cur_y);
+}
+
+// 解析命令字符后以空格分隔的整数参数，返回个数
+int parseArgs(String line, long *out, int max_n) {
+  int n = 0;
+  int pos = line.indexOf(' ');
+  while (pos > 0 && n < max_n) {
+    int next = line.indexOf(' ', pos + 1);
+    String part = (next > 0) ? line.substring(pos + 1, next) : line.substring(pos + 1);
+    out[n++] = part.toInt();
+    pos = next;
+  }
+  return n;
+}
+
+void reply(char kind, long id, const char *info) {
+  Serial.print(kind);
+  Serial.print(' ');
+  Serial.print(id);
+  if (info && info[0]) {
+    Serial.print(' ');
+    Serial.print(info);
+  }
+  Serial.print('\n');
+}
+
 // 处理一行命令：
-//  - "c"            -> 左键点击
-//  - "M dx dy"      -> 相对移动 dx,dy （整数，单位像素）
+//  旧版（不回复）：
+//  - "c"                         -> 左键点击
+//  - "M dx dy"                   -> 相对移动 dx,dy （整数，单位像素）
+//  v2（id 为主机序号，成功回复 "K id"，参数错误回复 "E id bad"）：
+//  - "V id"                      -> 回复 "K id V2"
+//  - "P id x y"                  -> 同步当前光标绝对坐标
+//  - "A id x y"                  -> 移动到绝对坐标
+//  - "C id"                      -> 左键点击
+//  - "S id x1 y1 x2 y2 gap_ms [wait_ms]"
+//                                -> 先等待 wait_ms（可省略），移到 (x1,y1) 点击，等待 gap_ms，移到 (x2,y2) 点击
 void handleCommand(String line) {
   line.trim();
   if (line.length() == 0) return;
-  if (line.charAt(0) == 'c') {
-    Mouse.press(MOUSE_LEFT);
-    delay(random(5, 11));
-    Mouse.release(MOUSE_LEFT);
+  char cmd = line.charAt(0);
+  long a[7];
+  int n = parseArgs(line, a, 7);
+  if (cmd == 'c') {
+    clickLeft();
     return;
   }
-  if (line.charAt(0) == 'M') {
-    int sp1 = line.indexOf(' ');
-    int sp2 = line.indexOf(' ', sp1 + 1);
-    if (sp1 > 0 && sp2 > sp1) {
-      long dx = line.substring(sp1 + 1, sp2).toInt();
-      long dy = line.substring(sp2 + 1).toInt();
-      // 逐像素/小批次移动，避免加速度导致偏差
-      int sx = (dx > 0) ? 1 : -1;
-      int sy = (dy > 0) ? 1 : -1;
-      long ax = abs(dx);
-      long ay = abs(dy);
-      long i = 0, j = 0;
-      // 若距离较大，使用批次加速：每次移动最多 batch_step 像素
-      const int batch_step = 5; // 可调：1=最精确, >1更快但可能受加速度影响
-      while (i < ax || j < ay) {
-        int mx = 0;
-        int my = 0;
-        if (i < ax) {
-          long remainx = ax - i;
-          mx = sx * (remainx >= batch_step ? batch_step : (int)remainx);
-          i += (remainx >= batch_step ? batch_step : remainx);
-        }
-        if (j < ay) {
-          long remainy = ay - j;
-          my = sy * (remainy >= batch_step ? batch_step : (int)remainy);
-          j += (remainy >= batch_step ? batch_step : remainy);
-        }
-        Mouse.move(mx, my, 0);
-        // 小延时保证系统处理，避免合并为大加速度
-        delay(1);
-      }
-    }
+  if (cmd == 'M') {
+    if (n >= 2) moveRelative(a[0], a[1]);
     return;
   }
+  if (n < 1) return;
+  long id = a[0];
+  switch (cmd) {
+    case 'V':
+      reply('K', id, "V2");
+      return;
+    case 'P':
+      if (n < 3) break;
+      cur_x = a[1];
+      cur_y = a[2];
+      reply('K', id, "");
+      return;
+    case 'A':
+      if (n < 3) break;
+      moveAbsolute(a[1], a[2]);
+      reply('K', id, "");
+      return;
+    case 'C':
+      clickLeft();
+      reply('K', id, "");
+      return;
+    case 'S':
+      if (n < 6) break;
+      if (n >= 7) delay(a[6]);
+      moveAbsolute(a[1], a[2]);
+      clickLeft();
+      delay(a[5]);
+      moveAbsolute(a[3], a[4]);
+      clickLeft();
+      reply('K', id, "");
+      return;
+  }
+  reply('E', id, "bad");
 }
 
 void loop() {
@@ -0,0 +1,259 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+import cv2
+import numpy as np
+from capture import CaptureSource
+
+# 每个测量项至少运行的次数与时长（秒），取两者中先满足较晚的一个
+MIN_RUNS = 20
+MIN_SECONDS = 0.5
+# 比较模式：中位耗时变慢超过该比例、准确率下降超过该值视为退化
+REGRESSION_RATIO = 0.25
+ACCURACY_DROP = 0.01
+COLORS = ['R', 'Y', 'P', 'B', 'G', 'O']
+
+def _measure(fn: Callable[[int], object], count: int, setup: Optional[Callable[[int], object]] = None,
+             min_runs: int = MIN_RUNS, min_seconds: float = MIN_SECONDS) -> Dict[str, float]:
+    """循环调用 fn(i)（i 在 [0, count) 内轮转）并统计单次耗时（微秒）。
+
+    先调用一次预热；setup(i) 在每次计时前调用，不计入耗时。
+    """
+    if setup:
+        setup(0)
+    fn(0)
+    samples: List[float] = []
+    start = time.perf_counter()
+    i = 0
+    while len(samples) < min_runs or time.perf_counter() - start < min_seconds:
+        if setup:
+            setup(i % count)
+        t = time.perf_counter()
+        fn(i % count)
+        samples.append(time.perf_counter() - t)
+        i += 1
+    us = np.asarray(samples) * 1e6
+    return {
+        'n': len(samples),
+        'mean_us': round(float(us.mean()), 2),
+        'p50_us': round(float(np.percentile(us, 50)), 2),
+        'p95_us': round(float(np.percentile(us, 95)), 2),
+    }
+
+def random_boards(size: int, count: int, colors: int, seed: int) -> List[np.ndarray]:
+    """按种子生成无现成三连的随机棋盘（名称数组），与游戏稳定后的局面一致。"""
+    rng = np.random.default_rng(seed)
+    boards = []
+    for _ in range(count):
+        board = np.empty((size, size), dtype='<U7')
+        for r in range(size):
+            for c in range(size):
+                banned = set()
+                if c >= 2 and board[r, c - 1] == board[r, c - 2]:
+                    banned.add(board[r, c - 1])
+                if r >= 2 and board[r - 1, c] == board[r - 2, c]:
+                    banned.add(board[r - 1, c])
+                board[r, c] = rng.choice([n for n in COLORS[:colors] if n not in banned])
+        boards.append(board)
+    return boards
+
+def bench_recognition(backend: str, tile: int, per_class: int, boards: int, seed: int) -> Dict[str, dict]:
+    """单格与整盘识别：格子样本由 templates/*.png 加噪声、缩放裁剪、亮度扰动生成。"""
+    from config import CONFIG
+    from color_classifier import make_jittered_corpus
+    from detection import BoardRecognizer, build_tile_grid
+    from templates import TEMPLATES
+    CONFIG.classifier_backend = backend
+    TEMPLATES.classifier = None
+    TEMPLATES.load_templates((tile, tile))
+    if len(TEMPLATES.names) < 2:
+        raise RuntimeError('templates/ 中模板不足，无法生成识别样本')
+    stack, labels = make_jittered_corpus(TEMPLATES.templates, per_class, tile, seed=seed)
+    names = np.array(labels)
+    results = {}
+
+    stats = _measure(lambda i: TEMPLATES.match_tile(stack[i]), len(stack))
+    stats['accuracy'] = round(float((np.array([TEMPLATES.match_tile(t)[0] for t in stack]) == names).mean()), 4)
+    results[f'recognition.tile.{backend}'] = stats
+
+    # 从样本中随机拼出整盘图像
+    rng = np.random.default_rng(seed)
+    rows, cols = CONFIG.rows, CONFIG.cols
+    picks = [rng.integers(0, len(stack), rows * cols) for _ in range(boards)]
+    imgs = [stack[p].reshape(rows, cols, tile, tile, 3).transpose(0, 2, 1, 3, 4).reshape(rows * tile, cols * tile, 3)
+            for p in picks]
+    truths = [names[p].reshape(rows, cols) for p in picks]
+    grid = build_tile_grid(cols * tile, rows * tile, rows, cols)
+    stats = _measure(lambda i: TEMPLATES.match_tiles(imgs[i], grid), boards)
+    stats['accuracy'] = round(float(np.mean([(TEMPLATES.match_tiles(img, grid)[0] == t).mean()
+                                             for img, t in zip(imgs, truths)])), 4)
+    results[f'recognition.board.{backend}'] = stats
+
+    # 增量识别：上一帧为同一棋盘，本帧有一行格子变化（典型的一次消除）
+    recognizer = BoardRecognizer()
+    changed = [img.copy() for img in imgs]
+    for i, img in enumerate(changed):
+        img[:tile] = imgs[(i + 1) % boards][:tile]
+
+    results[f'recognition.incremental.{backend}'] = _measure(
+        lambda i: recognizer._classify(changed[i], grid), boards, setup=lambda i: recognizer._classify(imgs[i], grid))
+    return results
+
+def bench_solver(engines: Sequence[str], sizes: Sequence[int], count: int, seed: int) -> Dict[str, dict]:
+    """求解引擎在按种子生成的各尺寸随机棋盘上的单次求解耗时。"""
+    from solver import make_solver
+    results = {}
+    for size in sizes:
+        boards = random_boards(size, count, 4, seed + size)
+        for engine in engines:
+            solver = make_solver(engine)
+            results[f'solver.{engine}.{size}x{size}'] = _measure(lambda i: solver.find_best_move(boards[i]), count)
+    return results
+
+class _FrameSource(CaptureSource):
+    """轮流返回预先生成的“屏幕”帧，供稳定检测基准使用。"""
+
+    def __init__(self, frames: List[np.ndarray]):
+        self.frames = frames
+        self.i = 0
+
+    def next(self):
+        self.i = (self.i + 1) % len(self.frames)
+
+    def grab_region(self, region, kind: str = 'other'):
+        left, top, right, bottom = region
+        return self.frames[self.i][top:bottom, left:right]
+
+    def grab_regions(self, regions):
+        return {kind: self.grab_region(region, kind) for kind, region in regions.items()}
+
+def bench_stability(tile: int, frames: int, seed: int) -> Dict[str, dict]:
+    """稳定检测每帧的计算开销（截图为内存中的帧，不含真实截屏耗时）。"""
+    from config import CONFIG
+    import detection
+    rows, cols = CONFIG.rows, CONFIG.cols
+    rng = np.random.default_rng(seed)
+    w, h = cols * tile, rows * tile
+    score = (0, h + 15, min(w, 200), h + 65)
+    screens = [rng.integers(0, 256, (score[3], w, 4), dtype=np.uint8) for _ in range(frames)]
+    source = _FrameSource(screens)
+    # 截图会话与区域都是延迟创建的，在首次使用前替换为内存帧与固定区域
+    detection.CAPTURE._lazy_bind(lambda: source)
+    detection.REGIONS.board_region = (0, 0, w, h)
+    detection.REGIONS.score_region = score
+    results = {}
+
+    detector = detection.StabilityDetector()
+
+    def event(i: int):
+        source.next()
+        fp = detector._fingerprint()
+        if detector._count:
+            detector._window_diff(fp)
+        detector._push(fp)
+
+    results['stability.event'] = _measure(event, frames)
+
+    crops = [s[score[1]:score[3], score[0]:score[2]] for s in screens]
+    avg_diff = detection.ScoreStabilityChecker.avg_diff
+    results['stability.score'] = _measure(lambda i: avg_diff(crops[i], crops[i - 1]), frames)
+
+    # 分数读取：数字模板与分数都用同一字体渲染，样本为按种子生成的 1~7 位分数
+    from score_reader import ScoreReader
+    reader = ScoreReader()
+    digits = np.zeros((50, 260, 3), dtype=np.uint8)
+    cv2.putText(digits, '0123456789', (8, 38), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+    reader.add_digits(digits, '0123456789')
+    values = [int(rng.integers(0, 10 ** int(rng.integers(1, 8)))) for _ in range(frames)]
+    imgs = []
+    for v in values:
+        img = np.zeros((50, 200, 4), dtype=np.uint8)
+        cv2.putText(img, str(v), (8, 38), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255, 255), 2)
+        imgs.append(img)
+    stats = _measure(lambda i: reader.read(imgs[i]), frames)
+    stats['accuracy'] = round(float(np.mean([reader.read(img) == v for img, v in zip(imgs, values)])), 4)
+    results['stability.score_read'] = stats
+    return results
+
+def compare(current: dict, baseline: dict, ratio: float = REGRESSION_RATIO) -> List[str]:
+    """逐项比较中位耗时与准确率，打印对比表并返回退化项名称。"""
+    regressions = []
+    cur, base = current['results'], baseline['results']
+    print(f"{'测量项':40s} {'基准p50(us)':>12s} {'当前p50(us)':>12s} {'变化':>8s}")
+    for name in sorted(cur):
+        if name not in base:
+            print(f'{name:40s} {"(基准中无)":>12s}')
+            continue
+        b, c = base[name]['p50_us'], cur[name]['p50_us']
+        change = (c - b) / b if b > 0 else 0.0
+        flags = []
+        if change > ratio:
+            flags.append('变慢')
+        if 'accuracy' in base[name] and cur[name].get('accuracy', 0.0) < base[name]['accuracy'] - ACCURACY_DROP:
+            flags.append(f"准确率 {base[name]['accuracy']:.4f}->{cur[name]['accuracy']:.4f}")
+        if flags:
+            regressions.append(name)
+        print(f"{name:40s} {b:12.1f} {c:12.1f} {change:+8.1%} {' '.join(flags)}")
+    return regressions
+
+def run(args) -> dict:
+    from config import CONFIG
+    CONFIG.console_log = False
+    results: Dict[str, dict] = {}
+    suites = args.suites.split(',')
+    if 'recognition' in suites:
+        for backend in args.backends.split(','):
+            results.update(bench_recognition(backend, args.tile, args.per_class, args.boards, args.seed))
+    if 'solver' in suites:
+        results.update(bench_solver(args.engines.split(','), [int(s) for s in args.sizes.split(',')],
+                                    args.boards, args.seed))
+    if 'stability' in suites:
+        results.update(bench_stability(args.tile, args.boards, args.seed))
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'args': vars(args),
+        },
+        'results': results,
+    }
+
+def main():
+    from config import CONFIG
+    parser = argparse.ArgumentParser(description='离线基准：识别、求解与稳定检测的单次耗时')
+    parser.add_argument('--suites', default='recognition,solver,stability', help='逗号分隔: recognition,solver,stability')
+    parser.add_argument('--backends', default=CONFIG.classifier_backend, help='逗号分隔: template,color')
+    parser.add_argument('--engines', default='python,bitboard,lookahead,vector', help='逗号分隔的求解引擎')
+    parser.add_argument('--sizes', default='6,8,16', help='求解基准的棋盘边长，逗号分隔')
+    parser.add_argument('--tile', type=int, default=64, help='格子边长（像素）')
+    parser.add_argument('--per-class', type=int, default=50, help='每种色块的识别样本数')
+    parser.add_argument('--boards', type=int, default=20, help='整盘识别/求解/稳定检测的样本数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench.json', help='结果 JSON 文件')
+    parser.add_argument('--compare', help='基准结果 JSON：与之比较并在退化时以状态码 1 退出')
+    parser.add_argument('--ratio', type=float, default=REGRESSION_RATIO, help='中位耗时变慢超过该比例视为退化')
+    args = parser.parse_args()
+    report = run(args)
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f'[STEP] 结果已写入 {args.out}（{len(report["results"])} 项）')
+    if not args.compare:
+        for name, stats in report['results'].items():
+            acc = f" 准确率={stats['accuracy']:.4f}" if 'accuracy' in stats else ''
+            print(f"{name:40s} p50={stats['p50_us']:10.1f}us p95={stats['p95_us']:10.1f}us n={stats['n']}{acc}")
+        return
+    baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+    regressions = compare(report, baseline, args.ratio)
+    if regressions:
+        print(f'[WARN] {len(regressions)} 项退化: {", ".join(regressions)}')
+        sys.exit(1)
+    print('[STEP] 无退化')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import abc
+import atexit
+import mmap
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from metrics import log
+
+# 录制文件格式：文件头 MAGIC，随后若干条记录，每条为
+#   RECORD_HEAD(时间戳, 类型, left, top, right, bottom, 高, 宽, 通道) + 像素字节(连续 uint8)
+MAGIC = b'XXLREC01'
+RECORD_HEAD = struct.Struct('<dB4iHHB')
+KINDS = {'board': 0, 'score': 1, 'other': 2}
+GROW_BYTES = 64 * 1024 * 1024
+
+class CaptureSource(abc.ABC):
+    """截图来源接口：grab_region 返回 (h, w, C) 的 BGR/BGRA 图像（可能是只读视图），失败返回 None。
+
+    使用方只读前三个通道；需要连续内存或修改像素时自行拷贝。
+    """
+
+    @abc.abstractmethod
+    def grab_region(self, region, kind: str = 'other') -> Optional[np.ndarray]:
+        ...
+
+    def grab_regions(self, regions: Dict[str, Tuple[int,int,int,int]]) -> Optional[Dict[str, np.ndarray]]:
+        """同一时刻截取多个区域 {kind: region}；任一失败返回 None。默认逐个截取。"""
+        out = {}
+        for kind, region in regions.items():
+            img = self.grab_region(region, kind)
+            if img is None:
+                return None
+            out[kind] = img
+        return out
+
+    def screen_region(self) -> Optional[Tuple[int,int,int,int]]:
+        """整个屏幕（所有显示器的外接矩形）的区域，供自动定位全屏搜索；不支持时返回 None。"""
+        return None
+
+    def close(self):
+        pass
+
+# 多区域合并截图时，外接矩形面积超过各区域面积之和的该倍数则改为分别截取
+UNION_MAX_RATIO = 2.0
+
+class ScreenCapture(CaptureSource):
+    """实时屏幕截图（mss）。
+
+    返回直接建立在 mss 截图缓冲上的 BGRA 视图，不做拷贝也不去 alpha；
+    grab_regions 只截一次多个区域的外接矩形，再切出各区域视图。
+    mss 句柄不能跨线程使用，每个线程第一次截图时各自创建一个。
+    """
+
+    def __init__(self):
+        import mss
+        self._mss = mss.mss
+        self._local = threading.local()
+        self._monitors: Dict[Tuple[int,int,int,int], Dict[str, int]] = {}
+        # {((kind, region), ...): (外接矩形, {kind: (y1, y2, x1, x2)})}，区域变化时才重算
+        self._plans: Dict[tuple, Optional[tuple]] = {}
+
+    @property
+    def sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = self._mss()
+        return sct
+
+    def _grab(self, region: Tuple[int,int,int,int]) -> np.ndarray:
+        monitor = self._monitors.get(region)
+        if monitor is None:
+            left, top, right, bottom = region
+            monitor = self._monitors[region] = {
+                'left': int(left),
+                'top': int(top),
+                'width': int(right - left),
+                'height': int(bottom - top)
+            }
+        shot = self.sct.grab(monitor)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def grab_region(self, region, kind: str = 'other'):
+        if not region:
+            return None
+        return self._grab(tuple(region))
+
+    def screen_region(self):
+        m = self.sct.monitors[0]
+        return m['left'], m['top'], m['left'] + m['width'], m['top'] + m['height']
+
+    def _plan(self, key: tuple) -> Optional[tuple]:
+        regions = [r for _, r in key]
+        left = min(r[0] for r in regions)
+        top = min(r[1] for r in regions)
+        right = max(r[2] for r in regions)
+        bottom = max(r[3] for r in regions)
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+        if (right - left) * (bottom - top) > area * UNION_MAX_RATIO:
+            return None
+        slices = {kind: (r[1] - top, r[3] - top, r[0] - left, r[2] - left) for kind, r in key}
+        return (left, top, right, bottom), slices
+
+    def grab_regions(self, regions):
+        if not all(regions.values()):
+            return None
+        key = tuple((kind, tuple(r)) for kind, r in regions.items())
+        if key not in self._plans:
+            self._plans[key] = self._plan(key)
+        plan = self._plans[key]
+        if plan is None:
+            return super().grab_regions(regions)
+        union, slices = plan
+        img = self._grab(union)
+        return {kind: img[y1:y2, x1:x2] for kind, (y1, y2, x1, x2) in slices.items()}
+
+class LockedCapture(CaptureSource):
+    """包装另一个来源，多个线程共用同一截图会话（多棋盘模式）时串行化访问。"""
+
+    def __init__(self, source: CaptureSource):
+        self.source = source
+        self.lock = threading.Lock()
+
+    def grab_region(self, region, kind: str = 'other'):
+        with self.lock:
+            return self.source.grab_region(region, kind)
+
+    def grab_regions(self, regions):
+        with self.lock:
+            return self.source.grab_regions(regions)
+
+    def screen_region(self):
+        return self.source.screen_region()
+
+    def close(self):
+        self.source.close()
+
+class RecordingCapture(CaptureSource):
+    """包装另一个来源，把每帧带时间戳追加写入内存映射文件。
+
+    流水线模式下截图线程、主线程与执行线程会同时截图，写入位置与映射的扩容/关闭加锁串行化。
+    """
+
+    def __init__(self, source: CaptureSource, path: Path):
+        self.source = source
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._fh = open(self.path, 'w+b')
+        self._fh.write(MAGIC)
+        self._fh.truncate(GROW_BYTES)
+        self._mm = mmap.mmap(self._fh.fileno(), GROW_BYTES)
+        self._pos = len(MAGIC)
+        self.frames = 0
+        atexit.register(self.close)
+        log(f'[STEP] 录制截图到 {self.path}')
+
+    def _ensure(self, size: int):
+        if self._pos + size <= len(self._mm):
+            return
+        new_size = max(len(self._mm) * 2, self._pos + size)
+        self._mm.flush()
+        self._mm.close()
+        self._fh.truncate(new_size)
+        self._mm = mmap.mmap(self._fh.fileno(), new_size)
+
+    def grab_region(self, region, kind: str = 'other'):
+        img = self.source.grab_region(region, kind)
+        if img is None:
+            return img
+        self._record(region, kind, img)
+        return img
+
+    def _record(self, region, kind: str, img: np.ndarray):
+        # 录制文件不保存 alpha 通道
+        data = np.ascontiguousarray(img[:, :, :3] if img.ndim == 3 else img)
+        h, w = data.shape[:2]
+        c = data.shape[2] if data.ndim == 3 else 1
+        head = RECORD_HEAD.pack(time.time(), KINDS.get(kind, KINDS['other']), *map(int, region), h, w, c)
+        with self._lock:
+            if self._mm is None:
+                return
+            self._ensure(len(head) + data.nbytes)
+            self._mm[self._pos:self._pos + len(head)] = head
+            self._pos += len(head)
+            self._mm[self._pos:self._pos + data.nbytes] = memoryview(data).cast('B')
+            self._pos += data.nbytes
+            self.frames += 1
+
+    def grab_regions(self, regions):
+        imgs = self.source.grab_regions(regions)
+        if imgs is None:
+            return imgs
+        for kind, img in imgs.items():
+            self._record(regions[kind], kind, img)
+        return imgs
+
+    def screen_region(self):
+        return self.source.screen_region()
+
+    def close(self):
+        with self._lock:
+            if self._mm is None:
+                return
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            # 截掉预留的空白尾部
+            self._fh.truncate(self._pos)
+            self._fh.close()
+        self.source.close()
+        log(f'[STEP] 录制结束，共 {self.frames} 帧')
+
+class ReplayCapture(CaptureSource):
+    """回放录制文件，帧直接是内存映射上的只读视图，不做拷贝。
+
+    speed=1.0 按原始节奏（取当前时刻之前最新的一帧），speed<=0 为最快速度（每次取下一帧）。
+    """
+
+    def __init__(self, path: Path, speed: float = 1.0):
+        self.path = Path(path)
+        self.speed = speed
+        self._fh = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'不是有效的录制文件: {self.path}')
+        # 每种类型的 (时间戳, 区域, 偏移, 形状)
+        self.tracks: Dict[int, List[Tuple[float, Tuple[int,int,int,int], int, Tuple[int,...]]]] = {}
+        pos = len(MAGIC)
+        end = len(self._mm)
+        while pos + RECORD_HEAD.size <= end:
+            ts, kind, l, t, r, b, h, w, c = RECORD_HEAD.unpack_from(self._mm, pos)
+            pos += RECORD_HEAD.size
+            size = h * w * c
+            if pos + size > end:
+                break
+            shape = (h, w, c) if c > 1 else (h, w)
+            self.tracks.setdefault(kind, []).append((ts, (l, t, r, b), pos, shape))
+            pos += size
+        self._cursor = {k: 0 for k in self.tracks}
+        self._t0_rec = min((v[0][0] for v in self.tracks.values()), default=0.0)
+        self._t0_play: Optional[float] = None
+        self._stamps = {k: np.array([f[0] for f in v]) for k, v in self.tracks.items()}
+
+    def frame_count(self, kind: str = 'board') -> int:
+        return len(self.tracks.get(KINDS[kind], []))
+
+    def region(self, kind: str = 'board') -> Optional[Tuple[int,int,int,int]]:
+        track = self.tracks.get(KINDS[kind])
+        return track[0][1] if track else None
+
+    @property
+    def exhausted(self) -> bool:
+        return all(self._cursor[k] >= len(v) for k, v in self.tracks.items())
+
+    def _view(self, frame) -> np.ndarray:
+        _, _, offset, shape = frame
+        return np.frombuffer(self._mm, dtype=np.uint8, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+    def grab_region(self, region, kind: str = 'other'):
+        k = KINDS.get(kind, KINDS['other'])
+        track = self.tracks.get(k)
+        if not track:
+            return None
+        if self.speed <= 0:
+            i = self._cursor[k]
+            if i >= len(track):
+                return None
+            self._cursor[k] = i + 1
+            return self._view(track[i])
+        now = time.perf_counter()
+        if self._t0_play is None:
+            self._t0_play = now
+        t_rec = self._t0_rec + (now - self._t0_play) * self.speed
+        stamps = self._stamps[k]
+        if t_rec > stamps[-1]:
+            # 录制时间线已播完
+            self._cursor[k] = len(track)
+            return None
+        i = max(int(np.searchsorted(stamps, t_rec, side='right')) - 1, 0)
+        self._cursor[k] = max(self._cursor[k], i + 1)
+        return self._view(track[i])
+
+    def close(self):
+        # 仍被引用的帧视图会阻止 mmap 关闭，交给垃圾回收即可
+        try:
+            self._mm.close()
+        except BufferError:
+            return
+        self._fh.close()
+
+def make_capture(mode: str, path: str, speed: float) -> CaptureSource:
+    """按配置创建截图来源：live / record / replay / sim。"""
+    if mode == 'sim':
+        from config import CONFIG
+        from simulator import GameModel, SimCapture
+        return SimCapture(GameModel(CONFIG.rows, CONFIG.cols))
+    if mode == 'replay':
+        log(f'[INFO] 回放录制文件 {path}')
+        return ReplayCapture(Path(path), speed)
+    if mode == 'record':
+        return RecordingCapture(ScreenCapture(), Path(path))
+    return ScreenCapture()
+
+def replay_benchmark(path: str):
+    """以最快速度回放录制文件，测量棋盘识别吞吐 (帧/秒)。"""
+    from config import CONFIG
+    CONFIG.capture_mode = 'replay'
+    CONFIG.capture_file = path
+    CONFIG.replay_speed = 0
+    import detection
+    from templates import TEMPLATES
+    source = detection.CAPTURE
+    detection.REGIONS.board_region = source.region('board')
+    TEMPLATES.load_templates()
+    total = source.frame_count('board')
+    log(f'[INFO] 棋盘帧 {total}，分数帧 {source.frame_count("score")}')
+    start = time.perf_counter()
+    done = 0
+    while detection.BOARD_RECOGNIZER.recognize_board() is not None:
+        done += 1
+        if done >= total:
+            break
+    elapsed = time.perf_counter() - start
+    fps = done / elapsed if elapsed > 0 else 0.0
+    log(f'[STEP] 识别 {done} 帧，用时 {elapsed:.3f}s，{fps:.1f} 帧/秒')
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('用法: python capture.py <录制文件>')
+        sys.exit(1)
+    replay_benchmark(sys.argv[1])
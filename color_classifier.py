@@ -0,0 +1,178 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+# 特征在该尺寸上计算，足够区分四种颜色且很快
+COLOR_FEATURE_SIZE = 16
+HUE_BINS = 8
+# 饱和度低于此值的像素视为背景，不计入色相直方图
+SAT_FLOOR = 40
+# 距离等于该类训练半径时置信度恰为 0.6（默认 min_confidence）
+RADIUS_CONF = 0.6
+
+def color_features(stack: np.ndarray) -> np.ndarray:
+    """(N,h,w,3) BGR 格子 -> (N,16) 特征：Lab 均值/标准差、HSV 的 S/V 均值、色相直方图。"""
+    n = len(stack)
+    if stack.shape[1:3] != (COLOR_FEATURE_SIZE, COLOR_FEATURE_SIZE):
+        stack = np.stack([cv2.resize(t, (COLOR_FEATURE_SIZE, COLOR_FEATURE_SIZE), interpolation=cv2.INTER_AREA)
+                          for t in stack])
+    flat = np.ascontiguousarray(stack).reshape(n * COLOR_FEATURE_SIZE, COLOR_FEATURE_SIZE, 3)
+    lab = cv2.cvtColor(flat, cv2.COLOR_BGR2LAB).reshape(n, -1, 3).astype(np.float32)
+    hsv = cv2.cvtColor(flat, cv2.COLOR_BGR2HSV).reshape(n, -1, 3)
+    sat = hsv[..., 1] >= SAT_FLOOR
+    hue_bin = (hsv[..., 0].astype(np.int32) * HUE_BINS) // 180 + np.arange(n)[:, None] * HUE_BINS
+    hist = np.bincount(hue_bin[sat], minlength=n * HUE_BINS).reshape(n, HUE_BINS).astype(np.float32)
+    hist /= hsv.shape[1]
+    sv = hsv[..., 1:].astype(np.float32).mean(axis=1) / 255.0
+    return np.concatenate([lab.mean(axis=1) / 255.0, lab.std(axis=1) / 128.0, sv, hist], axis=1)
+
+class ColorClassifier:
+    """最近质心分类器：特征标准化后取与各类质心的欧氏距离。
+
+    置信度 = 1 - (1-RADIUS_CONF) * d / 类半径，截断到 [0,1]，与 min_confidence 同一量纲。
+    """
+
+    def __init__(self, names: Sequence[str], centroids: np.ndarray, mean: np.ndarray,
+                 scale: np.ndarray, radius: np.ndarray):
+        self.names = list(names)
+        self.centroids = centroids.astype(np.float32)
+        self.mean = mean.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+        self.radius = radius.astype(np.float32)
+
+    @classmethod
+    def fit(cls, stack: np.ndarray, labels: Sequence[str]) -> 'ColorClassifier':
+        feats = color_features(stack)
+        labels = np.asarray(labels)
+        names = sorted(set(labels.tolist()))
+        mean = feats.mean(axis=0)
+        scale = feats.std(axis=0) + 1e-3
+        z = (feats - mean) / scale
+        centroids = np.stack([z[labels == n].mean(axis=0) for n in names])
+        radius = []
+        for i, n in enumerate(names):
+            d = np.linalg.norm(z[labels == n] - centroids[i], axis=1)
+            radius.append(max(float(np.percentile(d, 95)), 0.5))
+        return cls(names, centroids, mean, scale, np.array(radius))
+
+    def predict(self, stack: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (类别下标, 置信度)。"""
+        z = (color_features(stack) - self.mean) / self.scale
+        d = np.linalg.norm(z[:, None, :] - self.centroids[None, :, :], axis=2)
+        best = np.argmin(d, axis=1)
+        ratio = d[np.arange(len(best)), best] / self.radius[best]
+        return best, np.clip(1.0 - (1.0 - RADIUS_CONF) * ratio, 0.0, 1.0)
+
+    def save(self, path: Path):
+        np.savez(path, names=np.array(self.names), centroids=self.centroids, mean=self.mean,
+                 scale=self.scale, radius=self.radius)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['ColorClassifier']:
+        if not Path(path).exists():
+            return None
+        data = np.load(path)
+        return cls(data['names'].tolist(), data['centroids'], data['mean'], data['scale'], data['radius'])
+
+def make_jittered_corpus(templates: Dict[str, np.ndarray], per_class: int, size: int,
+                         seed: int = 0) -> Tuple[np.ndarray, List[str]]:
+    """从模板生成带噪声、缩放裁剪、亮度扰动的格子样本 (N,size,size,3) 与标签。"""
+    rng = np.random.default_rng(seed)
+    tiles = []
+    labels = []
+    for name, img in templates.items():
+        h, w = img.shape[:2]
+        for _ in range(per_class):
+            # 随机裁掉 0~12% 的边并平移，模拟区域标定误差
+            m = rng.uniform(0, 0.12, 4)
+            y1, y2 = int(h * m[0]), h - int(h * m[1])
+            x1, x2 = int(w * m[2]), w - int(w * m[3])
+            tile = cv2.resize(img[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+            tile = tile.astype(np.float32) * rng.uniform(0.8, 1.2) + rng.uniform(-20, 20)
+            tile += rng.normal(0, 6, tile.shape)
+            tiles.append(np.clip(tile, 0, 255).astype(np.uint8))
+            labels.append(name)
+    return np.stack(tiles), labels
+
+def harvest_session(path: Path, min_conf: float = 0.8) -> Tuple[np.ndarray, List[str]]:
+    """从录制文件中收集棋盘格子，用模板匹配结果作标签，只保留高置信度且识别为已知颜色的样本。"""
+    from capture import ReplayCapture
+    from config import CONFIG
+    from detection import build_tile_grid
+    from templates import TEMPLATES
+    source = ReplayCapture(path, speed=0)
+    tiles = []
+    labels = []
+    while True:
+        img = source.grab_region(None, 'board')
+        if img is None:
+            break
+        grid = build_tile_grid(img.shape[1], img.shape[0], CONFIG.rows, CONFIG.cols)
+        stack = TEMPLATES.resize_tiles(img, grid)
+        best, conf = TEMPLATES.match_stack(stack)
+        # 后端可能返回 len(TEMPLATES.names) 作为 UNKNOWN 索引，没有对应的标签
+        keep = (conf >= min_conf) & (best < len(TEMPLATES.names))
+        tiles.append(stack[keep])
+        labels.extend(TEMPLATES.names[i] for i in best[keep])
+    if not tiles:
+        return np.empty((0, 1, 1, 3), dtype=np.uint8), []
+    return np.concatenate(tiles), labels
+
+def build_model(out: Path, sessions: Sequence[str], per_class: int = 200):
+    from templates import TEMPLATES
+    if not TEMPLATES.names:
+        TEMPLATES.load_templates()
+    size = TEMPLATES.feature_size[0]
+    stack, labels = make_jittered_corpus(TEMPLATES.templates, per_class, size)
+    for s in sessions:
+        tiles, tile_labels = harvest_session(Path(s))
+        print(f'[INFO] 从 {s} 收集 {len(tile_labels)} 个格子')
+        if tile_labels:
+            stack = np.concatenate([stack, tiles])
+            labels = labels + tile_labels
+    model = ColorClassifier.fit(stack, labels)
+    model.save(out)
+    print(f'[STEP] 颜色分类模型已保存到 {out}（{len(labels)} 个样本，类别 {model.names}）')
+
+def benchmark(model_path: Path, per_class: int = 100):
+    """在独立随机种子生成的样本上比较模板匹配与颜色分类的准确率和速度。"""
+    from templates import TEMPLATES
+    if not TEMPLATES.names:
+        TEMPLATES.load_templates()
+    model = ColorClassifier.load(model_path)
+    if model is None:
+        print(f'[ERROR] 未找到模型 {model_path}，请先运行 build')
+        return
+    stack, labels = make_jittered_corpus(TEMPLATES.templates, per_class, TEMPLATES.feature_size[0], seed=12345)
+    truth = np.array(labels)
+    for name, fn, names in (('template', TEMPLATES._template_stack, TEMPLATES.names),
+                            ('color', model.predict, model.names)):
+        fn(stack[:8])
+        start = time.perf_counter()
+        best, conf = fn(stack)
+        elapsed = time.perf_counter() - start
+        acc = float((np.array(names)[best] == truth).mean())
+        print(f'[STEP] {name:8s} 准确率={acc:.4f} 平均置信度={float(conf.mean()):.3f} '
+              f'每格={elapsed / len(stack) * 1e6:.1f}us')
+
+def main():
+    from config import CONFIG
+    parser = argparse.ArgumentParser(description='颜色特征分类器：训练与基准')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_build = sub.add_parser('build', help='从 templates/*.png 与录制会话训练模型')
+    p_build.add_argument('sessions', nargs='*', help='录制文件 (capture_mode=record 生成)')
+    p_build.add_argument('--out', default=CONFIG.color_model_file)
+    p_build.add_argument('--per-class', type=int, default=200)
+    p_bench = sub.add_parser('bench', help='与模板匹配比较准确率与速度')
+    p_bench.add_argument('--model', default=CONFIG.color_model_file)
+    args = parser.parse_args()
+    if args.cmd == 'build':
+        build_model(Path(args.out), args.sessions, args.per_class)
+    else:
+        benchmark(Path(args.model))
+
+if __name__ == '__main__':
+    main()
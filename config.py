@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Tuple
 
 @dataclass
 class BoardConfig:
@@ -6,11 +7,95 @@ class BoardConfig:
     cols: int = 6
     min_confidence: float = 0.6
     retry_low_conf: int = 2
+    # 低置信度批量重试：每轮重新截图前的等待（秒）
+    retry_interval: float = 0.05
     wait_score_stable_seconds: float = 0.8
     poll_interval: float = 0.15
     swap_click_interval: float = 0.5
     score_stable_checks: int = 5
     score_diff_threshold: float = 4.0
+    # 稳定检测: 'event'(指纹环形缓冲+自适应轮询，同时看棋盘与分数区) / 'score'(旧版分数区逐帧比较)
+    stability_detector: str = 'event'
+    stable_watch_board: bool = True
+    stable_frames: int = 3
+    stable_poll_min: float = 0.02
+    stable_backoff: float = 1.5
+    stable_min_wait: float = 0.2
+    # 判定稳定至少要连续静止的时长（秒），与旧版检测 score_stable_checks 次 poll_interval 轮询相当；
+    # stable_frames 只是帧数下限，最短轮询间隔下几帧不足以越过动画中途的停顿。自动调参只会调低
+    stable_min_still: float = 0.6
+    stable_timeout: float = 4.0
+    board_motion_threshold: float = 6.0
+    # 分数读取：按 score_digit_dir 下的数字模板读出分数，稳定检测改为比较读数，每步得分写入日志与 metrics；
+    # 数字相似度低于 score_min_confidence 视为读取失败（该帧按分数仍在变化处理）
+    score_reader: bool = True
+    score_digit_dir: str = 'templates/digits'
+    score_min_confidence: float = 0.7
+    # 多步规划：每帧最多执行的互不干扰交换数，批内相邻两次交换之间的间隔（秒）。
+    # 默认 1（每帧一步，与旧版行为相同）；随机补块引起的连锁可能让批内某步落空，确认实机无误后再调大
+    plan_max_moves: int = 1
+    plan_swap_gap: float = 0.05
+    # 预测搜索：交换后动画期间在后台推算可能的新棋盘并预先求解，识别后先查缓存。
+    # 默认关闭：后台线程与识别争用 CPU，命中率取决于补块规律，需在实机上确认有收益再开启
+    speculative_search: bool = False
+    speculative_max_boards: int = 1024
+    speculative_cache_size: int = 4096
+    # 自动调参：按最近 tune_window 步实测的选中延迟/动画/稳定用时调整上面的时序参数（一般不超过默认值），
+    # 出错后退回并暂停 tune_cooldown 步；每 tune_probe_every 次交换测量一次点击到选中的延迟。
+    # 默认关闭，使用上面按最慢情况给出的保守值；开启后只会在这些值以下收紧
+    auto_tune: bool = False
+    tune_window: int = 20
+    tune_margin: float = 1.5
+    tune_cooldown: int = 10
+    tune_probe_every: int = 5
+    # 自动定位：未标定区域时在全屏按模板做由粗到细的金字塔搜索找到棋盘，分数区按相对棋盘的位置放置；
+    # 每帧低置信度格子占比达到 locate_drift_ratio 时视为窗口移动，先在原位置附近、再在全屏重新定位。
+    # 默认关闭（使用热键标定）：全屏搜索可能匹配到屏幕上其他相似画面，确认定位可靠后再开启
+    auto_locate: bool = False
+    locate_coarse_size: int = 480       # 金字塔顶层（粗搜）的最大边长（像素）
+    locate_min_tile: int = 24           # 粗搜的最小格子边长（原始分辨率像素）
+    locate_scale_step: float = 1.06     # 粗搜格距的几何步长
+    locate_min_score: float = 0.75      # 接受定位结果的最低平均匹配分
+    locate_drift_ratio: float = 0.5
+    # 分数区相对棋盘的位置 (左, 上, 右, 下)，以棋盘宽高为单位；已标定过分数区时沿用标定的相对位置
+    locate_score_box: Tuple[float, float, float, float] = (0.0, 1.04, 0.52, 1.17)
+    # 流水线模式：截图、识别+求解、执行分线程重叠运行；队列只保留最新几帧
+    pipelined: bool = False
+    pipeline_queue_size: int = 2
+    # 多棋盘模式（multiboard.py）：识别+求解线程池的线程数
+    multi_workers: int = 2
+    # 格子分类后端: 'template'(模板匹配+直方图) / 'color'(颜色特征最近质心，模型由 color_classifier.py build 生成)
+    classifier_backend: str = 'template'
+    color_model_file: str = 'templates/color_model.npz'
+    # 增量识别：格子指纹(平均色)变化不超过容差时沿用上一帧的识别结果
+    incremental_recognition: bool = True
+    fingerprint_tolerance: float = 6.0
+    # 求解引擎: 'python'(逐格扫描) / 'bitboard'(位棋盘增量检测) / 'lookahead'(连锁前瞻搜索) / 'vector'(numpy 整盘向量化)
+    solver_engine: str = 'bitboard'
+    # lookahead 搜索：最大层数、每个空洞局面的补块采样数、节点/时间预算与置换表上限
+    search_depth: int = 2
+    search_samples: int = 2
+    search_node_budget: int = 4000
+    search_time_budget: float = 0.05
+    search_tt_size: int = 200000
+    # 截图来源: 'live'(实时屏幕) / 'record'(实时并录制到 capture_file) / 'replay'(回放 capture_file)
+    #          'sim'(simulator.py 的无头模拟游戏)
+    capture_mode: str = 'live'
+    capture_file: str = 'session.rec'
+    # 回放速度倍率，<=0 表示不等待、逐帧最快回放
+    replay_speed: float = 1.0
+    # 观测：console_log=False 关闭控制台日志；metrics_enabled 开启各阶段计时，
+    # 每次迭代追加一行到 metrics_jsonl 并重写 Prometheus 文本文件 metrics_prom
+    console_log: bool = True
+    # 控制台显示: 'live'(后台线程按 display_fps 限速输出，棋盘在底部原地重绘) / 'plain'(同步逐行输出)
+    #            'quiet'(不输出棋盘，日志只保留 [WARN]/[ERROR])；display_queue_size 为待输出队列上限
+    display_mode: str = 'live'
+    display_fps: float = 10.0
+    display_queue_size: int = 256
+    metrics_enabled: bool = False
+    metrics_jsonl: str = 'metrics.jsonl'
+    metrics_prom: str = 'metrics.prom'
+    metrics_window: int = 200
     hotkey_board_start: str = 'ctrl+alt+s'
     hotkey_board_end: str = 'ctrl+alt+e'
     hotkey_score_start: str = 'ctrl+alt+f'
@@ -20,5 +105,9 @@ class BoardConfig:
     # serial_port: str = ''  # 运行时交互选择，会保存到 config.json
     serial_baud: int = 115200
     serial_click_char: str = 'c'
+    # 串口协议：2=单条交换命令+绝对坐标+回执(自动探测，不支持时退回 1)，1=旧版逐条 M/c 命令
+    serial_protocol: int = 2
+    serial_ack_timeout: float = 1.0
+    serial_max_inflight: int = 4
 
 CONFIG = BoardConfig()
@@ -1,42 +1,83 @@
+import functools
 import json
+import threading
 import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+import cv2
 import numpy as np
-import mss
+from capture import make_capture
 from config import CONFIG
+from lazy import Lazy
+from score_reader import SCORE_READER
+from metrics import METRICS, log
 from templates import TEMPLATES
 
 CONFIG_FILE = Path(__file__).parent / 'config.json'
+# 多棋盘模式下各线程可能同时保存配置，读-改-写需串行
+_CONFIG_LOCK = threading.Lock()
+
+def _read_config() -> dict:
+    return json.loads(CONFIG_FILE.read_text(encoding='utf-8')) if CONFIG_FILE.exists() else {}
 
 class RegionManager:
-    def __init__(self):
+    """棋盘/分数区域与串口配置。
+
+    profile 为 None 时对应 config.json 顶层（单棋盘）；为整数时对应 config.json 中 boards 列表的第几项，
+    供多棋盘模式使用，串口与时序参数仍保存在顶层。
+    """
+
+    def __init__(self, profile: Optional[int] = None):
+        self.profile = profile
         self.board_region: Optional[Tuple[int,int,int,int]] = None
         self.score_region: Optional[Tuple[int,int,int,int]] = None
         self.serial_port: Optional[str] = None
+        # tuning 学到的时序参数，与区域一起保存在 config.json
+        self.timings: Dict[str, float] = {}
         self.load_regions()
 
+    @property
+    def name(self) -> str:
+        return '棋盘' if self.profile is None else f'棋盘{self.profile}'
+
     def load_regions(self):
         if CONFIG_FILE.exists():
             try:
-                data = json.loads(CONFIG_FILE.read_text(encoding='utf-8'))
+                data = _read_config()
+                self.serial_port = data.get('serial_port') or None
+                self.timings = data.get('timings') or {}
+                if self.profile is not None:
+                    boards = data.get('boards') or []
+                    data = boards[self.profile] if self.profile < len(boards) else {}
                 self.board_region = tuple(data.get('board_region')) if data.get('board_region') else None
                 self.score_region = tuple(data.get('score_region')) if data.get('score_region') else None
-                self.serial_port = data.get('serial_port') or None
-                print('[INFO] 已加载配置文件 config.json')
+                if self.profile is None:
+                    log('[INFO] 已加载配置文件 config.json')
             except Exception as e:
-                print(f'[WARN] 加载区域文件失败: {e}')
-        else:
-            print('[INFO] 未找到配置文件，请使用热键记录并选择串口')
+                log(f'[WARN] 加载区域文件失败: {e}')
+        elif self.profile is None:
+            log('[INFO] 未找到配置文件，请使用热键记录并选择串口')
 
     def save_config(self):
-        data = {
-            'board_region': self.board_region,
-            'score_region': self.score_region,
-            'serial_port': self.serial_port,
-        }
-        CONFIG_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
-        print(f'[STEP] 配置已保存到 {CONFIG_FILE}')
+        # 先读出现有内容再合并，单棋盘区域与多棋盘 boards 互不覆盖
+        with _CONFIG_LOCK:
+            try:
+                data = _read_config()
+            except Exception as e:
+                log(f'[WARN] 读取配置文件失败，将重写: {e}')
+                data = {}
+            regions = {'board_region': self.board_region, 'score_region': self.score_region}
+            if self.profile is None:
+                data.update(regions)
+                data['serial_port'] = self.serial_port
+                data['timings'] = self.timings
+            else:
+                boards = data.setdefault('boards', [])
+                while len(boards) <= self.profile:
+                    boards.append({'board_region': None, 'score_region': None})
+                boards[self.profile] = regions
+            CONFIG_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+        log(f'[STEP] 配置已保存到 {CONFIG_FILE}')
 
     def set_board_start(self, x, y):
         if self.board_region:
@@ -44,15 +85,15 @@ class RegionManager:
             self.board_region = (x, y, right, bottom)
         else:
             self.board_region = (x, y, x, y)
-        print(f'[STEP] 记录棋盘左上: ({x},{y})')
+        log(f'[STEP] 记录棋盘左上: ({x},{y})')
 
     def set_board_end(self, x, y):
         if not self.board_region:
-            print('[ERROR] 尚未记录棋盘左上')
+            log('[ERROR] 尚未记录棋盘左上')
             return
         left, top, _, _ = self.board_region
         self.board_region = (left, top, x, y)
-        print(f'[STEP] 记录棋盘右下: ({x},{y})')
+        log(f'[STEP] 记录棋盘右下: ({x},{y})')
         self.save_config()
 
     def set_score_start(self, x, y):
@@ -61,20 +102,20 @@ class RegionManager:
             self.score_region = (x, y, right, bottom)
         else:
             self.score_region = (x, y, x, y)
-        print(f'[STEP] 记录分数区左上: ({x},{y})')
+        log(f'[STEP] 记录分数区左上: ({x},{y})')
 
     def set_score_end(self, x, y):
         if not self.score_region:
-            print('[ERROR] 尚未记录分数区左上')
+            log('[ERROR] 尚未记录分数区左上')
             return
         left, top, _, _ = self.score_region
         self.score_region = (left, top, x, y)
-        print(f'[STEP] 记录分数区右下: ({x},{y})')
+        log(f'[STEP] 记录分数区右下: ({x},{y})')
         self.save_config()
 
     def set_serial_port(self, port: str):
         self.serial_port = port
-        print(f'[STEP] 记录串口: {port}')
+        log(f'[STEP] 记录串口: {port}')
         self.save_config()
 
     @staticmethod
@@ -84,6 +125,13 @@ class RegionManager:
         left, top, right, bottom = region
         return (right - left) > 3 and (bottom - top) > 3
 
+    def tile_size(self) -> Optional[Tuple[float, float]]:
+        """当前棋盘区域下单个格子的 (宽, 高)，未设置时为 None。"""
+        if not self.board_ready():
+            return None
+        left, top, right, bottom = self.board_region
+        return (right - left) / CONFIG.cols, (bottom - top) / CONFIG.rows
+
     def board_ready(self) -> bool:
         return self._is_region_valid(self.board_region)
 
@@ -93,99 +141,182 @@ class RegionManager:
     def ready(self) -> bool:
         return self.board_ready() and self.score_ready()
 
-REGIONS = RegionManager()
+# 首次使用时才读取 config.json
+REGIONS = Lazy(RegionManager)
 
-class ScreenCapture:
-    def __init__(self):
-        self.sct = mss.mss()
+def load_profiles() -> List[RegionManager]:
+    """读取 config.json 中 boards 列表的全部多棋盘配置。"""
+    try:
+        count = len(_read_config().get('boards') or [])
+    except Exception as e:
+        log(f'[WARN] 加载区域文件失败: {e}')
+        count = 0
+    return [RegionManager(i) for i in range(count)]
 
-    def grab_region(self, region):
-        if not region:
-            return None
-        left, top, right, bottom = region
-        monitor = {
-            'left': int(left),
-            'top': int(top),
-            'width': int(right - left),
-            'height': int(bottom - top)
-        }
-        shot = self.sct.grab(monitor)
-        return np.array(shot)[:, :, :3]
+# 首次截图时才打开截图会话
+CAPTURE = Lazy(lambda: METRICS.instrument(make_capture(CONFIG.capture_mode, CONFIG.capture_file, CONFIG.replay_speed),
+                                          'grab_region', 'grab_regions'))
+
+@functools.lru_cache(maxsize=8)
+def build_tile_grid(width: int, height: int, rows: int, cols: int) -> np.ndarray:
+    """按行列均分区域，返回每个格子的切片坐标 (rows, cols, 4)=(y1,y2,x1,x2)。
+
+    结果按区域尺寸缓存，只在区域变化时重算；返回的数组只读。
+    """
+    ys = (np.arange(rows + 1) * (height / rows)).astype(np.int32)
+    xs = (np.arange(cols + 1) * (width / cols)).astype(np.int32)
+    grid = np.empty((rows, cols, 4), dtype=np.int32)
+    grid[..., 0] = ys[:-1, None]
+    grid[..., 1] = ys[1:, None]
+    grid[..., 2] = xs[None, :-1]
+    grid[..., 3] = xs[None, 1:]
+    grid.setflags(write=False)
+    return grid
+
+# 每个格子指纹的采样边长：格子缩成 FINGERPRINT_CELLS x FINGERPRINT_CELLS 的平均色
+FINGERPRINT_CELLS = 4
 
-CAPTURE = ScreenCapture()
+def tile_fingerprints(board_img: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """整盘一次缩放得到每个格子的低分辨率平均色指纹 (rows, cols, D)。"""
+    f = FINGERPRINT_CELLS
+    small = cv2.resize(board_img[:, :, :3], (cols * f, rows * f), interpolation=cv2.INTER_AREA)
+    small = small.reshape(rows, f, cols, f, 3).transpose(0, 2, 1, 3, 4)
+    return small.reshape(rows, cols, -1).astype(np.float32)
 
 class BoardRecognizer:
-    def __init__(self):
+    """识别一个棋盘；regions/capture 缺省为全局 REGIONS/CAPTURE，多棋盘模式下每个棋盘一个实例。"""
+
+    def __init__(self, regions: Optional[RegionManager] = None, capture=None):
+        self.regions = regions if regions is not None else REGIONS
+        self.capture = capture if capture is not None else CAPTURE
+        self._locator = None
         self.prev_board: Optional[np.ndarray] = None
         self.center_ratios: Optional[np.ndarray] = None  # shape (rows, cols, 2)
+        # 增量识别缓存：上次真正做模板匹配时的指纹与结果（未经低置信度降级）
+        self._fp: Optional[np.ndarray] = None
+        self._fp_valid: Optional[np.ndarray] = None
+        self._cache: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # 本帧低置信度重试统计
+        self.retry_tiles = 0
+        self.retry_rounds = 0
+        self.retry_recovered = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _match(board_img: np.ndarray, grid: np.ndarray):
+        """按本棋盘的格子尺寸切换模板库后匹配；多个棋盘共用模板库，切换与匹配需在同一把锁内。"""
+        with TEMPLATES.lock:
+            # 棋盘区域变化时格子尺寸随之变化，模板库按新尺寸重建或从缓存读取
+            TEMPLATES.set_tile_size(board_img.shape[1] / CONFIG.cols, board_img.shape[0] / CONFIG.rows)
+            return TEMPLATES.match_tiles(board_img, grid)
+
+    def _locate(self):
+        if self._locator is None:
+            from locator import LOCATOR, RegionLocator
+            self._locator = LOCATOR if self.regions is REGIONS else RegionLocator(self.regions, self.capture)
+        return self._locator
+
+    def _classify(self, board_img: np.ndarray, grid: np.ndarray):
+        """只对指纹变化的格子做模板匹配，其余沿用缓存的标签与置信度。"""
+        fp = tile_fingerprints(board_img, CONFIG.rows, CONFIG.cols)
+        if CONFIG.incremental_recognition and self._fp is not None and self._fp.shape == fp.shape:
+            diff = np.abs(fp - self._fp).mean(axis=2)
+            changed = (diff > CONFIG.fingerprint_tolerance) | ~self._fp_valid
+        else:
+            changed = np.ones(fp.shape[:2], dtype=bool)
+        n_changed = int(changed.sum())
+        if n_changed == changed.size:
+            board, confs, centers = self._match(board_img, grid)
+            self._fp = fp
+        else:
+            board, confs, centers = (a.copy() for a in self._cache)
+            if n_changed:
+                names, scores, ctrs = self._match(board_img, grid[changed])
+                board[changed], confs[changed], centers[changed] = names, scores, ctrs
+                self._fp[changed] = fp[changed]
+        # 低置信度格子不作为缓存基准，下一帧必定重算
+        self._fp_valid = confs >= CONFIG.min_confidence
+        self._cache = (board.copy(), confs.copy(), centers.copy())
+        self.cache_misses = n_changed
+        self.cache_hits = changed.size - n_changed
+        METRICS.incr('tile_cache_hits', self.cache_hits)
+        METRICS.incr('tile_cache_misses', self.cache_misses)
+        return board, confs, centers
 
-    def recognize_board(self):
-        region = REGIONS.board_region
-        if not REGIONS.board_ready():
-            print('[ERROR] 棋盘区域未设置')
+    def _retry_low_confidence(self, region, grid, board, confs, centers):
+        """所有低置信度格子一起重试：每轮只截一次图并批量重算，全部通过即停止。"""
+        low = confs < CONFIG.min_confidence
+        self.retry_tiles = int(low.sum())
+        self.retry_rounds = 0
+        self.retry_recovered = 0
+        self.fallbacks = 0
+        if not self.retry_tiles:
+            return
+        cells = ' '.join(f'{s:.2f}@({r},{c})' for (r, c), s in zip(zip(*np.nonzero(low)), confs[low]))
+        log(f'[WARN] 低置信度 {self.retry_tiles} 格 {cells} -> 批量重试')
+        while low.any() and self.retry_rounds < CONFIG.retry_low_conf:
+            self.retry_rounds += 1
+            time.sleep(CONFIG.retry_interval)
+            board_img_retry = self.capture.grab_region(region, 'board')
+            if board_img_retry is None:
+                log('[WARN] 重试截图失败，跳过本次重试')
+                continue
+            names, scores, ctrs = self._match(board_img_retry, grid[low])
+            ok = scores >= CONFIG.min_confidence
+            if ok.any():
+                idx = tuple(i[ok] for i in np.nonzero(low))
+                board[idx], confs[idx], centers[idx] = names[ok], scores[ok], ctrs[ok]
+                low[idx] = False
+                self.retry_recovered += int(ok.sum())
+        if low.any():
+            self.fallbacks = int(low.sum())
+            log(f'[WARN] 重试仍失败 {self.fallbacks} 格，使用上一帧值降级')
+            board[low] = self.prev_board[low]
+            confs[low] = CONFIG.min_confidence
+            # 无法确定中心，使用居中
+            centers[low] = (0.5, 0.5)
+        log(f'[STEP] 重试统计 轮数={self.retry_rounds} 恢复={self.retry_recovered} 降级={self.fallbacks}')
+        METRICS.incr('retry_rounds', self.retry_rounds)
+        METRICS.incr('fallbacks', self.fallbacks)
+
+    def recognize_board(self, board_img: Optional[np.ndarray] = None, locate: bool = True):
+        """识别棋盘；board_img 为调用方已截好的棋盘图像，缺省时现场截图。
+
+        locate 为 True 且开启 auto_locate 时，低置信度格子过多视为棋盘区域偏移，
+        重新定位后按新区域重新截图识别一次。
+        """
+        region = self.regions.board_region
+        if not self.regions.board_ready():
+            log(f'[ERROR] {self.regions.name}区域未设置')
             return None
-        board_img = CAPTURE.grab_region(region)
         if board_img is None:
-            print('[ERROR] 截图失败')
+            board_img = self.capture.grab_region(region, 'board')
+        if board_img is None:
+            log('[ERROR] 截图失败')
             return None
-        left, top, right, bottom = region
-        tile_w = (right - left) / CONFIG.cols
-        tile_h = (bottom - top) / CONFIG.rows
-        board = []
-        confs = []
-        centers = []
-        for r in range(CONFIG.rows):
-            row = []
-            c_row = []
-            centers_row = []
-            for c in range(CONFIG.cols):
-                x1 = int(c * tile_w)
-                y1 = int(r * tile_h)
-                x2 = int((c + 1) * tile_w)
-                y2 = int((r + 1) * tile_h)
-                tile = board_img[y1:y2, x1:x2]
-                name, score, (crx, cry) = TEMPLATES.match_tile(tile)
-                if score < CONFIG.min_confidence and self.prev_board is not None:
-                    print(f'[WARN] 低置信度 {score:.2f}@({r},{c}) -> 重试')
-                    retry = 0
-                    while retry < CONFIG.retry_low_conf:
-                        time.sleep(0.05)
-                        board_img_retry = CAPTURE.grab_region(region)
-                        if board_img_retry is None:
-                            print('[WARN] 重试截图失败，跳过本次重试')
-                            retry += 1
-                            continue
-                        tile_retry = board_img_retry[y1:y2, x1:x2]
-                        name_retry, score_retry, (crx_retry, cry_retry) = TEMPLATES.match_tile(tile_retry)
-                        if score_retry >= CONFIG.min_confidence:
-                            name, score = name_retry, score_retry
-                            crx, cry = crx_retry, cry_retry
-                            break
-                        retry += 1
-                    if score < CONFIG.min_confidence:
-                        print('[WARN] 重试仍失败，使用上一帧值降级')
-                        name = self.prev_board[r][c]
-                        score = CONFIG.min_confidence
-                        # 无法确定中心，使用居中
-                        crx, cry = 0.5, 0.5
-                row.append(name)
-                c_row.append(score)
-                centers_row.append((crx, cry))
-            board.append(row)
-            confs.append(c_row)
-            centers.append(centers_row)
-        board = np.array(board)
-        confs = np.array(confs)
-        centers = np.array(centers)
+        grid = build_tile_grid(board_img.shape[1], board_img.shape[0], CONFIG.rows, CONFIG.cols)
+        board, confs, centers = self._classify(board_img, grid)
+        if locate and CONFIG.auto_locate:
+            if self._locate().check(confs):
+                self._fp = None
+                return self.recognize_board(locate=False)
+        log(f'[STEP] 增量识别 命中={self.cache_hits} 重算={self.cache_misses}')
+        if self.prev_board is not None and self.prev_board.shape == board.shape:
+            self._retry_low_confidence(region, grid, board, confs, centers)
         self.prev_board = board
         self.center_ratios = centers
         return board, confs
 
-BOARD_RECOGNIZER = BoardRecognizer()
+BOARD_RECOGNIZER = METRICS.instrument(BoardRecognizer(), 'recognize_board')
 
 class ScoreStabilityChecker:
     def __init__(self):
-        pass
+        # 上次等待的总用时（秒），供 tuning 统计
+        self.elapsed = 0.0
+        # 上次等待结束时读到的分数，未开启分数读取或读不出时为 None
+        self.score_value: Optional[int] = None
 
     @staticmethod
     def avg_diff(a, b):
@@ -200,23 +331,178 @@ class ScoreStabilityChecker:
             return
         start = time.time()
         frames = []
+        self.score_value = None
+        by_value = SCORE_READER.ready
         while True:
-            img = CAPTURE.grab_region(region)
+            img = CAPTURE.grab_region(region, 'score')
             if img is None:
                 time.sleep(CONFIG.poll_interval)
                 continue
-            frames.append(img)
-            if len(frames) >= CONFIG.score_stable_checks:
-                diffs = [self.avg_diff(frames[i], frames[i-1]) for i in range(1, len(frames))]
-                avgd = sum(diffs)/len(diffs)
-                if avgd < CONFIG.score_diff_threshold:
-                    print(f'[STEP] 分数区域稳定 diff={avgd:.2f}')
-                    return
-                else:
+            if by_value:
+                # 读数模式：连续 score_stable_checks 帧读数相同即稳定，读不出的帧视为仍在变化
+                frames.append(SCORE_READER.read(img))
+                self.score_value = frames[-1]
+                if len(frames) >= CONFIG.score_stable_checks:
+                    if frames[0] is not None and frames.count(frames[0]) == len(frames):
+                        log(f'[STEP] 分数稳定 读数={frames[0]}')
+                        self.elapsed = time.time() - start
+                        return True
                     frames.pop(0)
+            else:
+                frames.append(img)
+                if len(frames) >= CONFIG.score_stable_checks:
+                    diffs = [self.avg_diff(frames[i], frames[i-1]) for i in range(1, len(frames))]
+                    avgd = sum(diffs)/len(diffs)
+                    if avgd < CONFIG.score_diff_threshold:
+                        log(f'[STEP] 分数区域稳定 diff={avgd:.2f}')
+                        self.elapsed = time.time() - start
+                        return True
+                    else:
+                        frames.pop(0)
             if time.time() - start > CONFIG.wait_score_stable_seconds * 5:
-                print('[WARN] 分数区域长时间未稳定，强制继续')
-                return
+                log('[WARN] 分数区域长时间未稳定，强制继续')
+                METRICS.incr('stable_timeouts')
+                self.elapsed = time.time() - start
+                return False
             time.sleep(CONFIG.poll_interval)
 
-SCORE_CHECKER = ScoreStabilityChecker()
+# 分数区指纹的缩放尺寸 (w, h)
+SCORE_FINGERPRINT_SIZE = (32, 8)
+
+class StabilityDetector:
+    """事件驱动的稳定检测：比较降采样指纹，动画结束即返回。
+
+    - 每次轮询只保存棋盘每格平均色指纹和缩小后的分数区，放在预分配的环形缓冲里；
+    - 最近 stable_frames 帧都与最新帧相差在阈值内、且已连续静止 stable_min_still 秒即视为稳定
+      （棋盘看最大格差，分数看平均差）；
+      数字模板就绪时分数区改为保存读数，读数完全相同才算稳定，读不出的帧按仍在变化处理；
+    - 画面仍在变化时轮询间隔按 stable_backoff 逐步放宽到 poll_interval，
+      一旦出现静止帧立即恢复最短间隔以尽快确认；
+    - 交换后画面可能尚未开始动，未观察到变化前至少等待 stable_min_wait。
+    """
+
+    def __init__(self):
+        self._ring: Optional[np.ndarray] = None
+        self._board_dim = 0
+        self._count = 0
+        self._head = 0
+        # 上次等待的观测（秒，相对开始等待的时刻），供 tuning 统计：
+        # 首次/最后一次检测到画面变化、两次变化之间最长的静止间隔、总用时
+        self.motion_start: Optional[float] = None
+        self.motion_end: Optional[float] = None
+        self.longest_pause = 0.0
+        self.elapsed = 0.0
+        # 本次等待是否按读数判断分数区，以及最近一帧读到的分数
+        self._by_value = False
+        self.score_value: Optional[int] = None
+
+    def _fingerprint(self) -> Optional[np.ndarray]:
+        regions = {}
+        if REGIONS.board_ready() and CONFIG.stable_watch_board:
+            regions['board'] = REGIONS.board_region
+        if REGIONS.score_ready():
+            regions['score'] = REGIONS.score_region
+        if not regions:
+            return None
+        # 棋盘与分数区一次截取
+        imgs = CAPTURE.grab_regions(regions)
+        if imgs is None:
+            return None
+        parts = []
+        board_dim = 0
+        if 'board' in imgs:
+            fp = tile_fingerprints(imgs['board'], CONFIG.rows, CONFIG.cols)
+            board_dim = fp[0, 0].size
+            parts.append(fp.ravel())
+        if 'score' in imgs and self._by_value:
+            self.score_value = SCORE_READER.read(imgs['score'])
+            parts.append(np.array([np.nan if self.score_value is None else self.score_value], dtype=np.float32))
+        elif 'score' in imgs:
+            img = imgs['score']
+            small = cv2.resize(img[:, :, :3], SCORE_FINGERPRINT_SIZE, interpolation=cv2.INTER_AREA)
+            parts.append(small.ravel().astype(np.float32))
+        if not parts:
+            return None
+        self._board_dim = board_dim
+        return np.concatenate(parts)
+
+    def _push(self, fp: np.ndarray):
+        n = max(CONFIG.stable_frames, 2)
+        if self._ring is None or self._ring.shape != (n, fp.size):
+            self._ring = np.empty((n, fp.size), dtype=np.float32)
+            self._count = 0
+            self._head = 0
+        self._ring[self._head] = fp
+        self._head = (self._head + 1) % n
+        self._count = min(self._count + 1, n)
+
+    def _window_diff(self, fp: np.ndarray) -> Tuple[float, float]:
+        """最新帧与窗口内其余帧的最大差异：(棋盘最大格差, 分数区平均差)。"""
+        diff = np.abs(self._ring[:self._count] - fp)
+        board_n = self._board_dim * CONFIG.rows * CONFIG.cols if self._board_dim else 0
+        board_d = 0.0
+        score_d = 0.0
+        if board_n:
+            per_tile = diff[:, :board_n].reshape(self._count, -1, self._board_dim).mean(axis=2)
+            board_d = float(per_tile.max())
+        if diff.shape[1] > board_n:
+            # 读数模式下只有一个值，读不出时为 NaN，差值同样为 NaN
+            score_d = float(diff[:, board_n:].mean(axis=1).max())
+        return board_d, score_d
+
+    def wait_stable(self) -> bool:
+        if not REGIONS.board_ready() and not REGIONS.score_ready():
+            time.sleep(CONFIG.wait_score_stable_seconds)
+            return False
+        start = time.perf_counter()
+        self._count = 0
+        self._head = 0
+        interval = CONFIG.stable_poll_min
+        moved = False
+        # 当前静止窗口第一帧的时刻
+        still_since = start
+        self._by_value = SCORE_READER.ready
+        self.score_value = None
+        self.motion_start = self.motion_end = None
+        self.longest_pause = 0.0
+        while True:
+            fp = self._fingerprint()
+            now = time.perf_counter()
+            self.elapsed = now - start
+            if fp is not None:
+                if self._count:
+                    board_d, score_d = self._window_diff(fp)
+                    score_still = score_d == 0 if self._by_value else score_d < CONFIG.score_diff_threshold
+                    still = board_d < CONFIG.board_motion_threshold and score_still
+                else:
+                    board_d = score_d = 0.0
+                    still = False
+                self._push(fp)
+                if still:
+                    interval = CONFIG.stable_poll_min
+                    if self._count >= self._ring.shape[0] and now - still_since >= CONFIG.stable_min_still and \
+                            (moved or now - start >= CONFIG.stable_min_wait):
+                        log(f'[STEP] 画面稳定 用时={now - start:.3f}s 棋盘差={board_d:.2f} 分数差={score_d:.2f}')
+                        return True
+                elif self._count > 1:
+                    moved = True
+                    t = now - start
+                    if self.motion_start is None:
+                        self.motion_start = t
+                    else:
+                        self.longest_pause = max(self.longest_pause, t - self.motion_end)
+                    self.motion_end = t
+                    still_since = now
+                    # 仍在动画中，丢弃旧帧并放宽轮询间隔
+                    self._ring[0] = fp
+                    self._head = 1 % self._ring.shape[0]
+                    self._count = 1
+                    interval = min(interval * CONFIG.stable_backoff, CONFIG.poll_interval)
+            if now - start > CONFIG.stable_timeout:
+                log('[WARN] 画面长时间未稳定，强制继续')
+                METRICS.incr('stable_timeouts')
+                return False
+            time.sleep(interval)
+
+SCORE_CHECKER = METRICS.instrument(
+    StabilityDetector() if CONFIG.stability_detector == 'event' else ScoreStabilityChecker(), 'wait_stable')
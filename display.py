@@ -0,0 +1,162 @@
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config import CONFIG
+
+COLOR_MAP = {
+    'UNKNOWN': '\x1b[90m',  # 灰色
+    'R': '\x1b[31m',
+    'Y': '\x1b[33m',
+    'P': '\x1b[35m',
+    'B': '\x1b[34m',
+}
+RESET = '\x1b[0m'
+UNDERLINE = ('\x1b[4m', '\x1b[24m')
+# 光标回到 n 行之前的行首并清除到屏幕末尾
+CLEAR_UP = '\x1b[{}F\x1b[J'
+
+Frame = Tuple[np.ndarray, frozenset]
+
+class ConsoleRenderer:
+    """控制台显示：棋盘快照与日志经有界队列交给后台线程输出，主循环不再同步格式化和写控制台。
+
+    - display_mode='live'：后台线程每 1/display_fps 秒最多写一次；期间的日志在上方依次滚动，
+      最新的棋盘固定在底部原地重绘（非终端时直接追加），未来得及绘制的旧棋盘直接丢弃；
+    - display_mode='plain'：与旧版相同，同步逐行输出；
+    - display_mode='quiet'：不格式化棋盘，日志只输出 [WARN]/[ERROR]。
+    每种颜色、是否下划线的格子文本只拼接一次并缓存。队列满时丢弃新的棋盘或日志而不阻塞，
+    丢弃数显示在棋盘下方。
+    """
+
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._glyphs: Dict[Tuple[str, bool], str] = {}
+        # 底部棋盘占用的行数与内容，只有新日志时据此清掉并重画
+        self._footer = 0
+        self._last: Optional[Frame] = None
+        self.frames = 0
+        self.dropped_frames = 0
+        self.dropped_logs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running or CONFIG.display_mode != 'live':
+            return
+        self._queue = queue.Queue(maxsize=max(CONFIG.display_queue_size, 1))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='display', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止渲染线程；队列中剩余的日志和最新棋盘会先输出。"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self._thread = None
+        self._queue = None
+
+    def log(self, *args, **kwargs):
+        mode = CONFIG.display_mode
+        if mode == 'quiet':
+            text = ' '.join(str(a) for a in args)
+            if text.lstrip().startswith(('[WARN]', '[ERROR]')):
+                print(text, **kwargs)
+            return
+        q = self._queue
+        if q is None:
+            print(*args, **kwargs)
+            return
+        try:
+            q.put_nowait(('log', kwargs.get('sep', ' ').join(str(a) for a in args)))
+        except queue.Full:
+            self.dropped_logs += 1
+
+    def board(self, board: np.ndarray, highlight: Iterable[Tuple[int, int]] = ()):
+        """提交一帧棋盘快照；highlight 中的格子加下划线。"""
+        mode = CONFIG.display_mode
+        if mode == 'quiet' or not CONFIG.console_log:
+            return
+        frame = (board.copy(), frozenset(highlight))
+        q = self._queue
+        if q is None:
+            print(self._format(frame), end='')
+            return
+        try:
+            q.put_nowait(('board', frame))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def _glyph(self, name: str, underline: bool) -> str:
+        glyph = self._glyphs.get((name, underline))
+        if glyph is None:
+            glyph = f"{COLOR_MAP.get(name, '')}{name}{RESET}"
+            if underline:
+                glyph = f'{UNDERLINE[0]}{glyph}{UNDERLINE[1]}'
+            self._glyphs[(name, underline)] = glyph
+        return glyph
+
+    def _format(self, frame: Frame) -> str:
+        board, highlight = frame
+        rows, cols = board.shape
+        lines = [' '.join(self._glyph(board[r, c], (r, c) in highlight) for c in range(cols)) for r in range(rows)]
+        if self.dropped_frames or self.dropped_logs:
+            lines.append(f'(已丢弃棋盘 {self.dropped_frames} 帧, 日志 {self.dropped_logs} 行)')
+        return '\n'.join(lines) + '\n'
+
+    def _run(self):
+        tty = sys.stdout.isatty()
+        interval = 1.0 / max(CONFIG.display_fps, 0.1)
+        pending: List[str] = []
+        latest: Optional[Frame] = None
+        next_draw = 0.0
+        while True:
+            waiting = pending or latest is not None
+            timeout = max(next_draw - time.perf_counter(), 0.0) if waiting else 0.1
+            try:
+                kind, item = self._queue.get(timeout=timeout)
+                if kind == 'log':
+                    pending.append(item)
+                else:
+                    if latest is not None:
+                        # 两次绘制之间来了新棋盘，旧的直接丢弃
+                        self.dropped_frames += 1
+                    latest = item
+            except queue.Empty:
+                if self._stop.is_set() and not waiting:
+                    return
+            if (pending or latest is not None) and time.perf_counter() >= next_draw:
+                self._draw(pending, latest, tty)
+                pending = []
+                latest = None
+                next_draw = time.perf_counter() + interval
+
+    def _draw(self, lines: List[str], frame: Optional[Frame], tty: bool):
+        out = []
+        if tty and self._footer:
+            if frame is None:
+                # 只有新日志：先清掉底部的棋盘，日志写完后重画上一次的棋盘
+                frame = self._last
+            out.append(CLEAR_UP.format(self._footer))
+            self._footer = 0
+        for line in lines:
+            out.append(line + '\n')
+        if frame is not None:
+            block = self._format(frame)
+            out.append(block)
+            self._last = frame
+            self.frames += 1
+            if tty:
+                self._footer = block.count('\n')
+        sys.stdout.write(''.join(out))
+        sys.stdout.flush()
+
+DISPLAY = ConsoleRenderer()
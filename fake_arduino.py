@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import tty
+from typing import List, Tuple
+
+class FakeArduino(threading.Thread):
+    """基于 pty 的假 Arduino（仅 Linux/macOS），按 arduino_auto_click.ino 的协议回复。
+
+    port 可直接传给 serial.Serial；legacy=True 时模拟旧固件（只认 M/c，不回复）。
+    """
+
+    def __init__(self, legacy: bool = False, start_pos: Tuple[int, int] = (0, 0)):
+        super().__init__(name='fake-arduino', daemon=True)
+        self.legacy = legacy
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.x, self.y = start_pos
+        self.clicks: List[Tuple[int, int]] = []
+        self.lines: List[str] = []
+
+    def _reply(self, text: str):
+        os.write(self.master, (text + '\n').encode('ascii'))
+
+    def _handle(self, line: str):
+        self.lines.append(line)
+        parts = line.split()
+        if not parts:
+            return
+        cmd, args = parts[0], parts[1:]
+        if cmd == 'M' and len(args) == 2:
+            self.x += int(args[0])
+            self.y += int(args[1])
+            return
+        if cmd == 'c':
+            self.clicks.append((self.x, self.y))
+            return
+        if self.legacy or not args:
+            return
+        cid, nums = args[0], [int(a) for a in args[1:]]
+        if cmd == 'V':
+            self._reply(f'K {cid} V2')
+        elif cmd in ('P', 'A') and len(nums) == 2:
+            self.x, self.y = nums
+            self._reply(f'K {cid}')
+        elif cmd == 'C':
+            self.clicks.append((self.x, self.y))
+            self._reply(f'K {cid}')
+        elif cmd == 'S' and len(nums) in (5, 6):
+            self.clicks.append((nums[0], nums[1]))
+            self.clicks.append((nums[2], nums[3]))
+            self.x, self.y = nums[2], nums[3]
+            self._reply(f'K {cid}')
+        else:
+            self._reply(f'E {cid} bad')
+
+    def run(self):
+        buf = b''
+        while True:
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buf += chunk
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                self._handle(line.decode('ascii', 'replace').strip())
+
+    def close(self):
+        for fd in (self.slave, self.master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+if __name__ == '__main__':
+    dev = FakeArduino(legacy='--legacy' in sys.argv)
+    dev.start()
+    print(f'[INFO] 假 Arduino 已启动: {dev.port}  (Ctrl+C 退出)')
+    try:
+        dev.join()
+    except KeyboardInterrupt:
+        print(f'[INFO] 收到点击 {len(dev.clicks)} 次，光标位置 ({dev.x},{dev.y})')
@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Callable
+
+class Lazy:
+    """延迟创建的单例代理：第一次访问属性时才调用 factory 创建对象，之后所有属性读写都转发给它。
+
+    用于串口、截图会话、配置文件等带硬件/IO 副作用的全局对象，导入模块时不再触发这些副作用。
+    创建过程加锁，多个线程同时首次访问也只创建一次；后台线程可先调用 _lazy_get() 提前创建。
+    """
+
+    __slots__ = ('_factory', '_obj', '_lock')
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_obj', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _lazy_get(self):
+        obj = self._obj
+        if obj is None:
+            with self._lock:
+                obj = self._obj
+                if obj is None:
+                    obj = self._factory()
+                    object.__setattr__(self, '_obj', obj)
+        return obj
+
+    def _lazy_bind(self, factory: Callable[[], Any]):
+        """在首次访问前替换创建方式；已创建时无效。"""
+        with self._lock:
+            object.__setattr__(self, '_factory', factory)
+
+    @property
+    def _lazy_ready(self) -> bool:
+        return self._obj is not None
+
+    def __getattr__(self, name: str):
+        return getattr(self._lazy_get(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._lazy_get(), name, value)
+
+    def __repr__(self) -> str:
+        return repr(self._obj) if self._obj is not None else f'<Lazy {self._factory!r}>'
@@ -0,0 +1,257 @@
+import time
+from typing import Iterable, Optional, Tuple
+import cv2
+import numpy as np
+from config import CONFIG
+from detection import REGIONS, CAPTURE
+from metrics import METRICS, log
+from templates import TEMPLATES
+
+# 粗搜时把图像按候选格距缩放，使格子恰为 COARSE_TILE 像素，模板大小固定，大格距不再更慢
+COARSE_TILE = 6
+# 细化时每格在上一层预测位置四周搜索的余量（当前层像素）；第一次细化另加粗搜的量化误差
+REFINE_MARGIN = 3
+# 第一次细化所在金字塔层的格距范围 [SETTLE_TILE, 2*SETTLE_TILE)：格子太小时逐格匹配不可靠，太大则慢
+SETTLE_TILE = 12
+# 匹配窗口灰度标准差低于该值（纯色背景）时记 0 分，归一化相关在平坦区域没有意义
+FLAT_STD = 2.0
+# 重新定位时格距只在原格距 ±NEAR_PITCH 内搜索；局部搜索范围为原棋盘向四周扩展宽高的 NEAR_MARGIN 倍
+NEAR_MARGIN = 0.5
+NEAR_PITCH = 0.15
+
+Found = Tuple[float, float, float, float, float]  # (平均匹配分, x, y, 格宽, 格高)
+
+def _window_std(sums: np.ndarray, sqsums: np.ndarray, tw: int, th: int) -> np.ndarray:
+    """由积分图求每个 tw x th 窗口的灰度标准差，形状与 matchTemplate 结果相同。"""
+    def box(s):
+        return s[th:, tw:] - s[:-th, tw:] - s[th:, :-tw] + s[:-th, :-tw]
+    n = tw * th
+    mean = box(sums) / n
+    return np.sqrt(np.maximum(box(sqsums) / n - mean * mean, 0.0))
+
+def _grid_scores(resp: np.ndarray, pw: float, ph: float) -> Optional[np.ndarray]:
+    """以每个位置为棋盘左上角时，rows x cols 个格子匹配分的平均值。"""
+    ys = np.round(np.arange(CONFIG.rows) * ph).astype(np.int32)
+    xs = np.round(np.arange(CONFIG.cols) * pw).astype(np.int32)
+    h = resp.shape[0] - ys[-1]
+    w = resp.shape[1] - xs[-1]
+    if h < 1 or w < 1:
+        return None
+    acc = np.zeros((h, w), dtype=np.float32)
+    for y in ys:
+        band = resp[y:y + h]
+        for x in xs:
+            acc += band[:, x:x + w]
+    return acc / (CONFIG.rows * CONFIG.cols)
+
+def _search(img: np.ndarray, pitches: Iterable[Tuple[float, float]]) -> Optional[Found]:
+    """在整幅 img 中按候选格距搜索棋盘左上角，返回平均匹配分最高者。"""
+    t = COARSE_TILE
+    bank = [cv2.resize(tmpl, (t, t), interpolation=cv2.INTER_AREA) for tmpl in TEMPLATES.templates.values()]
+    if not bank:
+        return None
+    h, w = img.shape[:2]
+    best: Optional[Found] = None
+    for pw, ph in pitches:
+        sw, sh = int(round(w * t / pw)), int(round(h * t / ph))
+        if sw < t * CONFIG.cols or sh < t * CONFIG.rows:
+            continue
+        small = cv2.resize(img, (sw, sh), interpolation=cv2.INTER_AREA)
+        sx, sy = sw / w, sh / h
+        resp = None
+        for tmpl in bank:
+            r = cv2.matchTemplate(small, tmpl, cv2.TM_CCOEFF_NORMED)
+            resp = r if resp is None else np.maximum(resp, r, out=resp)
+        sums, sqsums = cv2.integral2(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), sdepth=cv2.CV_64F)
+        resp[_window_std(sums, sqsums, t, t) < FLAT_STD] = 0
+        acc = _grid_scores(resp, pw * sx, ph * sy)
+        if acc is None:
+            continue
+        y, x = np.unravel_index(int(np.argmax(acc)), acc.shape)
+        score = float(acc[y, x])
+        if best is None or score > best[0]:
+            best = (score, x / sx, y / sy, pw, ph)
+    return best
+
+def _refine(img: np.ndarray, found: Found, m: int = REFINE_MARGIN,
+            labels: Optional[np.ndarray] = None) -> Optional[Tuple[Found, np.ndarray]]:
+    """逐格细化：每格只在预测位置附近 ±m 内匹配，再按列/行拟合出左上角与格宽/格高。
+
+    labels 为上一层每格匹配到的模板下标，给出时每格只匹配该模板；返回 (结果, 本层各格模板下标)。
+    """
+    _, x0, y0, pw, ph = found
+    tw, th = int(round(pw)), int(round(ph))
+    bank = [cv2.resize(t, (tw, th), interpolation=cv2.INTER_AREA) for t in TEMPLATES.templates.values()]
+    xs = [[] for _ in range(CONFIG.cols)]
+    ys = [[] for _ in range(CONFIG.rows)]
+    scores = np.full((CONFIG.rows, CONFIG.cols), -np.inf, dtype=np.float32)
+    best = np.zeros((CONFIG.rows, CONFIG.cols), dtype=np.int32)
+    for r in range(CONFIG.rows):
+        for c in range(CONFIG.cols):
+            px, py = int(round(x0 + c * pw)) - m, int(round(y0 + r * ph)) - m
+            qx, qy = max(px, 0), max(py, 0)
+            patch = img[qy:py + th + 2 * m + 1, qx:px + tw + 2 * m + 1]
+            if patch.shape[0] < th or patch.shape[1] < tw:
+                return None
+            for k in (range(len(bank)) if labels is None else (labels[r, c],)):
+                resp = cv2.matchTemplate(patch, bank[k], cv2.TM_CCOEFF_NORMED)
+                dy, dx = np.unravel_index(int(np.argmax(resp)), resp.shape)
+                if resp[dy, dx] > scores[r, c]:
+                    scores[r, c], best[r, c], pos = resp[dy, dx], k, (qx + dx, qy + dy)
+            xs[c].append(pos[0])
+            ys[r].append(pos[1])
+    # 每列/每行取中位数，个别格子（特殊块、选中框）匹配偏了也不影响拟合
+    pw, x0 = np.polyfit(np.arange(CONFIG.cols), [np.median(v) for v in xs], 1)
+    ph, y0 = np.polyfit(np.arange(CONFIG.rows), [np.median(v) for v in ys], 1)
+    return (float(scores.mean()), float(x0), float(y0), float(pw), float(ph)), best
+
+def _settle(img: np.ndarray, found: Found) -> Optional[Tuple[Found, np.ndarray]]:
+    """粗搜结果的第一次细化：余量覆盖格距步长的累积误差与粗搜的量化误差，
+    并比较整体错开一格的网格（边缘一行/列匹配偏弱时粗搜可能错位一格）。"""
+    score, x, y, pw, ph = found
+    p = max(pw, ph)
+    err = p * (CONFIG.locate_scale_step - 1) / 2 * (max(CONFIG.rows, CONFIG.cols) - 1) + p / COARSE_TILE / 2
+    m = REFINE_MARGIN + int(np.ceil(err))
+    shifted = (_refine(img, (score, x + dx * pw, y + dy * ph, pw, ph), m) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+    return max((f for f in shifted if f is not None), key=lambda f: f[0][0], default=None)
+
+def _geometric(lo: float, hi: float, step: float):
+    p = lo
+    while p <= hi:
+        yield p
+        p *= step
+
+class RegionLocator:
+    """在屏幕上自动定位棋盘与分数区，代替热键标定。
+
+    - 定位：截取整个屏幕，建图像金字塔；在顶层按几何步长枚举格距，用模板的归一化相关
+      叠加出 rows x cols 网格的平均匹配分，取最高者；再逐层放大，只在上一层结果附近
+      微调位置与格宽/格高，直到原始分辨率；
+    - 分数区：按相对棋盘的位置放置（已标定过时沿用标定的相对位置，否则用 locate_score_box）；
+    - 结果写回对应的区域配置并保存到 config.json；之后每帧由 check 根据识别置信度判断是否偏移，
+      偏移时先在原位置附近、再在全屏重新定位。
+    """
+
+    def __init__(self, regions=None, capture=None):
+        # 缺省定位全局 REGIONS；多棋盘模式下每个棋盘配置一个实例
+        self.regions = regions if regions is not None else REGIONS
+        self.capture = capture if capture is not None else CAPTURE
+        self.locates = 0
+        self.failures = 0
+        self.last_seconds = 0.0
+        self.last_score = 0.0
+        # False 时只更新内存中的区域，不写 config.json（模拟器使用）
+        self.persist = True
+
+    def _score_layout(self) -> Tuple[float, float, float, float]:
+        """分数区相对棋盘的位置 (左, 上, 右, 下)，以棋盘宽高为单位。"""
+        if not self.regions.ready():
+            return CONFIG.locate_score_box
+        bl, bt, br, bb = self.regions.board_region
+        sl, st, sr, sb = self.regions.score_region
+        bw, bh = br - bl, bb - bt
+        return (sl - bl) / bw, (st - bt) / bh, (sr - bl) / bw, (sb - bt) / bh
+
+    def locate(self, prev: Optional[Tuple[int, int, int, int]] = None, local: bool = False) -> bool:
+        """定位棋盘，成功时更新区域配置并返回 True。
+
+        prev 为原棋盘区域时只搜索与其相近的格距，local 为 True 时只搜索其附近；否则全屏、全格距范围搜索。
+        """
+        if not TEMPLATES.templates:
+            TEMPLATES.load_templates()
+        if not TEMPLATES.templates:
+            log('[ERROR] 没有模板，无法自动定位')
+            return False
+        start = time.perf_counter()
+        area = self.capture.screen_region()
+        if area is None:
+            log('[WARN] 当前截图来源不支持全屏截图，无法自动定位')
+            return False
+        if prev is not None and local:
+            left, top, right, bottom = prev
+            mx, my = int((right - left) * NEAR_MARGIN), int((bottom - top) * NEAR_MARGIN)
+            area = (max(left - mx, area[0]), max(top - my, area[1]),
+                    min(right + mx, area[2]), min(bottom + my, area[3]))
+            if area[2] <= area[0] or area[3] <= area[1]:
+                return False
+        shot = self.capture.grab_region(area, 'other')
+        if shot is None:
+            return False
+        pyramid = [np.ascontiguousarray(shot[:, :, :3])]
+        while max(pyramid[-1].shape[:2]) > CONFIG.locate_coarse_size:
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        scale = 2 ** (len(pyramid) - 1)
+        coarse = pyramid[-1]
+        if prev is not None:
+            pw0 = (prev[2] - prev[0]) / CONFIG.cols
+            aspect = (prev[3] - prev[1]) / CONFIG.rows / pw0
+            lo, hi = pw0 * (1 - NEAR_PITCH), pw0 * (1 + NEAR_PITCH)
+        else:
+            aspect = 1.0
+            lo = CONFIG.locate_min_tile
+            hi = min(pyramid[0].shape[1] / CONFIG.cols, pyramid[0].shape[0] / CONFIG.rows)
+        found = _search(coarse, ((p / scale, p * aspect / scale) for p in _geometric(lo, hi, CONFIG.locate_scale_step)))
+        level = len(pyramid) - 1
+        if found is not None:
+            # 在格距落在 [SETTLE_TILE, 2*SETTLE_TILE) 的层做第一次细化，必要时继续缩小金字塔
+            score, x, y, pw, ph = found
+            while max(pw, ph) >= 2 * SETTLE_TILE:
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+                level += 1
+                x, y, pw, ph = x / 2, y / 2, pw / 2, ph / 2
+            while max(pw, ph) < SETTLE_TILE and level > 0:
+                level -= 1
+                x, y, pw, ph = x * 2, y * 2, pw * 2, ph * 2
+            refined = _settle(pyramid[level], (score, x, y, pw, ph))
+            # 逐层细化：每层坐标与格距放大一倍后逐格微调，每格只匹配上一层认出的模板
+            for img in reversed(pyramid[:level]):
+                if refined is None:
+                    break
+                (score, x, y, pw, ph), labels = refined
+                refined = _refine(img, (score, x * 2, y * 2, pw * 2, ph * 2), labels=labels)
+            found = refined[0] if refined else None
+        self.last_seconds = time.perf_counter() - start
+        if found is None or found[0] < CONFIG.locate_min_score:
+            self.failures += 1
+            score = found[0] if found else 0.0
+            log(f'[WARN] {self.regions.name}自动定位失败 匹配分={score:.2f} 用时={self.last_seconds:.3f}s')
+            return False
+        score, x, y, pw, ph = found
+        left, top = area[0] + x, area[1] + y
+        board = (int(round(left)), int(round(top)),
+                 int(round(left + CONFIG.cols * pw)), int(round(top + CONFIG.rows * ph)))
+        fl, ft, fr, fb = self._score_layout()
+        bw, bh = board[2] - board[0], board[3] - board[1]
+        self.regions.board_region = board
+        self.regions.score_region = (int(round(left + fl * bw)), int(round(top + ft * bh)),
+                                     int(round(left + fr * bw)), int(round(top + fb * bh)))
+        self.locates += 1
+        self.last_score = score
+        METRICS.incr('relocations')
+        log(f'[STEP] 自动定位 {self.regions.name}={self.regions.board_region} 分数区={self.regions.score_region} '
+            f'匹配分={score:.2f} 用时={self.last_seconds:.3f}s')
+        if self.persist:
+            self.regions.save_config()
+        return True
+
+    def relocate(self) -> bool:
+        """依次尝试：原棋盘附近同尺寸、全屏同尺寸、全屏任意尺寸。"""
+        if self.capture.screen_region() is None:
+            return False
+        if self.regions.board_ready():
+            prev = self.regions.board_region
+            if self.locate(prev, local=True) or self.locate(prev):
+                return True
+        return self.locate()
+
+    def check(self, confs: np.ndarray) -> bool:
+        """每帧的对齐检查：低置信度格子占比达到 locate_drift_ratio 时重新定位，返回是否已重新定位。"""
+        if not CONFIG.auto_locate:
+            return False
+        low = float((confs < CONFIG.min_confidence).mean())
+        if low < CONFIG.locate_drift_ratio:
+            return False
+        log(f'[WARN] 低置信度格子占比 {low:.0%}，{self.regions.name}区域可能已偏移，重新定位')
+        return self.relocate()
+
+LOCATOR = METRICS.instrument(RegionLocator(), 'locate')
@@ -1,98 +1,141 @@
+import argparse
 import time
-import keyboard
 from config import CONFIG
 from templates import TEMPLATES
 from detection import REGIONS, BOARD_RECOGNIZER, SCORE_CHECKER
-from solver import SOLVER
-from actions import ACTIONS
+from solver import PLANNER, SPECULATOR
+from actions import ACTIONS, connect_async
+from metrics import METRICS, log
+from tuning import TUNER
+from score_reader import SCORE_READER
+from display import DISPLAY
 
-COLOR_MAP = {
-	'UNKNOWN': '\x1b[90m',  # 灰色
-	'R': '\x1b[31m',
-	'Y': '\x1b[33m',
-	'P': '\x1b[35m',
-	'B': '\x1b[34m',
-}
-RESET = '\x1b[0m'
+def exit_pressed() -> bool:
+	# keyboard 需要图形/输入设备权限，无头模式下不导入
+	import keyboard
+	return keyboard.is_pressed(CONFIG.hotkey_exit)
 
-def colorize(name: str) -> str:
-	return f"{COLOR_MAP.get(name, '')}{name}{RESET}"
-
-def print_board(board, highlight=None, underline=False):
-	# highlight: set of (r,c)
-	for r in range(board.shape[0]):
-		row_out = []
-		for c in range(board.shape[1]):
-			cell = board[r, c]
-			text = colorize(cell)
-			if highlight and (r, c) in highlight:
-				if underline:
-					text = f"\x1b[4m{text}\x1b[24m"  # 下划线
-				else:
-					text = f"\x1b[1m{text}\x1b[22m"  # 加粗
-			row_out.append(text)
-		print(' '.join(row_out))
-
-def register_hotkeys():
+def register_hotkeys(regions=REGIONS):
+	import keyboard
 	def record(name):
 		import pyautogui
 		x,y = pyautogui.position()
-		if name=='board_start': REGIONS.set_board_start(x,y)
-		elif name=='board_end': REGIONS.set_board_end(x,y)
-		elif name=='score_start': REGIONS.set_score_start(x,y)
-		elif name=='score_end': REGIONS.set_score_end(x,y)
+		if name=='board_start': regions.set_board_start(x,y)
+		elif name=='board_end': regions.set_board_end(x,y)
+		elif name=='score_start': regions.set_score_start(x,y)
+		elif name=='score_end': regions.set_score_end(x,y)
 	keyboard.add_hotkey(CONFIG.hotkey_board_start, lambda: record('board_start'))
 	keyboard.add_hotkey(CONFIG.hotkey_board_end, lambda: record('board_end'))
 	keyboard.add_hotkey(CONFIG.hotkey_score_start, lambda: record('score_start'))
 	keyboard.add_hotkey(CONFIG.hotkey_score_end, lambda: record('score_end'))
 
-def wait_regions():
-	print('[INFO] 请使用热键设置棋盘与分数区域, 按 F8 可退出')
+def wait_regions(regions=REGIONS, interactive=True):
+	if CONFIG.auto_locate and regions is REGIONS and not REGIONS.ready():
+		log('[INFO] 未标定区域，尝试自动定位棋盘...')
+		from locator import LOCATOR
+		if LOCATOR.locate():
+			return True
+	if not interactive:
+		if regions.ready():
+			return True
+		log('[ERROR] 无头模式下区域未标定（未开启 auto_locate 或自动定位失败），退出')
+		return False
+	log('[INFO] 请使用热键设置棋盘与分数区域, 按 F8 可退出')
 	while True:
-		if keyboard.is_pressed(CONFIG.hotkey_exit):
-			print('[INFO] 用户退出')
+		if exit_pressed():
+			log('[INFO] 用户退出')
 			return False
-		if REGIONS.ready():
-			print(f'[STEP] 棋盘区域={REGIONS.board_region} 分数区域={REGIONS.score_region}')
+		if regions.ready():
+			log(f'[STEP] {regions.name}区域={regions.board_region} 分数区域={regions.score_region}')
 			return True
 		time.sleep(0.25)
 
-def main_loop():
-	print('[INFO] 加载模板...')
-	TEMPLATES.load_templates()
-	if len(TEMPLATES.templates) < 4:
-		print('[ERROR] 模板不足，退出')
+def report_move(board, move, score, matches):
+	if move:
+		log(f'[STEP] 最佳交换 {move} 得分={score} 组数={len(matches)}')
+	# 棋盘交给显示线程输出，下划线标记即将交换的两个格子
+	DISPLAY.board(board, move or ())
+
+def main_loop(should_stop=exit_pressed, report=report_move):
+	log('[INFO] 加载模板...')
+	TEMPLATES.load_templates(REGIONS.tile_size())
+	if len(TEMPLATES.names) < 4:
+		log('[ERROR] 模板不足，退出')
+		return
+	TUNER.load()
+	# 等待后台的串口连接完成（未调用 connect_async 时在此选择并打开串口）
+	ACTIONS._lazy_get()
+	log(f'[INFO] 启动完成 用时 {time.perf_counter() - METRICS.started:.2f}s')
+	if CONFIG.pipelined:
+		from pipeline import PipelineRunner
+		PipelineRunner().run(should_stop, report)
+		log('[INFO] 结束')
 		return
 	iteration = 0
 	while True:
-		if keyboard.is_pressed(CONFIG.hotkey_exit):
-			print('[INFO] 用户退出主循环')
+		if should_stop():
+			log('[INFO] 用户退出主循环')
 			break
 		iteration += 1
-		print(f"\n[STEP] ===== Iteration {iteration} =====")
+		log(f"\n[STEP] ===== Iteration {iteration} =====")
 		rec = BOARD_RECOGNIZER.recognize_board()
 		if rec is None:
 			time.sleep(0.5)
 			continue
 		board, confs = rec
-		print('[INFO] 棋盘(彩色输出):')
-		print_board(board)
-		move, score, matches = SOLVER.find_best_move(board)
+		if TUNER.after_recognize(board, BOARD_RECOGNIZER):
+			ACTIONS.resync_cursor()
+		move, score, matches = SPECULATOR.find_best_move(board)
+		report(board, move, score, matches)
 		if not move:
-			print('[WARN] 无可行交换，结束')
+			log('[WARN] 无可行交换，结束')
 			break
-		print(f'[STEP] 最佳交换 {move} 得分={score} 组数={len(matches)}')
-		# 再次输出棋盘并下划线标记即将交换的两个格子
-		highlight = {move[0], move[1]}
-		print('[STEP] 交换前高亮棋盘 (下划线标记):')
-		print_board(board, highlight=highlight, underline=True)
-		ACTIONS.swap_tiles(*move)
-		print('[STEP] 等待分数区域稳定...')
+		batch = PLANNER.plan(board, move, matches)
+		if len(batch) > 1:
+			log(f'[STEP] 本帧执行 {len(batch)} 步互不干扰的交换: {batch}')
+		TUNER.before_swap(board)
+		ACTIONS.swap_batch(batch)
+		# 动画期间后台预先搜索可能的下一局面
+		SPECULATOR.start(board, batch)
+		log('[STEP] 等待分数区域稳定...')
 		# time.sleep(1)
-		SCORE_CHECKER.wait_stable()
-	print('[INFO] 结束')
+		stable = SCORE_CHECKER.wait_stable()
+		TUNER.after_wait(SCORE_CHECKER, stable)
+		points = SCORE_READER.commit(SCORE_CHECKER.score_value)
+		METRICS.end_iteration(iteration, score=score, points=points)
+	log('[INFO] 结束')
+
+def main():
+	parser = argparse.ArgumentParser(description='永劫无间消消乐自动化')
+	parser.add_argument('--headless', action='store_true',
+						help='无头模式：不注册热键、不提示选择串口，使用已保存/自动定位的区域')
+	parser.add_argument('--port', help='串口（如 COM3），缺省使用已保存的串口')
+	parser.add_argument('--seconds', type=float, default=0.0, help='运行多少秒后退出（0 为不限）')
+	parser.add_argument('--capture', choices=['live', 'record', 'replay', 'sim'], help='覆盖 config.py 的 capture_mode')
+	parser.add_argument('--metrics', action='store_true', help='开启阶段计时与计数（覆盖 metrics_enabled）')
+	args = parser.parse_args()
+	if args.capture:
+		# 截图会话在首次截图时才创建，此处覆盖仍然有效
+		CONFIG.capture_mode = args.capture
+	if args.metrics:
+		# 计时包装在调用时才读取开关，模块已导入也能生效
+		CONFIG.metrics_enabled = True
+	deadline = time.perf_counter() + args.seconds if args.seconds > 0 else None
+	def should_stop():
+		if deadline is not None and time.perf_counter() >= deadline:
+			return True
+		return not args.headless and exit_pressed()
+	# 串口打开后的等待与握手放到后台，与区域定位、模板加载并行
+	connect_async(args.port, interactive=not args.headless)
+	# 串口选择的交互提示结束后再启动显示线程
+	DISPLAY.start()
+	try:
+		if not args.headless:
+			register_hotkeys()
+		if wait_regions(interactive=not args.headless):
+			main_loop(should_stop)
+	finally:
+		DISPLAY.stop()
 
 if __name__ == '__main__':
-	register_hotkeys()
-	if wait_regions():
-		main_loop()
+	main()
@@ -0,0 +1,141 @@
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List
+from config import CONFIG
+from display import DISPLAY
+
+# 延迟直方图桶上界（秒），与 Prometheus histogram 的 le 对应
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def log(*args, **kwargs):
+    """控制台日志；console_log=False 时直接丢弃，否则按 display_mode 交给 DISPLAY 输出。"""
+    if CONFIG.console_log:
+        DISPLAY.log(*args, **kwargs)
+
+class _Histogram:
+    def __init__(self, window: int):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        data = sorted(self.recent)
+        return data[min(int(q * len(data)), len(data) - 1)]
+
+class Metrics:
+    """各阶段耗时、计数器与滚动延迟直方图，按迭代写 JSONL 并刷新 Prometheus 文本文件。
+
+    是否开启每次调用时读取 CONFIG.metrics_enabled，模块导入后（如命令行 --metrics）再开启同样生效；
+    关闭时计时包装只多一次判断、incr 直接返回，热路径上几乎没有额外开销。
+    """
+
+    def __init__(self):
+        # 进程启动（导入本模块）的时刻，用于统计启动到首次交换的用时
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.hists: Dict[str, _Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._iter_spans: Dict[str, float] = {}
+        self._iter_counters: Dict[str, int] = {}
+        self._jsonl = None
+
+    @property
+    def enabled(self) -> bool:
+        return CONFIG.metrics_enabled
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self.hists.get(name)
+            if hist is None:
+                hist = self.hists[name] = _Histogram(CONFIG.metrics_window)
+            hist.observe(seconds)
+            self._iter_spans[name] = self._iter_spans.get(name, 0.0) + seconds
+
+    def incr(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            self._iter_counters[name] = self._iter_counters.get(name, 0) + n
+
+    def instrument(self, obj, *methods: str):
+        """把 obj 的若干方法替换为计时包装；包装在调用时才检查是否开启，未开启时直接调用原方法。"""
+        for name in methods:
+            func = getattr(obj, name)
+
+            @functools.wraps(func)
+            def timed(*args, _func=func, _name=name, **kwargs):
+                if not CONFIG.metrics_enabled:
+                    return _func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return _func(*args, **kwargs)
+                finally:
+                    self.observe(_name, time.perf_counter() - start)
+
+            setattr(obj, name, timed)
+        return obj
+
+    def end_iteration(self, iteration: int, **fields):
+        """一次迭代结束：追加一行 JSONL，并重写 Prometheus 文件。"""
+        if not self.enabled:
+            return
+        with self._lock:
+            record = {
+                'ts': time.time(),
+                'iteration': iteration,
+                'spans': {k: round(v, 6) for k, v in self._iter_spans.items()},
+                'counters': dict(self._iter_counters),
+                'p50': {k: round(h.quantile(0.5), 6) for k, h in self.hists.items()},
+                'p95': {k: round(h.quantile(0.95), 6) for k, h in self.hists.items()},
+            }
+            record.update(fields)
+            self._iter_spans.clear()
+            self._iter_counters.clear()
+            if self._jsonl is None:
+                self._jsonl = open(CONFIG.metrics_jsonl, 'a', encoding='utf-8')
+            self._jsonl.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._jsonl.flush()
+            text = self.prometheus_text()
+        path = Path(CONFIG.metrics_prom)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        tmp.write_text(text, encoding='utf-8')
+        tmp.replace(path)
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = []
+        if self.hists:
+            lines.append('# HELP xxl_stage_seconds Stage latency in seconds')
+            lines.append('# TYPE xxl_stage_seconds histogram')
+            for name, h in sorted(self.hists.items()):
+                acc = 0
+                for le, n in zip(BUCKETS + (float('inf'),), h.counts):
+                    acc += n
+                    le_text = '+Inf' if le == float('inf') else repr(le)
+                    lines.append(f'xxl_stage_seconds_bucket{{stage="{name}",le="{le_text}"}} {acc}')
+                lines.append(f'xxl_stage_seconds_sum{{stage="{name}"}} {h.total}')
+                lines.append(f'xxl_stage_seconds_count{{stage="{name}"}} {h.count}')
+        if self.counters:
+            lines.append('# HELP xxl_events_total Event counters')
+            lines.append('# TYPE xxl_events_total counter')
+            for name, n in sorted(self.counters.items()):
+                lines.append(f'xxl_events_total{{event="{name}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
@@ -0,0 +1,197 @@
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from capture import LockedCapture, ScreenCapture
+from config import CONFIG
+from templates import TEMPLATES
+from detection import CAPTURE, BoardRecognizer, RegionManager, load_profiles, tile_fingerprints
+from solver import MovePlanner, SpeculativeSearch, make_solver
+from actions import ACTIONS, connect_async
+from metrics import METRICS, log
+from tuning import TUNER
+
+class Board:
+    """一个棋盘的运行状态。
+
+    settling(等待动画结束) -> thinking(线程池中识别+求解+规划) -> acting(在执行队列中) -> settling ...
+    求解引擎、预测搜索与规划器都带内部状态，每个棋盘各用一份。
+    """
+
+    def __init__(self, regions: RegionManager, capture):
+        self.regions = regions
+        self.name = regions.name
+        self.recognizer = METRICS.instrument(BoardRecognizer(regions, capture), 'recognize_board')
+        self.speculator = SpeculativeSearch(make_solver(CONFIG.solver_engine), CONFIG.solver_engine)
+        self.planner = MovePlanner()
+        self.state = 'settling'
+        self.finished = False
+        # 上一批交换执行完的时刻 (perf_counter)，0 表示尚未行动
+        self.acted_at = 0.0
+        self.prev_fp: Optional[np.ndarray] = None
+        self.still = 0
+        # 当前静止窗口第一帧的时刻 (perf_counter)
+        self.still_since = 0.0
+        self.iterations = 0
+
+    def watch(self, imgs: Dict[str, np.ndarray]) -> bool:
+        """喂入一帧，返回棋盘与分数区是否已连续 stable_frames 帧、且至少 stable_min_still 秒静止。"""
+        parts = [tile_fingerprints(imgs['board'], CONFIG.rows, CONFIG.cols).mean(axis=2).ravel()]
+        if 'score' in imgs:
+            parts.append(tile_fingerprints(imgs['score'], 1, 4).mean(axis=2).ravel())
+        fp = np.concatenate(parts)
+        if self.prev_fp is not None and self.prev_fp.shape == fp.shape and \
+                float(np.abs(fp - self.prev_fp).max()) < CONFIG.board_motion_threshold:
+            self.still += 1
+        else:
+            self.still = 0
+            self.still_since = time.perf_counter()
+        self.prev_fp = fp
+        return self.still >= CONFIG.stable_frames - 1 and \
+            time.perf_counter() - self.still_since >= CONFIG.stable_min_still
+
+class MultiBoardRunner:
+    """同一进程同时玩多个棋盘。
+
+    - 所有棋盘共用一套模板库和一个截图会话：调度线程每轮一次截取所有等待中的棋盘判断是否静止；
+    - 静止的棋盘交给 multi_workers 个线程的线程池做识别、求解与规划；
+    - 各棋盘规划出的交换进入同一个先进先出的执行队列，由唯一的执行线程串行驱动串口，
+      一个棋盘播放动画时执行线程去操作其他棋盘，等待时间被重叠掉。
+    """
+
+    def __init__(self, profiles: List[RegionManager]):
+        self.stop = threading.Event()
+        # mss 句柄不能跨线程使用，实时模式下新建一个会话供各线程加锁共用；录制/回放来源直接共用
+        self.capture = LockedCapture(ScreenCapture() if CONFIG.capture_mode == 'live' else CAPTURE)
+        self.boards = [Board(regions, self.capture) for regions in profiles]
+        self.pool = ThreadPoolExecutor(max(CONFIG.multi_workers, 1), thread_name_prefix='multi-solve')
+        self.jobs: queue.Queue = queue.Queue()
+        self.actuator = threading.Thread(target=self._actuate, name='multi-actuator', daemon=True)
+        self.swaps = 0
+
+    def _think(self, board: Board, img: np.ndarray):
+        try:
+            rec = board.recognizer.recognize_board(img)
+            if rec is None:
+                board.state = 'settling'
+                return
+            names, confs = rec
+            move, score, matches = board.speculator.find_best_move(names)
+            board.iterations += 1
+            if not move:
+                log(f'[WARN] {board.name} 无可行交换，停止该棋盘')
+                board.finished = True
+                return
+            batch = board.planner.plan(names, move, matches)
+            log(f'[STEP] {board.name} 第 {board.iterations} 步 交换 {batch} 得分={score}')
+            board.state = 'acting'
+            self.jobs.put((board, names, batch))
+        except Exception as e:
+            log(f'[ERROR] {board.name} 识别/求解失败: {e}')
+            board.state = 'settling'
+
+    def _actuate(self):
+        while not self.stop.is_set():
+            try:
+                board, names, batch = self.jobs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                ACTIONS.swap_batch(batch, board.regions, board.recognizer)
+                self.swaps += len(batch)
+            except Exception as e:
+                # 执行线程只有一个，出错时记录后继续服务其他棋盘，该棋盘重新等待稳定后识别
+                log(f'[ERROR] {board.name} 执行交换失败: {e}')
+            finally:
+                # 预测搜索必须在棋盘回到 settling 之前启动，否则识别线程可能同时调用 stop()
+                board.speculator.start(names, batch)
+                board.acted_at = time.perf_counter()
+                board.prev_fp = None
+                board.still = 0
+                board.state = 'settling'
+
+    def _poll(self):
+        """截取所有过了 stable_min_wait 的等待中棋盘，静止（或等待超时）的送去识别。"""
+        now = time.perf_counter()
+        waiting = [b for b in self.boards
+                   if b.state == 'settling' and not b.finished and now - b.acted_at >= CONFIG.stable_min_wait]
+        if not waiting:
+            return
+        regions = {}
+        for i, b in enumerate(waiting):
+            regions[f'board{i}'] = b.regions.board_region
+            if b.regions.score_ready():
+                regions[f'score{i}'] = b.regions.score_region
+        imgs = self.capture.grab_regions(regions)
+        if imgs is None:
+            return
+        for i, b in enumerate(waiting):
+            own = {'board': imgs[f'board{i}']}
+            if f'score{i}' in imgs:
+                own['score'] = imgs[f'score{i}']
+            settled = b.watch(own)
+            if not settled and b.acted_at and now - b.acted_at > CONFIG.stable_timeout:
+                log(f'[WARN] {b.name} 长时间未稳定，强制继续')
+                METRICS.incr('stable_timeouts')
+                settled = True
+            if settled:
+                b.state = 'thinking'
+                # 截图可能是会被下一次截图覆盖的视图，交给线程池前拷贝
+                self.pool.submit(self._think, b, own['board'].copy())
+
+    def run(self, should_stop: Callable[[], bool]) -> None:
+        log(f'[INFO] 多棋盘模式: {len(self.boards)} 个棋盘, {CONFIG.multi_workers} 个求解线程')
+        self.actuator.start()
+        start = time.perf_counter()
+        try:
+            while not should_stop() and not all(b.finished for b in self.boards):
+                self._poll()
+                time.sleep(CONFIG.stable_poll_min)
+        finally:
+            self.stop.set()
+            self.pool.shutdown(wait=True)
+            self.actuator.join(timeout=5)
+            for b in self.boards:
+                b.speculator.stop()
+            elapsed = time.perf_counter() - start
+            log(f'[INFO] 多棋盘结束: {self.swaps} 次交换 用时 {elapsed:.1f}s '
+                f'({self.swaps / max(elapsed, 1e-6) * 60:.1f} 次/分钟)')
+
+def add_profile():
+    """用标定热键新增一个棋盘配置，保存到 config.json 的 boards 列表。"""
+    from main import register_hotkeys, wait_regions
+    regions = RegionManager(len(load_profiles()))
+    register_hotkeys(regions)
+    return wait_regions(regions)
+
+def main():
+    import keyboard
+    parser = argparse.ArgumentParser(description='多棋盘模式：按 config.json 中的 boards 同时玩多个棋盘')
+    parser.add_argument('--add', action='store_true', help='用热键标定并新增一个棋盘配置')
+    args = parser.parse_args()
+    if args.add:
+        add_profile()
+        return
+    profiles = [p for p in load_profiles() if p.ready()]
+    if not profiles:
+        log('[ERROR] config.json 中没有已标定的棋盘，请先运行 python multiboard.py --add')
+        return
+    connect_async()
+    log('[INFO] 加载模板...')
+    TEMPLATES.load_templates(profiles[0].tile_size())
+    if len(TEMPLATES.names) < 4:
+        log('[ERROR] 模板不足，退出')
+        return
+    TUNER.load()
+    ACTIONS._lazy_get()
+    if CONFIG.auto_tune:
+        # 在线调参按单个棋盘的一次交换-等待测量，多棋盘交错执行时测不准，只沿用已保存的结果
+        log('[INFO] 多棋盘模式下关闭在线自动调参')
+        CONFIG.auto_tune = False
+    MultiBoardRunner(profiles).run(lambda: keyboard.is_pressed(CONFIG.hotkey_exit))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+import numpy as np
+from capture import ScreenCapture
+from config import CONFIG
+from detection import REGIONS, CAPTURE, BOARD_RECOGNIZER, tile_fingerprints
+from solver import PLANNER, SPECULATOR
+from actions import ACTIONS
+from metrics import METRICS, log
+from tuning import TUNER
+
+@dataclass
+class Frame:
+    seq: int
+    t: float            # 截图完成时刻 (perf_counter)
+    img: np.ndarray
+    settled: bool       # 与之前 stable_frames-1 帧相比棋盘已静止，且静止满 stable_min_still 秒
+
+class FrameGrabber(threading.Thread):
+    """截图线程：持续抓取棋盘放入有界队列，队列满时丢弃最旧的帧。"""
+
+    def __init__(self, stop: threading.Event):
+        super().__init__(name='grabber', daemon=True)
+        self.stop = stop
+        self.frames: queue.Queue = queue.Queue(maxsize=max(CONFIG.pipeline_queue_size, 1))
+        self.dropped = 0
+
+    def _offer(self, frame: Frame):
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        # 实时模式下本线程自建截图会话；录制来源内部加锁、且每个线程各用一个 mss 句柄，可与其他线程共用
+        capture = ScreenCapture() if CONFIG.capture_mode == 'live' else CAPTURE
+        prev_fp = None
+        still = 0
+        still_since = 0.0
+        seq = 0
+        while not self.stop.is_set():
+            img = capture.grab_region(REGIONS.board_region, 'board')
+            t = time.perf_counter()
+            if img is None:
+                time.sleep(CONFIG.poll_interval)
+                continue
+            fp = tile_fingerprints(img, CONFIG.rows, CONFIG.cols)
+            if prev_fp is not None and np.abs(fp - prev_fp).mean(axis=2).max() < CONFIG.board_motion_threshold:
+                still += 1
+            else:
+                still = 0
+                still_since = t
+            prev_fp = fp
+            seq += 1
+            self._offer(Frame(seq, t, img, still >= CONFIG.stable_frames - 1 and t - still_since >= CONFIG.stable_min_still))
+            time.sleep(CONFIG.stable_poll_min)
+
+class Actuator(threading.Thread):
+    """执行线程：串行执行一批交换，完成后记录时刻并置 idle。"""
+
+    def __init__(self, stop: threading.Event):
+        super().__init__(name='actuator', daemon=True)
+        self.stop = stop
+        self.jobs: queue.Queue = queue.Queue(maxsize=1)
+        self.idle = threading.Event()
+        self.idle.set()
+        self.done_at = 0.0
+
+    def submit(self, moves):
+        self.idle.clear()
+        self.jobs.put(moves)
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                moves = self.jobs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                ACTIONS.swap_batch(moves)
+            except Exception as e:
+                # 执行线程只有一个，出错时记录后继续服务后续交换，结果交给下一次识别判断
+                log(f'[ERROR] 执行交换失败: {e}')
+            finally:
+                self.done_at = time.perf_counter()
+                self.idle.set()
+
+class PipelineRunner:
+    """流水线主循环：截图、识别+求解、执行三段重叠。
+
+    识别只接受在上一次交换完成 stable_min_wait 之后截取、且棋盘已静止的最新帧，
+    因此与单线程循环一样不会基于过期棋盘行动。
+    """
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.grabber = FrameGrabber(self.stop)
+        self.actuator = Actuator(self.stop)
+
+    def _next_frame(self, not_before: float) -> Optional[Frame]:
+        """取最新的已静止帧；超时则退回最新的一帧并告警。"""
+        deadline = time.perf_counter() + CONFIG.stable_timeout
+        latest: Optional[Frame] = None
+        while time.perf_counter() < deadline and not self.stop.is_set():
+            try:
+                frame = self.grabber.frames.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if frame.t < not_before:
+                continue
+            latest = frame
+            best = frame if frame.settled else None
+            # 排空队列，只保留最新的静止帧
+            while True:
+                try:
+                    frame = self.grabber.frames.get_nowait()
+                except queue.Empty:
+                    break
+                latest = frame
+                if frame.settled:
+                    best = frame
+            if best is not None:
+                return best
+        if latest is not None:
+            log('[WARN] 棋盘长时间未稳定，使用最新一帧继续')
+            METRICS.incr('stable_timeouts')
+        return latest
+
+    def run(self, should_stop: Callable[[], bool], report: Callable) -> None:
+        self.grabber.start()
+        self.actuator.start()
+        iteration = 0
+        try:
+            while not should_stop():
+                if not self.actuator.idle.wait(timeout=0.1):
+                    continue
+                not_before = self.actuator.done_at + (CONFIG.stable_min_wait if iteration else 0.0)
+                frame = self._next_frame(not_before)
+                if frame is None:
+                    continue
+                iteration += 1
+                log(f"\n[STEP] ===== Iteration {iteration} (frame {frame.seq}, 丢弃 {self.grabber.dropped}) =====")
+                rec = BOARD_RECOGNIZER.recognize_board(frame.img)
+                if rec is None:
+                    time.sleep(0.5)
+                    continue
+                board, confs = rec
+                if TUNER.after_recognize(board, BOARD_RECOGNIZER):
+                    ACTIONS.resync_cursor()
+                move, score, matches = SPECULATOR.find_best_move(board)
+                report(board, move, score, matches)
+                METRICS.end_iteration(iteration, score=score)
+                if not move:
+                    log('[WARN] 无可行交换，结束')
+                    break
+                batch = PLANNER.plan(board, move, matches)
+                TUNER.before_swap(board)
+                self.actuator.submit(batch)
+                SPECULATOR.start(board, batch)
+        finally:
+            SPECULATOR.stop()
+            self.stop.set()
+            self.actuator.idle.wait(timeout=5)
@@ -0,0 +1,209 @@
+import argparse
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+from config import CONFIG
+from metrics import METRICS, log
+
+# 每个数字归一化后的尺寸 (w, h)；数字按分数区内全部字符共同的上下边界裁剪，左右补白到 DIGIT_ASPECT 的宽高比
+DIGIT_SIZE = (12, 16)
+DIGIT_ASPECT = 0.75
+# 高度不足字符带高度该比例的连通列段（逗号、小数点、噪点）不算数字
+MIN_GLYPH_HEIGHT = 0.5
+# 连续读取失败这么多次后不再用读数判断稳定，退回像素差（已载入的数字模板可能与游戏字体不符）
+MAX_FAILURES = 50
+
+def _binarize(img: np.ndarray) -> np.ndarray:
+    """灰度 + Otsu 阈值，返回前景（数字）掩码；前景占多数时认为是深色字、浅色底，取反。"""
+    gray = cv2.cvtColor(np.ascontiguousarray(img[:, :, :3]), cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    fg = bw > 0
+    return ~fg if fg.mean() > 0.5 else fg
+
+def _split(fg: np.ndarray) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """由前景掩码返回字符带（全部字符共同的上下边界内的掩码）与其中各数字的列范围，从左到右。"""
+    rows = np.flatnonzero(fg.any(axis=1))
+    if rows.size == 0:
+        return fg[:0], []
+    band = fg[rows[0]:rows[-1] + 1]
+    # 按列投影切分：有前景的连续列为一个字符
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], band.any(axis=0).view(np.int8), [0]))))
+    spans = []
+    for start, end in zip(edges[0::2], edges[1::2]):
+        ys = np.flatnonzero(band[:, start:end].any(axis=1))
+        if ys[-1] - ys[0] + 1 >= band.shape[0] * MIN_GLYPH_HEIGHT:
+            spans.append((int(start), int(end)))
+    return band, spans
+
+def segment(img: np.ndarray) -> np.ndarray:
+    """把分数区图像切成数字，返回 (N, D) 的归一化特征（每行零均值、单位长度），N 为从左到右的数字个数。"""
+    return _features(*_split(_binarize(img)))
+
+def _features(band: np.ndarray, spans: List[Tuple[int, int]]) -> np.ndarray:
+    if not spans:
+        return np.empty((0, DIGIT_SIZE[0] * DIGIT_SIZE[1]), dtype=np.float32)
+    h = band.shape[0]
+    width = max(int(round(h * DIGIT_ASPECT)), 1)
+    feats = np.empty((len(spans), DIGIT_SIZE[0] * DIGIT_SIZE[1]), dtype=np.float32)
+    for i, (start, end) in enumerate(spans):
+        w = end - start
+        canvas = np.zeros((h, max(w, width)), dtype=np.float32)
+        x0 = (canvas.shape[1] - w) // 2
+        canvas[:, x0:x0 + w] = band[:, start:end]
+        feats[i] = cv2.resize(canvas, DIGIT_SIZE, interpolation=cv2.INTER_AREA).ravel()
+    feats -= feats.mean(axis=1, keepdims=True)
+    return feats / np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-6)
+
+class ScoreReader:
+    """读取分数区的数值。
+
+    分数区二值化后按列投影切出各个数字，所有数字一次矩阵乘法与数字模板（score_digit_dir 下的
+    0.png ~ 9.png，同一数字可有多张，如 3_1.png）做归一化相关，取最相似的模板；任一数字相似度低于
+    score_min_confidence 时返回 None。模板可用 `python score_reader.py learn <当前分数>` 从屏幕采集。
+    """
+
+    def __init__(self):
+        self._bank: Optional[np.ndarray] = None
+        self._labels: Optional[np.ndarray] = None
+        self._loaded = False
+        self.failures = 0
+        # 最近一次确认（稳定后）的分数与时刻，供计算每步/每分钟得分
+        self.value: Optional[int] = None
+        self.first_value: Optional[int] = None
+        self.first_at = 0.0
+        self.reads = 0
+
+    def _load(self):
+        self._loaded = True
+        folder = Path(__file__).parent / CONFIG.score_digit_dir
+        feats, labels = [], []
+        for file in sorted(folder.glob('*.png')):
+            digit = file.stem[:1]
+            img = cv2.imread(str(file), cv2.IMREAD_GRAYSCALE)
+            if not digit.isdigit() or img is None:
+                continue
+            # 模板保存时已是二值掩码，不再做阈值（单个粗体数字前景可能过半）
+            f = _features(*_split(img > 127))
+            if len(f) == 1:
+                feats.append(f[0])
+                labels.append(int(digit))
+            else:
+                log(f'[WARN] 数字模板 {file.name} 切分出 {len(f)} 个字符，已忽略')
+        if feats:
+            self._bank = np.stack(feats)
+            self._labels = np.array(labels)
+            log(f'[INFO] 已加载数字模板 {len(labels)} 张，覆盖数字 {sorted(set(labels))}')
+
+    @property
+    def ready(self) -> bool:
+        """数字模板已载入且最近读取没有持续失败。"""
+        if not CONFIG.score_reader:
+            return False
+        if not self._loaded:
+            self._load()
+        return self._bank is not None and self.failures < MAX_FAILURES
+
+    def add_digits(self, img: np.ndarray, text: str, replace: bool = False) -> int:
+        """用一张已知数值的分数区图像补充模板（不写盘），返回加入的数字个数；字符数与 text 不符时不加入。
+
+        replace 为 True 时丢弃已有模板（模拟器使用自己的字体）。
+        """
+        feats = segment(img)
+        if len(feats) != len(text) or not text.isdigit():
+            return 0
+        labels = np.array([int(ch) for ch in text])
+        self._loaded = True
+        if replace:
+            self._bank = self._labels = None
+        self._bank = feats if self._bank is None else np.concatenate([self._bank, feats])
+        self._labels = labels if self._labels is None else np.concatenate([self._labels, labels])
+        return len(text)
+
+    def read(self, img: Optional[np.ndarray]) -> Optional[int]:
+        """读出分数；模板未就绪、没有数字或有数字认不出时返回 None。"""
+        if img is None or not self.ready:
+            return None
+        feats = segment(img)
+        if not len(feats):
+            self.failures += 1
+            return None
+        sims = feats @ self._bank.T
+        best = sims.argmax(axis=1)
+        if float(sims[np.arange(len(best)), best].min()) < CONFIG.score_min_confidence:
+            self.failures += 1
+            if self.failures == MAX_FAILURES:
+                log(f'[WARN] 分数连续 {MAX_FAILURES} 次读取失败，改用像素差判断分数区稳定')
+            return None
+        self.failures = 0
+        self.reads += 1
+        return int(''.join(str(d) for d in self._labels[best]))
+
+    def commit(self, value: Optional[int]) -> Optional[int]:
+        """一步结束、画面稳定后的分数：返回相对上一步的增量，并记录到日志与 METRICS。"""
+        if value is None:
+            return None
+        now = time.perf_counter()
+        prev, self.value = self.value, value
+        if self.first_value is None:
+            self.first_value, self.first_at = value, now
+        if prev is None:
+            log(f'[STEP] 当前分数 {value}')
+            return None
+        delta = value - prev
+        METRICS.incr('points', max(delta, 0))
+        elapsed = now - self.first_at
+        rate = (value - self.first_value) / elapsed * 60 if elapsed > 0 else 0.0
+        log(f'[STEP] 分数 {prev} -> {value} (+{delta}) 每分钟 {rate:.0f}')
+        return delta
+
+SCORE_READER = METRICS.instrument(ScoreReader(), 'read')
+
+def save_digits(img: np.ndarray, text: str, folder: Path) -> int:
+    """把已知数值的分数区图像切成数字，逐个保存为 <数字>.png（已存在时为 <数字>_<n>.png），返回保存的个数。"""
+    band, spans = _split(_binarize(img))
+    if len(spans) != len(text) or not text.isdigit():
+        log(f'[ERROR] 分数区切分出 {len(spans)} 个字符，与 {text} 不符')
+        return 0
+    folder.mkdir(parents=True, exist_ok=True)
+    for ch, (start, end) in zip(text, spans):
+        # 四周各留 2 像素空白，单独加载时仍切分为一个字符
+        glyph = np.zeros((band.shape[0] + 4, end - start + 4), dtype=np.uint8)
+        glyph[2:-2, 2:-2] = band[:, start:end] * 255
+        path, n = folder / f'{ch}.png', 0
+        while path.exists():
+            n += 1
+            path = folder / f'{ch}_{n}.png'
+        cv2.imwrite(str(path), glyph)
+    return len(spans)
+
+def main():
+    parser = argparse.ArgumentParser(description='分数读取：采集数字模板 / 读取当前分数')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_learn = sub.add_parser('learn', help='截取分数区，按给出的当前分数切分并保存数字模板')
+    p_learn.add_argument('value', help='分数区当前显示的数值')
+    p_learn.add_argument('--image', help='改用已保存的分数区截图')
+    p_read = sub.add_parser('read', help='读取分数区当前数值')
+    p_read.add_argument('--image', help='改用已保存的分数区截图')
+    args = parser.parse_args()
+    if args.image:
+        img = cv2.imread(args.image)
+    else:
+        from detection import CAPTURE, REGIONS
+        if not REGIONS.score_ready():
+            log('[ERROR] 尚未设置分数区域')
+            return
+        img = CAPTURE.grab_region(REGIONS.score_region, 'score')
+    if img is None:
+        log('[ERROR] 截图失败')
+        return
+    if args.cmd == 'learn':
+        n = save_digits(img, args.value, Path(__file__).parent / CONFIG.score_digit_dir)
+        if n:
+            log(f'[STEP] 已保存 {n} 个数字模板到 {CONFIG.score_digit_dir}')
+        return
+    log(f'[STEP] 分数 = {SCORE_READER.read(img)}')
+
+if __name__ == '__main__':
+    main()
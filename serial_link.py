@@ -0,0 +1,108 @@
+import threading
+from typing import Dict, Optional
+from serial import SerialException
+
+# v2 串口协议（每行一条命令，id 为主机分配的序号，固件回复 "K id [信息]" 或 "E id 原因"）：
+#   V id                        -> K id V2   查询协议版本
+#   P id x y                    同步固件记录的光标绝对坐标
+#   A id x y                    移动到绝对坐标
+#   C id                        左键点击
+#   S id x1 y1 x2 y2 gap_ms [wait_ms]
+#                               交换：先等待 wait_ms（可省略），移到 (x1,y1) 点击，等待 gap_ms，移到 (x2,y2) 点击
+# 旧版 "M dx dy" / "c" 命令仍然保留，不回复。
+PROTOCOL_VERSION = 'V2'
+
+class SerialLink:
+    """v2 协议的非阻塞命令队列：send 只写入不等待，后台线程读取回执。
+
+    同时在途的命令数受 max_inflight 限制，避免溢出固件的串口缓冲区。
+    """
+
+    def __init__(self, ser, max_inflight: int = 4):
+        self.ser = ser
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(max_inflight, 1))
+        self._events: Dict[int, threading.Event] = {}
+        self._replies: Dict[int, str] = {}
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, name='serial-reader', daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        buf = b''
+        while not self._closed:
+            try:
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+            except (SerialException, OSError, TypeError):
+                break
+            if not chunk:
+                continue
+            buf += chunk
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                self._on_line(line.decode('ascii', 'replace').strip())
+
+    def _on_line(self, line: str):
+        parts = line.split(' ', 2)
+        if len(parts) < 2 or parts[0] not in ('K', 'E'):
+            return
+        try:
+            cid = int(parts[1])
+        except ValueError:
+            return
+        with self._lock:
+            event = self._events.get(cid)
+            if event is None:
+                return
+            self._replies[cid] = line
+            self._slots.release()
+        event.set()
+
+    def send(self, cmd: str, *args) -> int:
+        """写入一条命令并立即返回其 id；在途命令已满时阻塞等待空位。"""
+        self._slots.acquire()
+        with self._lock:
+            self._seq += 1
+            cid = self._seq
+            self._events[cid] = threading.Event()
+        line = ' '.join([cmd, str(cid)] + [str(int(a)) for a in args]) + '\n'
+        try:
+            self.ser.write(line.encode('ascii'))
+        except SerialException:
+            with self._lock:
+                self._events.pop(cid, None)
+            self._slots.release()
+            raise
+        return cid
+
+    def wait(self, cid: int, timeout: float) -> Optional[str]:
+        """等待命令回执，成功返回回执行，失败或超时返回 None。"""
+        event = self._events.get(cid)
+        if event is None:
+            return None
+        event.wait(timeout)
+        with self._lock:
+            self._events.pop(cid, None)
+            reply = self._replies.pop(cid, None)
+            if reply is None:
+                # 超时视为该命令已丢失，归还在途名额；回执若在超时后、取锁前到达，
+                # _on_line 已归还过，这里不再重复归还
+                self._slots.release()
+                return None
+        if reply.startswith('E'):
+            return None
+        return reply
+
+    def call(self, cmd: str, *args, timeout: float = 1.0) -> Optional[str]:
+        return self.wait(self.send(cmd, *args), timeout)
+
+    def handshake(self, timeout: float) -> bool:
+        reply = self.call('V', timeout=timeout)
+        return reply is not None and reply.endswith(PROTOCOL_VERSION)
+
+    def close(self):
+        """停止读取线程并等待其退出（串口本身由调用方关闭）。"""
+        self._closed = True
+        if self._reader is not threading.current_thread():
+            self._reader.join(timeout=1.0)
@@ -0,0 +1,443 @@
+import argparse
+import time
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from capture import CaptureSource
+
+# 模拟屏幕布局：游戏窗口内棋盘在左上角，分数区在棋盘正下方；窗口放在 SIM_SCREEN 大小的带纹理桌面上
+SIM_TILE = 64
+SCORE_GAP = 16
+SCORE_SIZE = (200, 48)  # (w, h)
+SIM_SCREEN = (1280, 800)  # (w, h)
+# 每一轮消除（含下落）的动画时长（秒）
+ANIM_STEP_SECONDS = 0.25
+POINTS_PER_TILE = 10
+HOLE = -1
+# 动画期间空洞亮度随时间渐变的级数，保证每次截图画面都在变化
+FADE_LEVELS = 8
+# 点击后经过该延迟格子才显示选中框；选中前的第二次点击会被游戏忽略
+SELECT_DELAY = 0.08
+
+def match_mask(board: np.ndarray) -> np.ndarray:
+    """标记所有处于横/竖 3 连及以上的格子（空洞 HOLE 不参与）。"""
+    mask = np.zeros(board.shape, dtype=bool)
+    h = (board[:, :-2] == board[:, 1:-1]) & (board[:, 1:-1] == board[:, 2:]) & (board[:, :-2] != HOLE)
+    mask[:, :-2] |= h
+    mask[:, 1:-1] |= h
+    mask[:, 2:] |= h
+    v = (board[:-2] == board[1:-1]) & (board[1:-1] == board[2:]) & (board[:-2] != HOLE)
+    mask[:-2] |= v
+    mask[1:-1] |= v
+    mask[2:] |= v
+    return mask
+
+class GameModel:
+    """消消乐规则模型：交换、消除、下落、按种子补充新块、计分。
+
+    无效交换（交换后不成三连）会被撤回；消除后棋盘无可行交换时重新洗牌。
+    计分 = 消除格数 * POINTS_PER_TILE * 连锁轮次。
+    """
+
+    def __init__(self, rows: int, cols: int, colors: int = 4, seed: int = 0):
+        self.rows = rows
+        self.cols = cols
+        self.colors = colors
+        self.reset(seed)
+
+    def reset(self, seed: int):
+        self.rng = np.random.default_rng(seed)
+        self.board = self._fresh()
+        self.score = 0
+        self.moves = 0
+        self.invalid = 0
+        self.shuffles = 0
+
+    def _fresh(self) -> np.ndarray:
+        while True:
+            board = self.rng.integers(0, self.colors, (self.rows, self.cols)).astype(np.int8)
+            mask = match_mask(board)
+            while mask.any():
+                board[mask] = self.rng.integers(0, self.colors, int(mask.sum()))
+                mask = match_mask(board)
+            if self.has_move(board):
+                return board
+
+    @staticmethod
+    def _swapped(board: np.ndarray, a, b) -> np.ndarray:
+        out = board.copy()
+        out[a], out[b] = board[b], board[a]
+        return out
+
+    def has_move(self, board: Optional[np.ndarray] = None) -> bool:
+        board = self.board if board is None else board
+        for r in range(self.rows):
+            for c in range(self.cols):
+                for b in ((r, c + 1), (r + 1, c)):
+                    if b[0] < self.rows and b[1] < self.cols and match_mask(self._swapped(board, (r, c), b)).any():
+                        return True
+        return False
+
+    def swap(self, a: Tuple[int, int], b: Tuple[int, int]) -> List[Tuple[np.ndarray, int]]:
+        """执行一次交换，返回每轮消除后的 (带空洞的棋盘, 当时分数)，供渲染动画。"""
+        if abs(a[0] - b[0]) + abs(a[1] - b[1]) != 1 or not all(
+                0 <= p[0] < self.rows and 0 <= p[1] < self.cols for p in (a, b)):
+            self.invalid += 1
+            return []
+        board = self._swapped(self.board, a, b)
+        mask = match_mask(board)
+        if not mask.any():
+            self.invalid += 1
+            return []
+        steps = []
+        chain = 0
+        while mask.any():
+            chain += 1
+            self.score += int(mask.sum()) * POINTS_PER_TILE * chain
+            holes = board.copy()
+            holes[mask] = HOLE
+            steps.append((holes, self.score))
+            for c in range(self.cols):
+                keep = board[~mask[:, c], c]
+                fill = self.rng.integers(0, self.colors, self.rows - len(keep))
+                board[:, c] = np.concatenate([fill, keep])
+            mask = match_mask(board)
+        self.board = board
+        self.moves += 1
+        if not self.has_move():
+            self.board = self._fresh()
+            self.shuffles += 1
+        return steps
+
+class SimCapture(CaptureSource):
+    """把 GameModel 渲染成“屏幕”：棋盘格用 templates/*.png 绘制，分数区绘制当前分数。
+
+    交换后按 ANIM_STEP_SECONDS 逐轮播放带空洞的中间棋盘与递增的分数，之后显示最终棋盘，
+    因此稳定检测与真实游戏一样需要等动画结束。
+    """
+
+    def __init__(self, game: GameModel, tile: int = SIM_TILE, anim_step: float = ANIM_STEP_SECONDS):
+        self.game = game
+        self.tile = tile
+        self.anim_step = anim_step
+        # 窗口大小 (w, h)
+        self.window = (max(game.cols * tile, SCORE_SIZE[0]), game.rows * tile + SCORE_GAP + SCORE_SIZE[1])
+        rng = np.random.default_rng(0)
+        w, h = SIM_SCREEN
+        desktop = np.linspace(40, 120, w, dtype=np.float32)[None, :, None] + rng.normal(0, 12, (h, w, 3))
+        self._desktop = np.clip(desktop, 0, 255).astype(np.uint8)
+        self._screen = self._desktop.copy()
+        self.move_window(0, 0)
+        self._tiles: Optional[np.ndarray] = None
+        self._timeline: List[Tuple[np.ndarray, int]] = []
+        self._t0 = 0.0
+        self._key = None
+        self._selected: Optional[Tuple[Tuple[int, int], float]] = None
+        # 最近一次截取棋盘时显示的棋盘，供统计识别错格
+        self.grabbed_board: Optional[np.ndarray] = None
+
+    def move_window(self, left: int, top: int):
+        """把游戏窗口移动到屏幕 (left, top)，棋盘与分数区随之移动。"""
+        height = self.game.rows * self.tile
+        self.origin = (left, top)
+        self.board_region = (left, top, left + self.game.cols * self.tile, top + height)
+        self.score_region = (left, top + height + SCORE_GAP, left + SCORE_SIZE[0], top + height + SCORE_GAP + SCORE_SIZE[1])
+        self._screen[:] = self._desktop
+        self._key = None
+
+    def screen_region(self):
+        return (0, 0, SIM_SCREEN[0], SIM_SCREEN[1])
+
+    def reset(self, seed: int):
+        self.game.reset(seed)
+        self._timeline = []
+        self._selected = None
+        self._key = None
+
+    def click(self, cell: Tuple[int, int]):
+        """第一次点击：SELECT_DELAY 后显示选中框。"""
+        self._selected = (cell, time.perf_counter() + SELECT_DELAY)
+
+    def selected(self) -> bool:
+        return self._selected is not None and time.perf_counter() >= self._selected[1]
+
+    def _tile_images(self) -> np.ndarray:
+        if self._tiles is None:
+            from templates import TEMPLATES
+            names = TEMPLATES.names[:self.game.colors]
+            if len(names) < self.game.colors:
+                raise RuntimeError(f'模拟需要 {self.game.colors} 个模板，当前只有 {len(names)} 个')
+            t = self.tile
+            tiles = [cv2.resize(TEMPLATES.templates[n], (t, t), interpolation=cv2.INTER_AREA) for n in names]
+            # 最后一个为空洞（消除后尚未下落），亮度在渲染时按动画进度设置
+            tiles.append(np.zeros((t, t, 3), dtype=np.uint8))
+            self._tiles = np.stack(tiles)
+        return self._tiles
+
+    def play(self, steps: List[Tuple[np.ndarray, int]]):
+        """开始播放一次交换产生的消除动画。"""
+        self._selected = None
+        self._timeline = steps
+        self._t0 = time.perf_counter()
+
+    def truth(self) -> np.ndarray:
+        """当前显示的棋盘（颜色下标，HOLE 为空洞）。"""
+        return self._state()[0]
+
+    def _state(self) -> Tuple[np.ndarray, int, int]:
+        """(显示的棋盘, 显示的分数, 空洞渐变级别)。"""
+        k, frac = divmod((time.perf_counter() - self._t0) / self.anim_step, 1.0)
+        k = int(k)
+        if k < len(self._timeline):
+            board, score = self._timeline[k]
+            return board, score, int(frac * FADE_LEVELS)
+        return self.game.board, self.game.score, 0
+
+    def _render(self):
+        board, score, fade = self._state()
+        sel = self._selected[0] if self.selected() else None
+        key = (self.game.moves, id(board), score, fade, sel)
+        if key == self._key:
+            return
+        self._key = key
+        rows, cols, t = self.game.rows, self.game.cols, self.tile
+        tiles = self._tile_images()
+        tiles[-1] = 30 + fade * 20
+        img = tiles[board]  # HOLE=-1 取到最后一个空洞块
+        x0, y0 = self.origin
+        view = self._screen[y0:y0 + rows * t, x0:x0 + cols * t]
+        view[:] = img.transpose(0, 2, 1, 3, 4).reshape(rows * t, cols * t, 3)
+        if sel is not None:
+            r, c = sel
+            cv2.rectangle(view, (c * t + 2, r * t + 2), (c * t + t - 3, r * t + t - 3), (255, 255, 255), 4)
+        left, top, right, bottom = self.score_region
+        area = self._screen[top:bottom, left:right]
+        area[:] = 0
+        cv2.putText(area, str(score), (8, bottom - top - 12), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+
+    def digit_sample(self) -> np.ndarray:
+        """用与分数区相同的字体渲染 0123456789，供分数读取建立数字模板。"""
+        area = np.zeros((SCORE_SIZE[1], 260, 3), dtype=np.uint8)
+        cv2.putText(area, '0123456789', (8, SCORE_SIZE[1] - 12), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        return area
+
+    def grab_region(self, region, kind: str = 'other'):
+        if not region:
+            return None
+        self._render()
+        if kind == 'board':
+            self.grabbed_board = self._state()[0]
+        left, top, right, bottom = (int(v) for v in region)
+        return self._screen[max(top, 0):bottom, max(left, 0):right]
+
+class SimMouseActions:
+    """替代 MouseActions（绑定到 actions.ACTIONS）：把交换算出的屏幕坐标换算回格子，交给 GameModel 执行。"""
+
+    def __init__(self, capture: SimCapture, recognizer, tuner):
+        self.capture = capture
+        self.recognizer = recognizer
+        self.tuner = tuner
+        self.misclicks = 0
+        self.dropped = 0
+
+    def _tile_point(self, r: int, c: int):
+        # 与 MouseActions._tile_point 相同：按当前棋盘区域与识别到的中心偏移计算点击坐标
+        from config import CONFIG
+        from detection import REGIONS
+        left, top, right, bottom = REGIONS.board_region
+        tile_w = (right - left) / CONFIG.cols
+        tile_h = (bottom - top) / CONFIG.rows
+        if self.recognizer.center_ratios is not None:
+            crx, cry = self.recognizer.center_ratios[r, c]
+        else:
+            crx = cry = 0.5
+        return int(left + c * tile_w + crx * tile_w), int(top + r * tile_h + cry * tile_h)
+
+    def _cell_at(self, x: int, y: int) -> Tuple[int, int]:
+        left, top, right, bottom = self.capture.board_region
+        game = self.capture.game
+        # 向下取整：点到棋盘左/上方时得到负下标，游戏按无效交换处理
+        return (y - top) * game.rows // (bottom - top), (x - left) * game.cols // (right - left)
+
+    def _grab_tile(self, r: int, c: int):
+        t = self.capture.tile
+        x0, y0 = self.capture.origin
+        return self.capture.grab_region((x0 + c * t, y0 + r * t, x0 + (c + 1) * t, y0 + (r + 1) * t))
+
+    def swap_tiles(self, a, b):
+        from config import CONFIG
+        cells = self._cell_at(*self._tile_point(*a)), self._cell_at(*self._tile_point(*b))
+        if cells != (tuple(a), tuple(b)):
+            self.misclicks += 1
+        if self.tuner.want_probe():
+            self.tuner.probe_select(lambda: self._grab_tile(*cells[0]), lambda: self.capture.click(cells[0]),
+                                    CONFIG.swap_click_interval)
+        else:
+            self.capture.click(cells[0])
+            time.sleep(CONFIG.swap_click_interval)
+        if not self.capture.selected():
+            # 第二次点击早于选中生效，游戏忽略本次交换
+            self.dropped += 1
+            return []
+        return self.capture.game.swap(*cells)
+
+    def resync_cursor(self):
+        # 模拟鼠标直接按格子点击，没有光标偏移
+        pass
+
+    def swap_batch(self, moves):
+        """依次执行一批交换；互不干扰的各步动画同时播放，时长取最长的一步。"""
+        from config import CONFIG
+        steps = []
+        for i, (a, b) in enumerate(moves):
+            if i:
+                time.sleep(CONFIG.plan_swap_gap)
+            s = self.swap_tiles(a, b)
+            if len(s) >= len(steps):
+                steps = s
+        self.capture.play(steps)
+
+def run_session(capture: SimCapture, engine: str, seconds: float, seed: int, drift: float = 0.0) -> Dict[str, float]:
+    """用模拟截图与模拟鼠标驱动 main.main_loop 跑 seconds 秒，返回吞吐统计。
+
+    截图来源与 ACTIONS 已由 main() 换成 SimCapture / SimMouseActions，循环本身与实机完全相同。
+    drift > 0 时每隔 drift 秒把游戏窗口随机移到屏幕另一处，检验自动定位的自愈。
+    """
+    from config import CONFIG
+    from actions import ACTIONS
+    from detection import SCORE_CHECKER
+    from locator import LOCATOR
+    from main import main_loop, report_move
+    from solver import PLANNER, SPECULATOR
+    from tuning import FLOORS, TUNER
+    capture.reset(seed)
+    actions = ACTIONS._lazy_get()
+    actions.misclicks = actions.dropped = 0
+    SPECULATOR.use_engine(engine)
+    PLANNER.cursor = None
+    TUNER.reset()
+    drift_rng = np.random.default_rng(seed)
+    next_drift = drift
+    locates = LOCATOR.locates
+    # 自动调参只在本次会话内生效，结束后恢复
+    saved_timings = {name: getattr(CONFIG, name) for name in FLOORS}
+    # 动画中截到的空洞 HOLE=-1 恰好索引到 'UNKNOWN'
+    from templates import TEMPLATES
+    names = np.array(TEMPLATES.names + ['UNKNOWN'])
+    # 识别错格数；稳定后读到的分数与游戏实际分数不符 / 读不出的次数
+    stats = {'iterations': 0, 'wrong': 0, 'misreads': 0, 'unread': 0}
+    start = time.perf_counter()
+
+    def should_stop() -> bool:
+        nonlocal next_drift
+        now = time.perf_counter() - start
+        if drift > 0 and now >= next_drift:
+            next_drift += drift
+            capture.move_window(int(drift_rng.integers(0, SIM_SCREEN[0] - capture.window[0] + 1)),
+                                int(drift_rng.integers(0, SIM_SCREEN[1] - capture.window[1] + 1)))
+        return now >= seconds
+
+    def report(board, move, score, matches):
+        stats['wrong'] += int((board != names[capture.grabbed_board]).sum())
+        # 上一步稳定后读到的分数；稳定之后到这次识别之间游戏分数没有变化
+        if stats['iterations'] and not CONFIG.pipelined:
+            if SCORE_CHECKER.score_value is None:
+                stats['unread'] += 1
+            elif SCORE_CHECKER.score_value != capture.game.score:
+                stats['misreads'] += 1
+        stats['iterations'] += 1
+        report_move(board, move, score, matches)
+
+    main_loop(should_stop, report)
+    elapsed = time.perf_counter() - start
+    SPECULATOR.stop()
+    tuned = {name: getattr(CONFIG, name) for name in FLOORS}
+    for name, value in saved_timings.items():
+        setattr(CONFIG, name, value)
+    game = capture.game
+    return {
+        'seconds': elapsed,
+        'iterations': stats['iterations'],
+        'moves': game.moves,
+        'points': game.score,
+        'moves_per_min': game.moves / elapsed * 60 if elapsed > 0 else 0.0,
+        'points_per_min': game.score / elapsed * 60 if elapsed > 0 else 0.0,
+        'invalid': game.invalid,
+        'misclicks': actions.misclicks,
+        'wrong_tiles': stats['wrong'],
+        'spec_hit_rate': SPECULATOR.hit_rate,
+        'spec_saved_ms': SPECULATOR.saved * 1000,
+        'dropped_swaps': actions.dropped,
+        'tune_backoffs': TUNER.backoffs,
+        'timings': tuned,
+        'relocations': LOCATOR.locates - locates,
+        'score_misreads': stats['misreads'],
+        'score_unread': stats['unread'],
+        'locate_ms': LOCATOR.last_seconds * 1000,
+    }
+
+def main():
+    from config import CONFIG
+    parser = argparse.ArgumentParser(description='无头模拟器：测量各求解引擎/识别后端的每分钟步数与得分')
+    parser.add_argument('--seconds', type=float, default=30.0, help='每个配置运行的时长')
+    parser.add_argument('--engines', default=CONFIG.solver_engine, help='逗号分隔，如 python,bitboard,vector')
+    parser.add_argument('--backends', default=CONFIG.classifier_backend, help='逗号分隔: template,color')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anim', type=float, default=ANIM_STEP_SECONDS, help='每轮消除动画时长（秒）')
+    parser.add_argument('--plan', type=int, default=CONFIG.plan_max_moves, help='每帧最多执行的交换数（plan_max_moves）')
+    parser.add_argument('--speculate', action='store_true', help='开启预测搜索（speculative_search）')
+    parser.add_argument('--tune', action='store_true', help='开启自动调参（auto_tune）')
+    parser.add_argument('--locate', action='store_true', help='窗口放在屏幕中部，启动时自动定位而不是直接使用已知区域')
+    parser.add_argument('--drift', type=float, default=0.0, help='每隔多少秒随机移动一次游戏窗口（0 为不移动）')
+    parser.add_argument('--verbose', action='store_true', help='输出循环日志')
+    args = parser.parse_args()
+    CONFIG.console_log = args.verbose
+    CONFIG.auto_tune = CONFIG.auto_tune or args.tune
+    CONFIG.plan_max_moves = args.plan
+    CONFIG.speculative_search = CONFIG.speculative_search or args.speculate
+    CONFIG.capture_mode = 'sim'
+    CONFIG.auto_locate = args.locate or args.drift > 0
+    import detection
+    from actions import ACTIONS
+    from locator import LOCATOR
+    from metrics import METRICS
+    from templates import TEMPLATES
+    from tuning import TUNER
+    from score_reader import SCORE_READER
+    capture = detection.CAPTURE
+    capture.anim_step = args.anim
+    # 串口换成模拟鼠标，主循环其余部分与实机相同
+    ACTIONS._lazy_bind(lambda: METRICS.instrument(
+        SimMouseActions(capture, detection.BOARD_RECOGNIZER, TUNER), 'swap_tiles', 'swap_batch'))
+    SCORE_READER.add_digits(capture.digit_sample(), '0123456789', replace=True)
+    # 区域与调参结果只改内存，不读写 config.json
+    LOCATOR.persist = False
+    TUNER.persist = False
+    detection.REGIONS.timings = {}
+    if args.locate:
+        capture.move_window((SIM_SCREEN[0] - capture.window[0]) // 2, (SIM_SCREEN[1] - capture.window[1]) // 2)
+        detection.REGIONS.board_region = detection.REGIONS.score_region = None
+        if not LOCATOR.locate():
+            return []
+    else:
+        detection.REGIONS.board_region = capture.board_region
+        detection.REGIONS.score_region = capture.score_region
+    results = []
+    for backend in args.backends.split(','):
+        CONFIG.classifier_backend = backend
+        TEMPLATES.classifier = None
+        TEMPLATES.load_templates(detection.REGIONS.tile_size())
+        for engine in args.engines.split(','):
+            stats = run_session(capture, engine, args.seconds, args.seed, args.drift)
+            results.append((engine, backend, stats))
+            print(f"[STEP] engine={engine:9s} backend={backend:8s} 步数={stats['moves']} 得分={stats['points']} "
+                  f"步/分={stats['moves_per_min']:.1f} 分/分={stats['points_per_min']:.0f} "
+                  f"识别错格={stats['wrong_tiles']} 无效交换={stats['invalid']} "
+                  f"预测命中率={stats['spec_hit_rate']:.0%} 省时={stats['spec_saved_ms']:.0f}ms "
+                  f"丢失交换={stats['dropped_swaps']} 调参退回={stats['tune_backoffs']} "
+                  f"重新定位={stats['relocations']} 定位用时={stats['locate_ms']:.0f}ms "
+                  f"读分错误={stats['score_misreads']} 读分失败={stats['score_unread']}")
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,31 @@
-from typing import List, Tuple, Optional
+import heapq
+import math
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple, Optional
 import numpy as np
 from config import CONFIG
+from metrics import METRICS, log
 
 Move = Tuple[Tuple[int,int], Tuple[int,int]]
 
+def score_matches(matches: List[List[Tuple[int,int]]]) -> int:
+    if not matches:
+        return 0
+    lengths = [len(g) for g in matches]
+    max_len = max(lengths) if lengths else 0
+    unique_cells = set()
+    for group in matches:
+        for cell in group:
+            unique_cells.add(cell)
+    unique_count = len(unique_cells)
+    total_len = sum(lengths)
+    # 优先最大连线长度，其次唯一消除格数，再次总连线长度
+    return max_len * 1000 + unique_count * 10 + total_len
+
 class Solver:
     def find_matches(self, board: np.ndarray) -> List[List[Tuple[int,int]]]:
         matches = []
@@ -37,19 +59,20 @@ class Solver:
         (r1,c1),(r2,c2) = a,b
         temp[r1,c1], temp[r2,c2] = temp[r2,c2], temp[r1,c1]
         matches = self.find_matches(temp)
-        score = 0
-        if matches:
-            lengths = [len(g) for g in matches]
-            max_len = max(lengths) if lengths else 0
-            unique_cells = set()
-            for group in matches:
-                for cell in group:
-                    unique_cells.add(cell)
-            unique_count = len(unique_cells)
-            total_len = sum(lengths)
-            # 优先最大连线长度，其次唯一消除格数，再次总连线长度
-            score = max_len * 1000 + unique_count * 10 + total_len
-        return score, matches
+        return score_matches(matches), matches
+
+    def swap_scores(self, board: np.ndarray) -> List[Tuple[int, Move]]:
+        """所有得分大于 0 的相邻交换 (得分, 交换)，按扫描顺序；多步规划据此挑选候选，各引擎结果相同。"""
+        rows, cols = board.shape
+        out = []
+        for r in range(rows):
+            for c in range(cols):
+                for b in ((r, c+1), (r+1, c)):
+                    if b[0] < rows and b[1] < cols:
+                        score, _ = self.evaluate_swap(board, (r, c), b)
+                        if score > 0:
+                            out.append((score, ((r, c), b)))
+        return out
 
     def find_best_move(self, board: np.ndarray) -> Tuple[Optional[Move], int, List[List[Tuple[int,int]]]]:
         rows, cols = board.shape
@@ -72,4 +95,869 @@ class Solver:
                         best_matches = matches
         return best_move, best_score, best_matches
 
-SOLVER = Solver()
+def _mask_runs(mask: int) -> List[Tuple[int,int]]:
+    """单色位掩码中所有长度>=3 的连续段 (start, end)，按 start 升序。"""
+    m3 = mask & (mask >> 1) & (mask >> 2)
+    runs = []
+    if not m3:
+        return runs
+    cover = m3 | (m3 << 1) | (m3 << 2)
+    while cover:
+        low = cover & -cover
+        seg = cover & ~(cover + low)
+        runs.append((low.bit_length() - 1, seg.bit_length() - 1))
+        cover ^= seg
+    return runs
+
+def _popcount(x: int) -> int:
+    return bin(x).count('1')
+
+class BitboardSolver(Solver):
+    """位棋盘引擎：每种颜色按行/列各存一个位掩码，交换时只重算受影响的一行两列(或两行一列)。
+
+    评分公式与 Solver.evaluate_swap 完全一致，返回的 (move, score, matches) 也相同。
+    """
+
+    def _encode(self, board: np.ndarray):
+        rows, cols = board.shape
+        palette = {}
+        row_masks = [[] for _ in range(rows)]  # row_masks[r][k]：颜色 k 在第 r 行的列位掩码
+        col_masks = [[] for _ in range(cols)]  # col_masks[c][k]：颜色 k 在第 c 列的行位掩码
+        codes = [[-1] * cols for _ in range(rows)]
+        for r, line in enumerate(board.tolist()):
+            for c, name in enumerate(line):
+                if name == 'UNKNOWN':
+                    continue
+                k = palette.get(name)
+                if k is None:
+                    k = palette[name] = len(palette)
+                    for masks in row_masks:
+                        masks.append(0)
+                    for masks in col_masks:
+                        masks.append(0)
+                codes[r][c] = k
+                row_masks[r][k] |= 1 << c
+                col_masks[c][k] |= 1 << r
+        return codes, row_masks, col_masks
+
+    @staticmethod
+    def _line(masks: List[int], idx: int, stride: int, step: int):
+        """汇总一条线：(runs, 最大长度, 总长度, 覆盖格子的整盘位掩码)。
+
+        masks 为该线各颜色的位掩码；整盘位序号为 r*cols+c，
+        行线 stride=cols, step=1，列线 stride=1, step=cols。
+        """
+        runs = []
+        for m in masks:
+            if m:
+                runs.extend(_mask_runs(m))
+        if not runs:
+            return (), 0, 0, 0
+        runs.sort()
+        max_len = total = cover = 0
+        for s, e in runs:
+            n = e - s + 1
+            total += n
+            if n > max_len:
+                max_len = n
+            for i in range(s, e + 1):
+                cover |= 1 << (idx * stride + i * step)
+        return runs, max_len, total, cover
+
+    @staticmethod
+    def _recolor(masks: List[int], k_old: int, k_new: int, bit: int) -> List[int]:
+        """复制一条线的掩码，把 bit 位从颜色 k_old 改为 k_new（-1 表示 UNKNOWN）。"""
+        out = list(masks)
+        if k_old >= 0:
+            out[k_old] &= ~bit
+        if k_new >= 0:
+            out[k_new] |= bit
+        return out
+
+    def _swap_lines(self, state, a, b):
+        """计算交换 a,b 后受影响线的新摘要，返回 (rows_patch, cols_patch)。"""
+        codes, row_masks, col_masks, cols = state
+        (r1, c1), (r2, c2) = a, b
+        k1, k2 = codes[r1][c1], codes[r2][c2]
+        rows_patch, cols_patch = {}, {}
+        if r1 == r2:
+            # 水平交换：第 r1 行内两位互换，c1/c2 两列在第 r1 位各自换色
+            bits = (1 << c1) | (1 << c2)
+            line = list(row_masks[r1])
+            if k1 >= 0:
+                line[k1] ^= bits
+            if k2 >= 0:
+                line[k2] ^= bits
+            rows_patch[r1] = self._line(line, r1, cols, 1)
+            cols_patch[c1] = self._line(self._recolor(col_masks[c1], k1, k2, 1 << r1), c1, 1, cols)
+            cols_patch[c2] = self._line(self._recolor(col_masks[c2], k2, k1, 1 << r1), c2, 1, cols)
+        else:
+            bits = (1 << r1) | (1 << r2)
+            line = list(col_masks[c1])
+            if k1 >= 0:
+                line[k1] ^= bits
+            if k2 >= 0:
+                line[k2] ^= bits
+            cols_patch[c1] = self._line(line, c1, 1, cols)
+            rows_patch[r1] = self._line(self._recolor(row_masks[r1], k1, k2, 1 << c1), r1, cols, 1)
+            rows_patch[r2] = self._line(self._recolor(row_masks[r2], k2, k1, 1 << c1), r2, cols, 1)
+        return rows_patch, cols_patch
+
+    @staticmethod
+    def _aggregate(lines):
+        """整组线的基准汇总：(按最大长度降序的 (长度, 下标), 总长度, 覆盖掩码)。"""
+        ranked = sorted(((line[1], i) for i, line in enumerate(lines)), reverse=True)
+        total = cover = 0
+        for line in lines:
+            total += line[2]
+            cover |= line[3]
+        return ranked, total, cover
+
+    @staticmethod
+    def _patched(lines, base, patch):
+        """把补丁线替换进基准汇总；不同线的覆盖位互不重叠，可用异或扣除旧线。"""
+        ranked, total, cover = base
+        max_len = 0
+        for n, i in ranked:
+            if i not in patch:
+                max_len = n
+                break
+        for i, line in patch.items():
+            old = lines[i]
+            total += line[2] - old[2]
+            cover ^= old[3] ^ line[3]
+            if line[1] > max_len:
+                max_len = line[1]
+        return max_len, total, cover
+
+    def _score(self, row_lines, col_lines, row_base, col_base, rows_patch, cols_patch) -> int:
+        row_max, row_total, row_cover = self._patched(row_lines, row_base, rows_patch)
+        col_max, col_total, col_cover = self._patched(col_lines, col_base, cols_patch)
+        total = row_total + col_total
+        if not total:
+            return 0
+        max_len = row_max if row_max > col_max else col_max
+        return max_len * 1000 + _popcount(row_cover | col_cover) * 10 + total
+
+    def _each_swap(self, board: np.ndarray):
+        """按扫描顺序逐个产出 (交换, 得分, 补丁)；最后产出 (None, 0, (row_lines, col_lines)) 供还原消除组。"""
+        rows, cols = board.shape
+        codes, row_masks, col_masks = self._encode(board)
+        state = (codes, row_masks, col_masks, cols)
+        row_lines = [self._line(row_masks[r], r, cols, 1) for r in range(rows)]
+        col_lines = [self._line(col_masks[c], c, 1, cols) for c in range(cols)]
+        row_base = self._aggregate(row_lines)
+        col_base = self._aggregate(col_lines)
+        base_score = self._score(row_lines, col_lines, row_base, col_base, {}, {})
+        for r in range(rows):
+            for c in range(cols):
+                for b in ((r, c+1), (r+1, c)):
+                    if b[0] >= rows or b[1] >= cols:
+                        continue
+                    if codes[r][c] == codes[b[0]][b[1]]:
+                        yield ((r, c), b), base_score, ({}, {})
+                    else:
+                        patch = self._swap_lines(state, (r, c), b)
+                        yield ((r, c), b), self._score(row_lines, col_lines, row_base, col_base, *patch), patch
+        yield None, 0, (row_lines, col_lines)
+
+    def swap_scores(self, board: np.ndarray) -> List[Tuple[int, Move]]:
+        return [(score, move) for move, score, _ in self._each_swap(board) if move is not None and score > 0]
+
+    def find_best_move(self, board: np.ndarray) -> Tuple[Optional[Move], int, List[List[Tuple[int,int]]]]:
+        best_score = 0
+        best_move: Optional[Move] = None
+        best_patch = ({}, {})
+        for move, score, patch in self._each_swap(board):
+            if move is None:
+                row_lines, col_lines = patch
+            elif score > best_score:
+                best_score = score
+                best_move = move
+                best_patch = patch
+        if best_move is None:
+            return None, 0, []
+        rows_patch, cols_patch = best_patch
+        matches = []
+        for r, line in enumerate(row_lines):
+            for s, e in rows_patch.get(r, line)[0]:
+                matches.append([(r, cc) for cc in range(s, e+1)])
+        for c, line in enumerate(col_lines):
+            for s, e in cols_patch.get(c, line)[0]:
+                matches.append([(rr, c) for rr in range(s, e+1)])
+        return best_move, best_score, matches
+
+# 模拟用的格子编码：>=0 为颜色，UNKNOWN 与消除后的空洞都不参与三连
+CELL_UNKNOWN = -1
+CELL_HOLE = -2
+
+class _BudgetExceeded(Exception):
+    pass
+
+def _grid_runs(grid: List[List[int]]) -> List[List[Tuple[int,int]]]:
+    """与 Solver.find_matches 相同的扫描顺序，作用于整数编码棋盘。"""
+    matches = []
+    rows, cols = len(grid), len(grid[0])
+    for r in range(rows):
+        line = grid[r]
+        c = 0
+        while c < cols:
+            start = c
+            v = line[c]
+            while c+1 < cols and v >= 0 and line[c+1] == v:
+                c += 1
+            if c - start >= 2:
+                matches.append([(r, cc) for cc in range(start, c+1)])
+            c += 1
+    for c in range(cols):
+        r = 0
+        while r < rows:
+            start = r
+            v = grid[r][c]
+            while r+1 < rows and v >= 0 and grid[r+1][c] == v:
+                r += 1
+            if r - start >= 2:
+                matches.append([(rr, c) for rr in range(start, r+1)])
+            r += 1
+    return matches
+
+def _line_len(grid, r: int, c: int, dr: int, dc: int) -> int:
+    v = grid[r][c]
+    n = 0
+    rows, cols = len(grid), len(grid[0])
+    r, c = r + dr, c + dc
+    while 0 <= r < rows and 0 <= c < cols and grid[r][c] == v:
+        n += 1
+        r, c = r + dr, c + dc
+    return n
+
+def _matches_at(grid, r: int, c: int) -> bool:
+    if grid[r][c] < 0:
+        return False
+    return (_line_len(grid, r, c, 0, -1) + _line_len(grid, r, c, 0, 1) >= 2
+            or _line_len(grid, r, c, -1, 0) + _line_len(grid, r, c, 1, 0) >= 2)
+
+class LookaheadSolver(Solver):
+    """考虑下落与连锁的前瞻搜索。
+
+    每步模拟 交换 -> 消除 -> 下落 -> 连锁，空洞按随机补块采样取期望，
+    逐层加深直到 search_depth 或用尽 search_node_budget / search_time_budget；
+    置换表以 (棋盘编码, 剩余层数, 颜色数, 采样数) 为键，避免重复模拟相同局面；
+    颜色数与采样数决定补块采样，不同棋盘或改了 search_samples 后同一编码的价值不同。
+    """
+
+    def __init__(self):
+        self.tt: Dict[Tuple[bytes, int, int, int], float] = {}
+        self.tt_hits = 0
+        self.nodes = 0
+        self.depth_reached = 0
+        self._colors = 1
+        self._samples = 1
+        self._deadline = 0.0
+        self._budget_on = False
+        # 后台预测搜索置位后，搜索在下一个节点处中止（结果不可用）
+        self.cancel: Optional[threading.Event] = None
+
+    @staticmethod
+    def _encode(board: np.ndarray) -> Tuple[List[List[int]], int]:
+        palette = {}
+        grid = []
+        for line in board.tolist():
+            row = []
+            for name in line:
+                if name == 'UNKNOWN':
+                    row.append(CELL_UNKNOWN)
+                else:
+                    row.append(palette.setdefault(name, len(palette)))
+            grid.append(row)
+        return grid, max(len(palette), 1)
+
+    @staticmethod
+    def _key(grid) -> bytes:
+        return bytes(v + 2 for row in grid for v in row)
+
+    @staticmethod
+    def _cascade(grid) -> Tuple[int, List[List[Tuple[int,int]]]]:
+        """原地消除并下落直到没有三连，返回 (累计得分, 第一轮消除组)。"""
+        total = 0
+        first: List[List[Tuple[int,int]]] = []
+        rows, cols = len(grid), len(grid[0])
+        while True:
+            matches = _grid_runs(grid)
+            if not matches:
+                return total, first
+            if not first:
+                first = matches
+            total += score_matches(matches)
+            for group in matches:
+                for r, c in group:
+                    grid[r][c] = CELL_HOLE
+            for c in range(cols):
+                kept = [grid[r][c] for r in range(rows) if grid[r][c] != CELL_HOLE]
+                holes = rows - len(kept)
+                for r in range(rows):
+                    grid[r][c] = CELL_HOLE if r < holes else kept[r - holes]
+
+    @staticmethod
+    def _valid_swaps(grid) -> List[Move]:
+        rows, cols = len(grid), len(grid[0])
+        moves = []
+        for r in range(rows):
+            for c in range(cols):
+                a = grid[r][c]
+                if a == CELL_HOLE:
+                    continue
+                for r2, c2 in ((r, c+1), (r+1, c)):
+                    if r2 >= rows or c2 >= cols:
+                        continue
+                    b = grid[r2][c2]
+                    if b == a or b == CELL_HOLE:
+                        continue
+                    grid[r][c], grid[r2][c2] = b, a
+                    if _matches_at(grid, r, c) or _matches_at(grid, r2, c2):
+                        moves.append(((r, c), (r2, c2)))
+                    grid[r][c], grid[r2][c2] = a, b
+        return moves
+
+    def _tick(self):
+        self.nodes += 1
+        if self.cancel is not None and self.cancel.is_set():
+            raise _BudgetExceeded()
+        if self._budget_on and (self.nodes > CONFIG.search_node_budget
+                                or time.perf_counter() > self._deadline):
+            raise _BudgetExceeded()
+
+    def _apply(self, grid, move: Move):
+        g = [row[:] for row in grid]
+        (r1, c1), (r2, c2) = move
+        g[r1][c1], g[r2][c2] = g[r2][c2], g[r1][c1]
+        score, first = self._cascade(g)
+        return g, score, first
+
+    def _value(self, grid, depth: int) -> float:
+        if depth <= 0:
+            return 0.0
+        key = (self._key(grid), depth, self._colors, self._samples)
+        hit = self.tt.get(key)
+        if hit is not None:
+            self.tt_hits += 1
+            return hit
+        best = 0.0
+        for move in self._valid_swaps(grid):
+            self._tick()
+            g, score, _ = self._apply(grid, move)
+            v = score + self._chance(g, depth - 1)
+            if v > best:
+                best = v
+        self.tt[key] = best
+        return best
+
+    def _chance(self, grid, depth: int) -> float:
+        """对空洞随机补块取 search_samples 次样本，返回期望价值。"""
+        if depth <= 0:
+            return 0.0
+        holes = [(r, c) for r, row in enumerate(grid) for c, v in enumerate(row) if v == CELL_HOLE]
+        if not holes:
+            return self._value(grid, depth)
+        # 以局面编码作种子，同一局面的采样结果固定，置换表才有意义
+        rng = random.Random(zlib.crc32(self._key(grid)))
+        samples = self._samples
+        total = 0.0
+        for _ in range(samples):
+            g = [row[:] for row in grid]
+            for r, c in holes:
+                g[r][c] = rng.randrange(self._colors)
+            score, _ = self._cascade(g)
+            total += score + self._value(g, depth)
+        return total / samples
+
+    def find_best_move(self, board: np.ndarray, max_depth: Optional[int] = None
+                       ) -> Tuple[Optional[Move], int, List[List[Tuple[int,int]]]]:
+        """max_depth 缺省为 search_depth；预测搜索逐层加深时传入较浅的层数。"""
+        grid, self._colors = self._encode(board)
+        self._samples = max(CONFIG.search_samples, 1)
+        if len(self.tt) > CONFIG.search_tt_size:
+            self.tt.clear()
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = time.perf_counter() + CONFIG.search_time_budget
+        children = []
+        for move in self._valid_swaps(grid):
+            children.append((move,) + self._apply(grid, move))
+        best_move: Optional[Move] = None
+        best_score = 0.0
+        best_matches: List[List[Tuple[int,int]]] = []
+        for depth in range(1, max(max_depth or CONFIG.search_depth, 1) + 1):
+            # 第一层不受预算约束（只会被 cancel 中止），之后的加深超限则沿用上一层结果
+            self._budget_on = depth > 1
+            try:
+                results = [(score + self._chance(g, depth - 1), move, first)
+                           for move, g, score, first in children]
+            except _BudgetExceeded:
+                break
+            self.depth_reached = depth
+            best_score = 0.0
+            for value, move, first in results:
+                if value > best_score:
+                    best_score, best_move, best_matches = value, move, first
+        self._budget_on = False
+        return best_move, int(round(best_score)), best_matches
+
+def _line_runs(lines: np.ndarray):
+    """沿最后一维找同色连续段，返回每格所在段的 (起点, 终点) 及是否属于长度>=3 的三连。
+
+    lines 为整数编码（<0 表示 UNKNOWN，不与任何格相连），可带任意前置批量维度。
+    """
+    n = lines.shape[-1]
+    idx = np.arange(n, dtype=np.int32)
+    same = (lines[..., 1:] == lines[..., :-1]) & (lines[..., 1:] >= 0)
+    edge = np.ones(lines.shape[:-1] + (1,), dtype=bool)
+    begins = np.concatenate([edge, ~same], axis=-1)
+    ends = np.concatenate([~same, edge], axis=-1)
+    start = np.maximum.accumulate(np.where(begins, idx, 0), axis=-1)
+    end = np.minimum.accumulate(np.where(ends, idx, n - 1)[..., ::-1], axis=-1)[..., ::-1]
+    cover = (end - start >= 2) & (lines >= 0)
+    return start, end, cover
+
+def _line_stats(lines: np.ndarray):
+    """(覆盖掩码, 每条线最长三连长度, 每条线三连格数=总连线长度)。"""
+    start, end, cover = _line_runs(lines)
+    max_len = np.where(cover, end - start + 1, 0).max(axis=-1)
+    return cover, max_len, cover.sum(axis=-1)
+
+def _max_excluding(values: np.ndarray, k: int) -> np.ndarray:
+    """对每个 i，返回排除下标 i..i+k-1 后的最大值（不存在则 0），结果长度 len-k+1。"""
+    n = len(values)
+    order = np.argsort(-values, kind='stable')[:k + 1]
+    out = np.zeros(n - k + 1, dtype=np.int64)
+    done = np.zeros(n - k + 1, dtype=bool)
+    starts = np.arange(n - k + 1)
+    for j in order:
+        hit = ~done & ((j < starts) | (j >= starts + k))
+        out[hit] = values[j]
+        done |= hit
+    return out
+
+class VectorSolver(Solver):
+    """NumPy 向量化引擎：移位比较找三连，整批评估所有水平/竖直交换，适合大棋盘。
+
+    交换只改变一行两列（或两行一列），对每个候选只重算这些线，其余线的统计量
+    来自整盘基准；唯一消除格数用 |R|+|C|-|R∩C| 按受影响区域修正。结果与 Solver 相同。
+    """
+
+    # 每批处理的候选行数上限按格子数估算，避免大棋盘一次性占用过多内存
+    CHUNK_CELLS = 1 << 21
+
+    @staticmethod
+    def _encode(board: np.ndarray) -> np.ndarray:
+        names, inv = np.unique(board, return_inverse=True)
+        codes = inv.reshape(board.shape).astype(np.int16)
+        unknown = np.nonzero(names == 'UNKNOWN')[0]
+        if len(unknown):
+            codes[codes == unknown[0]] = -1
+        return codes
+
+    def _horizontal_scores(self, b: np.ndarray) -> np.ndarray:
+        """所有水平交换 (r,c)<->(r,c+1) 的得分，形状 (rows, cols-1)。"""
+        rows, cols = b.shape
+        if cols < 2:
+            return np.zeros((rows, 0), dtype=np.int64)
+        row_cov, row_max, row_cnt = _line_stats(b)
+        col_cov_t, col_max, col_cnt = _line_stats(b.T)
+        col_cov = col_cov_t.T
+        rc = row_cov & col_cov
+        rc_row, rc_col = rc.sum(axis=1), rc.sum(axis=0)
+        r_total, c_total, rc_total = int(row_cnt.sum()), int(col_cnt.sum()), int(rc.sum())
+        row_max_excl = _max_excluding(row_max, 1)
+        col_max_excl = _max_excluding(col_max, 2)
+        pairs = cols - 1
+        perm = np.tile(np.arange(cols), (pairs, 1))
+        cs = np.arange(pairs)
+        perm[cs, cs], perm[cs, cs + 1] = cs + 1, cs
+        scores = np.zeros((rows, pairs), dtype=np.int64)
+        step = max(1, self.CHUNK_CELLS // max(pairs * max(rows, cols), 1))
+        for r0 in range(0, rows, step):
+            rr = np.arange(r0, min(r0 + step, rows))
+            k = len(rr)
+            # 受影响的行：第 r 行交换 c/c+1
+            n_cov, n_max, n_cnt = _line_stats(b[rr][:, perm])                 # (k, pairs, cols)
+            # 受影响的两列：第 c 列的第 r 格换成 b[r,c+1]，第 c+1 列的第 r 格换成 b[r,c]
+            ca = np.broadcast_to(b.T[None, :pairs], (k, pairs, rows)).copy()
+            cb = np.broadcast_to(b.T[None, 1:], (k, pairs, rows)).copy()
+            ki = np.arange(k)[:, None]
+            ca[ki, cs[None, :], rr[:, None]] = b[rr, 1:]
+            cb[ki, cs[None, :], rr[:, None]] = b[rr, :-1]
+            a_cov, a_max, a_cnt = _line_stats(ca)                             # (k, pairs, rows)
+            b_cov, b_max, b_cnt = _line_stats(cb)
+            total = (r_total + c_total - row_cnt[rr][:, None] + n_cnt
+                     - col_cnt[:-1][None, :] - col_cnt[1:][None, :] + a_cnt + b_cnt)
+            r_size = r_total - row_cnt[rr][:, None] + n_cnt
+            c_size = c_total - col_cnt[:-1][None, :] - col_cnt[1:][None, :] + a_cnt + b_cnt
+            i_old = (rc_row[rr][:, None] + rc_col[:-1][None, :] + rc_col[1:][None, :]
+                     - rc[rr, :-1] - rc[rr, 1:])
+            # 新交集：第 r 行（c/c+1 两格与新列相交，其余格与原列覆盖相交）
+            col_cov_r = col_cov[rr][:, None, :]
+            n_at_c = n_cov[ki, cs[None, :], cs[None, :]]
+            n_at_c1 = n_cov[ki, cs[None, :], cs[None, :] + 1]
+            a_at_r = a_cov[ki, cs[None, :], rr[:, None]]
+            b_at_r = b_cov[ki, cs[None, :], rr[:, None]]
+            i_row = ((n_cov & col_cov_r).sum(axis=-1)
+                     - (n_at_c & col_cov[rr, :-1][:, :]) - (n_at_c1 & col_cov[rr, 1:])
+                     + (n_at_c & a_at_r) + (n_at_c1 & b_at_r))
+            # 新交集：c/c+1 两列中第 r 行以外的格子与原行覆盖相交
+            i_cols = ((a_cov & row_cov.T[None, :pairs]).sum(axis=-1)
+                      + (b_cov & row_cov.T[None, 1:]).sum(axis=-1)
+                      - (a_at_r & row_cov[rr, :-1]) - (b_at_r & row_cov[rr, 1:]))
+            unique = r_size + c_size - (rc_total - i_old + i_row + i_cols)
+            max_len = np.maximum.reduce([
+                np.broadcast_to(row_max_excl[rr][:, None], (k, pairs)),
+                np.broadcast_to(col_max_excl[None, :], (k, pairs)),
+                n_max, a_max, b_max])
+            scores[rr] = np.where(total > 0, max_len * 1000 + unique * 10 + total, 0)
+        return scores
+
+    def find_matches(self, board: np.ndarray) -> List[List[Tuple[int,int]]]:
+        return self._matches(self._encode(board))
+
+    @staticmethod
+    def _matches(codes: np.ndarray) -> List[List[Tuple[int,int]]]:
+        matches = []
+        start, end, cover = _line_runs(codes)
+        for r, s in zip(*np.nonzero(cover & (start == np.arange(codes.shape[1])))):
+            matches.append([(int(r), cc) for cc in range(int(s), int(end[r, s]) + 1)])
+        start, end, cover = _line_runs(codes.T)
+        for c, s in zip(*np.nonzero(cover & (start == np.arange(codes.shape[0])))):
+            matches.append([(rr, int(c)) for rr in range(int(s), int(end[c, s]) + 1)])
+        return matches
+
+    def _combined(self, codes: np.ndarray) -> np.ndarray:
+        """所有交换的得分，按原扫描顺序 (r, c, 先水平后竖直) 排列，不存在的交换为 -1。"""
+        rows, cols = codes.shape
+        combined = np.full((rows, cols, 2), -1, dtype=np.int64)
+        combined[:, :-1, 0] = self._horizontal_scores(codes)
+        combined[:-1, :, 1] = self._horizontal_scores(codes.T).T
+        return combined
+
+    def swap_scores(self, board: np.ndarray) -> List[Tuple[int, Move]]:
+        combined = self._combined(self._encode(board))
+        out = []
+        for r, c, vertical in zip(*np.nonzero(combined > 0)):
+            r, c = int(r), int(c)
+            out.append((int(combined[r, c, vertical]), ((r, c), (r + 1, c) if vertical else (r, c + 1))))
+        return out
+
+    def find_best_move(self, board: np.ndarray) -> Tuple[Optional[Move], int, List[List[Tuple[int,int]]]]:
+        codes = self._encode(board)
+        # argmax 取第一个最大值即与 Solver 相同的平局规则
+        combined = self._combined(codes)
+        flat = int(np.argmax(combined))
+        best_score = int(combined.flat[flat])
+        if best_score <= 0:
+            return None, 0, []
+        r, c, vertical = np.unravel_index(flat, combined.shape)
+        r, c = int(r), int(c)
+        b = (r + 1, c) if vertical else (r, c + 1)
+        swapped = codes.copy()
+        swapped[r, c], swapped[b] = codes[b], codes[r, c]
+        return ((r, c), b), best_score, self._matches(swapped)
+
+Cell = Tuple[int, int]
+
+def _gravity_zone(grid: List[List[int]], move: Move) -> Set[Cell]:
+    """交换后消除、下落直到已知格子不再成连，返回内容可能变化的格子：
+    交换的两格，以及每轮每个被消除列中最低消除格及其上方所有格。补充的新块未知 (CELL_UNKNOWN)，不参与成连。
+    """
+    g = [row[:] for row in grid]
+    (r1, c1), (r2, c2) = move
+    g[r1][c1], g[r2][c2] = g[r2][c2], g[r1][c1]
+    zone = set(move)
+    rows = len(g)
+    while True:
+        matches = _grid_runs(g)
+        if not matches:
+            return zone
+        lowest: Dict[int, int] = {}
+        for group in matches:
+            for r, c in group:
+                g[r][c] = CELL_HOLE
+                if r > lowest.get(c, -1):
+                    lowest[c] = r
+        for c, low in lowest.items():
+            zone.update((r, c) for r in range(low + 1))
+            kept = [g[r][c] for r in range(rows) if g[r][c] != CELL_HOLE]
+            fill = rows - len(kept)
+            for r in range(rows):
+                g[r][c] = CELL_UNKNOWN if r < fill else kept[r - fill]
+
+def _footprint(move: Move, matches: List[List[Cell]]) -> Set[Cell]:
+    """一次交换成立所依赖的格子：交换两格与消除组，再向四邻扩一格（邻格变色可能改变连线长度）。"""
+    cells = set(move)
+    for group in matches:
+        cells.update(group)
+    out = set(cells)
+    for r, c in cells:
+        out.update(((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)))
+    return out
+
+class MovePlanner:
+    """一帧规划多步互不干扰的交换，执行完整批后只等待一次稳定。
+
+    两步独立的判定（消除+下落模型）：任一步的依赖格与另一步的下落影响区（含已知格子下落形成的连锁）
+    都不相交，因此批内任意顺序执行结果相同；随机补块参与的连锁无法预知，不在保证之内。
+    第一步固定为求解引擎给出的最佳交换，其余按单步得分贪心加入，最多 plan_max_moves 步；
+    单步得分由位棋盘引擎一次算出，只对实际考察的候选再求消除组，
+    最后按光标移动距离（格子单位）用最近邻排序，并可把一次交换的两次点击对调。
+    """
+
+    def __init__(self):
+        self._scorer = BitboardSolver()
+        self._matcher = Solver()
+        # 上一批最后一次点击的格子，作为下一批排序的光标起点
+        self.cursor: Optional[Cell] = None
+
+    def plan(self, board: np.ndarray, move: Move, matches: List[List[Cell]]) -> List[Move]:
+        if CONFIG.plan_max_moves <= 1:
+            self.cursor = move[1]
+            return [move]
+        grid, _ = LookaheadSolver._encode(board)
+        chosen = [(move, _gravity_zone(grid, move), _footprint(move, matches))]
+        first_zone = chosen[0][1]
+        candidates = [(score, (a, b)) for score, (a, b) in self._scorer.swap_scores(board)
+                      if a not in first_zone and b not in first_zone and board[a] != board[b]]
+        candidates.sort(key=lambda x: x[0], reverse=True)
+        for _, cand in candidates:
+            if len(chosen) >= CONFIG.plan_max_moves:
+                break
+            _, found = self._matcher.evaluate_swap(board, *cand)
+            foot = _footprint(cand, found)
+            if any(foot & z for _, z, _ in chosen):
+                continue
+            zone = _gravity_zone(grid, cand)
+            if not any(f & zone for _, _, f in chosen):
+                chosen.append((cand, zone, foot))
+        batch = self._order([m for m, _, _ in chosen])
+        self.cursor = batch[-1][1]
+        METRICS.incr('planned_moves', len(batch))
+        return batch
+
+    def _order(self, moves: List[Move]) -> List[Move]:
+        """最近邻排序：从当前光标出发，每次选第一次点击离光标最近的交换（含两格对调）。"""
+        if self.cursor is None:
+            pos = moves[0][0]
+        else:
+            pos = self.cursor
+        left = list(moves)
+        out: List[Move] = []
+        while left:
+            best = None
+            for i, (a, b) in enumerate(left):
+                for first, second in ((a, b), (b, a)):
+                    d = (first[0] - pos[0]) ** 2 + (first[1] - pos[1]) ** 2
+                    if best is None or d < best[0]:
+                        best = (d, i, (first, second))
+            _, i, step = best
+            out.append(step)
+            left.pop(i)
+            pos = step[1]
+        return out
+
+def _settle_unknown(grid: List[List[int]], move: Move) -> bool:
+    """原地执行交换并消除、下落直到已知格子不再成连，补块记为 CELL_UNKNOWN；交换无效则撤回并返回 False。"""
+    (r1, c1), (r2, c2) = move
+    grid[r1][c1], grid[r2][c2] = grid[r2][c2], grid[r1][c1]
+    matches = _grid_runs(grid)
+    if not matches:
+        grid[r1][c1], grid[r2][c2] = grid[r2][c2], grid[r1][c1]
+        return False
+    rows, cols = len(grid), len(grid[0])
+    while matches:
+        for group in matches:
+            for r, c in group:
+                grid[r][c] = CELL_HOLE
+        for c in range(cols):
+            kept = [grid[r][c] for r in range(rows) if grid[r][c] != CELL_HOLE]
+            fill = rows - len(kept)
+            for r in range(rows):
+                grid[r][c] = CELL_UNKNOWN if r < fill else kept[r - fill]
+        matches = _grid_runs(grid)
+    return True
+
+class SpeculativeSearch:
+    """动画播放期间的后台预测搜索。
+
+    交换发出后，按消除+下落模型推算交换后的棋盘（补块未知），再给未知格填色：每种颜色的概率按
+    当前棋盘上的出现频率估计，按整盘概率从高到低依次产出，最多 speculative_max_boards 个。
+    对已稳定的候选棋盘用独立的求解引擎实例逐层加深搜索：先对全部候选做一层搜索，再整体加深到
+    search_depth（只有 lookahead 引擎有多层），每层结果都写入缓存，动画结束时最可能的局面至少有
+    一层结果。识别到真实棋盘后中止后台搜索（搜索内部也检查中止）并查缓存，命中直接返回，未命中
+    再正常搜索；命中率与省下的搜索时间记入日志与 METRICS。
+    """
+
+    def __init__(self, solver: Solver, engine: str):
+        self.solver = solver
+        self.engine = engine
+        self._worker_solver: Optional[Solver] = None
+        # {棋盘: (求解结果, 用时, 搜索层数)}
+        self._cache: 'OrderedDict[tuple, Tuple[tuple, float, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # 保护 _thread/_cancel：start 与 stop 可能来自不同线程（多棋盘模式）
+        self._run_lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        self.searched = 0
+
+    @staticmethod
+    def _key(board: np.ndarray) -> tuple:
+        return tuple(board.ravel().tolist())
+
+    def use_engine(self, engine: str):
+        """换用另一个求解引擎，清空缓存与统计（模拟器依次测量各引擎）。"""
+        self.stop()
+        self.solver = METRICS.instrument(make_solver(engine), 'find_best_move')
+        self.engine = engine
+        self._worker_solver = None
+        with self._lock:
+            self._cache.clear()
+        self.hits = self.misses = self.searched = 0
+        self.saved = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def start(self, board: np.ndarray, moves: List[Move]):
+        """交换已发出：后台推算交换后的局面并开始搜索。"""
+        if not CONFIG.speculative_search:
+            return
+        with self._run_lock:
+            self._stop()
+            # 每次搜索用新的中止事件，旧线程即使尚未退出也看不到这次 clear
+            self._cancel = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(board.copy(), list(moves), self._cancel),
+                                            name='speculative-search', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._run_lock:
+            self._stop()
+
+    def _stop(self):
+        if self._thread is not None:
+            self._cancel.set()
+            self._thread.join()
+            self._thread = None
+
+    def _candidates(self, board: np.ndarray, moves: List[Move]):
+        """按出现概率从高到低逐个产出交换后可能出现的已稳定棋盘（名称数组）。"""
+        palette: Dict[str, int] = {}
+        grid = [[CELL_UNKNOWN if name == 'UNKNOWN' else palette.setdefault(name, len(palette)) for name in line]
+                for line in board.tolist()]
+        names = list(palette)
+        # 补块颜色的概率按交换前棋盘上各颜色的出现次数估计（加一平滑），颜色按概率从高到低排列
+        counts = np.bincount([v for row in grid for v in row if v >= 0], minlength=len(names)) + 1
+        order = [int(v) for v in np.argsort(-counts, kind='stable')]
+        cost = [-math.log(counts[v] / counts.sum()) for v in order]
+        for move in moves:
+            _settle_unknown(grid, move)
+        holes = [(r, c) for r, row in enumerate(grid) for c, v in enumerate(row) if v == CELL_UNKNOWN]
+        if not holes or not names:
+            yield np.array([[names[v] if v >= 0 else 'UNKNOWN' for v in row] for row in grid])
+            return
+        # 最优优先（A*）逐个空洞填色：代价为 -log 概率，未填的空洞按最可能的颜色估计；
+        # 填入后立即成连的颜色直接剪掉（补块立即成连时实际局面还会继续连锁，不是稳定棋盘），
+        # 因此按概率从高到低产出的都是稳定棋盘。同等代价时优先展开填得多的，尽快产出完整棋盘
+        n = len(holes)
+        heap = [(cost[0] * n, 0, ())]
+        limit = CONFIG.speculative_max_boards * n * 2
+        found = expanded = 0
+        while heap and found < CONFIG.speculative_max_boards and expanded < limit:
+            f, _, combo = heapq.heappop(heap)
+            g = [row[:] for row in grid]
+            for (r, c), k in zip(holes, combo):
+                g[r][c] = order[k]
+            if len(combo) == n:
+                found += 1
+                yield np.array([[names[v] if v >= 0 else 'UNKNOWN' for v in row] for row in g])
+                continue
+            expanded += 1
+            r, c = holes[len(combo)]
+            for k, v in enumerate(order):
+                g[r][c] = v
+                if not _matches_at(g, r, c):
+                    heapq.heappush(heap, (f - cost[0] + cost[k], -len(combo) - 1, combo + (k,)))
+
+    def _run(self, board: np.ndarray, moves: List[Move], cancel: threading.Event):
+        if self._worker_solver is None:
+            # 引擎可能带内部状态（置换表等），后台线程使用独立实例
+            self._worker_solver = make_solver(self.engine)
+        solver = self._worker_solver
+        deepening = isinstance(solver, LookaheadSolver)
+        if deepening:
+            solver.cancel = cancel
+        cands = []
+        for cand in self._candidates(board, moves):
+            if cancel.is_set():
+                return
+            cands.append((self._key(cand), cand))
+        for depth in range(1, (max(CONFIG.search_depth, 1) if deepening else 1) + 1):
+            for key, cand in cands:
+                if cancel.is_set():
+                    return
+                with self._lock:
+                    hit = self._cache.get(key)
+                if hit is not None and hit[2] >= depth:
+                    continue
+                start = time.perf_counter()
+                result = solver.find_best_move(cand, depth) if deepening else solver.find_best_move(cand)
+                elapsed = time.perf_counter() - start
+                if cancel.is_set():
+                    # 搜索被中途中止，结果不完整
+                    return
+                with self._lock:
+                    self._cache[key] = (result, elapsed, depth)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > CONFIG.speculative_cache_size:
+                        self._cache.popitem(last=False)
+                self.searched += 1
+
+    def find_best_move(self, board: np.ndarray) -> Tuple[Optional[Move], int, List[List[Tuple[int,int]]]]:
+        """先查预测缓存，未命中再用求解引擎正常搜索。"""
+        if not CONFIG.speculative_search:
+            return self.solver.find_best_move(board)
+        self.stop()
+        with self._lock:
+            hit = self._cache.get(self._key(board))
+        if hit is not None:
+            result, elapsed, depth = hit
+            self.hits += 1
+            self.saved += elapsed
+            METRICS.incr('speculative_hits')
+            METRICS.observe('speculative_saved', elapsed)
+            log(f'[STEP] 预测搜索命中 (已搜 {self.searched} 局, 该局 {depth} 层) 命中率={self.hit_rate:.0%} '
+                f'本次省 {elapsed * 1000:.1f}ms 累计省 {self.saved * 1000:.0f}ms')
+            return result
+        self.misses += 1
+        METRICS.incr('speculative_misses')
+        log(f'[STEP] 预测搜索未命中 (已搜 {self.searched} 局) 命中率={self.hit_rate:.0%}')
+        return self.solver.find_best_move(board)
+
+SOLVER_ENGINES = {
+    'python': Solver,
+    'bitboard': BitboardSolver,
+    'lookahead': LookaheadSolver,
+    'vector': VectorSolver,
+}
+
+def make_solver(name: str) -> Solver:
+    if name not in SOLVER_ENGINES:
+        log(f"[WARN] 未知求解引擎 {name}，使用 python")
+        name = 'python'
+    return SOLVER_ENGINES[name]()
+
+SOLVER = METRICS.instrument(make_solver(CONFIG.solver_engine), 'find_best_move')
+PLANNER = METRICS.instrument(MovePlanner(), 'plan')
+SPECULATOR = SpeculativeSearch(SOLVER, CONFIG.solver_engine)
@@ -1,57 +1,262 @@
+import hashlib
+import threading
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
+from config import CONFIG
+from metrics import METRICS, log
 
 TEMPLATE_DIR = Path(__file__).parent / 'templates'
+# 批量匹配时模板与格子统一缩放到的最大边长（像素），越小越快
+FEATURE_SIZE = 64
+HIST_BINS = 8
+# 按格子尺寸预处理好的模板库缓存；键为模板内容哈希+格子尺寸，不匹配即重建
+BANK_CACHE = TEMPLATE_DIR / '.bank_cache.npz'
+BANK_VERSION = 1
 
 class TemplateManager:
     def __init__(self):
-        self.templates: Dict[str, np.ndarray] = {}
+        self._files: Dict[str, Path] = {}
+        self._images: Optional[Dict[str, np.ndarray]] = None
+        self._content_hash = ''
+        # 当前格子几何 (tile_w, tile_h, stride)，设置后格子直接按步长取样，无需缩放
+        self._geom: Optional[Tuple[int, int, int]] = None
+        # 本进程内已就绪的各格子几何的模板库，多个棋盘尺寸不同时来回切换无需重读磁盘
+        self._banks: Dict[Tuple[int, int, int], tuple] = {}
+        # 多棋盘模式下切换几何与匹配需在同一把锁内完成
+        self.lock = threading.RLock()
         # 每个模板的点击中心 (x_ratio, y_ratio)
         self.centers: Dict[str, Tuple[float, float]] = {}
+        # 批量匹配用的预计算特征，load_templates 时生成
+        self.names: List[str] = []
+        self.feature_size: Tuple[int, int] = (FEATURE_SIZE, FEATURE_SIZE)  # (w, h)
+        self._tmpl_pixels: Optional[np.ndarray] = None  # (T, D) 去均值+单位化的像素
+        self._tmpl_hists: Optional[np.ndarray] = None   # (T, 512) 去均值+单位化的直方图
+        self._center_arr: Optional[np.ndarray] = None   # (T+1, 2)，末行对应 UNKNOWN
+        # classifier_backend='color' 时使用的颜色特征分类器及其类别到模板下标的映射
+        self.classifier = None
+        self._class_to_tmpl: Optional[np.ndarray] = None
 
     @staticmethod
     def _compute_center_ratio(img: np.ndarray) -> Tuple[float, float]:
         """使用最初方案：点击格子几何中心 (0.5, 0.5)。"""
         return 0.5, 0.5
 
-    def load_templates(self):
+    @property
+    def templates(self) -> Dict[str, np.ndarray]:
+        """模板原图，按需解码（命中模板库缓存时启动阶段不解码 PNG）。"""
+        if self._images is None:
+            self._images = {}
+            for name, file in self._files.items():
+                img = cv2.imread(str(file), cv2.IMREAD_COLOR)
+                if img is not None:
+                    self._images[name] = img
+        return self._images
+
+    def load_templates(self, tile_size: Optional[Tuple[float, float]] = None):
+        """加载模板；已知格子尺寸 (w, h) 时优先读取预处理好的模板库缓存。"""
         if not TEMPLATE_DIR.exists():
             TEMPLATE_DIR.mkdir(parents=True, exist_ok=True)
-        for file in TEMPLATE_DIR.glob('*.png'):
-            img = cv2.imread(str(file), cv2.IMREAD_COLOR)
-            if img is None:
-                continue
-            self.templates[file.stem] = img
-            self.centers[file.stem] = self._compute_center_ratio(img)
-        if len(self.templates) < 4:
-            print(f"[WARN] 模板数量不足: {len(self.templates)} < 4, 请添加PNG到 {TEMPLATE_DIR}")
+        self._files = {f.stem: f for f in sorted(TEMPLATE_DIR.glob('*.png'))}
+        digest = hashlib.sha1()
+        for name, file in self._files.items():
+            digest.update(name.encode('utf-8'))
+            digest.update(file.read_bytes())
+        self._content_hash = digest.hexdigest()
+        self._images = None
+        self._geom = None
+        self._banks = {}
+        if not (tile_size and self.set_tile_size(*tile_size)):
+            for name, img in self.templates.items():
+                self.centers[name] = self._compute_center_ratio(img)
+            self._prepare_features()
+        if CONFIG.classifier_backend == 'color':
+            self._load_classifier()
+        if len(self.names) < 4:
+            log(f"[WARN] 模板数量不足: {len(self.names)} < 4, 请添加PNG到 {TEMPLATE_DIR}")
         else:
-            names = [f"{n}(center=0.50,0.50)" for n in self.templates.keys()]
-            print(f"[STEP] 已加载模板: {names}")
-        return self.templates
+            names = [f"{n}(center=0.50,0.50)" for n in self.names]
+            log(f"[STEP] 已加载模板: {names}")
+        return self.names
 
-    def match_tile(self, tile_img: np.ndarray) -> Tuple[str, float, Tuple[float,float]]:
+    def set_tile_size(self, tile_w: float, tile_h: float) -> bool:
+        """按实际格子尺寸准备模板库（优先读磁盘缓存），返回是否就绪。
+
+        模板预先缩放到格子大小，再按与格子取样相同的步长抽点，使边长不超过 FEATURE_SIZE；
+        之后每帧格子只需索引取样，不再逐格 resize。
+        """
+        tw, th = int(tile_w), int(tile_h)
+        if tw < 1 or th < 1:
+            return False
+        stride = max(1, -(-max(tw, th) // FEATURE_SIZE))
+        geom = (tw, th, stride)
+        if geom == self._geom:
+            return True
+        if geom in self._banks:
+            (self.names, self._tmpl_pixels, self._tmpl_hists, self._center_arr,
+             self.feature_size, self.centers) = self._banks[geom]
+            self._geom = geom
+            return True
+        key = f'v{BANK_VERSION}-{self._content_hash}-{tw}x{th}s{stride}'
+        if self._load_bank(key):
+            self._remember(geom)
+            return True
         if not self.templates:
+            return False
+        names = list(self.templates.keys())
+        bank = np.stack([cv2.resize(self.templates[n], (tw, th), interpolation=cv2.INTER_AREA)[::stride, ::stride]
+                         for n in names])
+        self.names = names
+        for n in names:
+            self.centers.setdefault(n, self._compute_center_ratio(self.templates[n]))
+        self.feature_size = (bank.shape[2], bank.shape[1])
+        self._tmpl_pixels = self._pixel_features(bank)
+        self._tmpl_hists = self._hist_features(bank)
+        self._center_arr = np.array([self.centers[n] for n in names] + [(0.5, 0.5)], dtype=np.float32)
+        self._remember(geom)
+        try:
+            np.savez(BANK_CACHE, key=key, names=np.array(names), pixels=self._tmpl_pixels,
+                     hists=self._tmpl_hists, centers=self._center_arr, feature_size=np.array(self.feature_size))
+            log(f'[STEP] 模板库已按格子 {tw}x{th} (步长 {stride}) 预处理并缓存')
+        except OSError as e:
+            log(f'[WARN] 模板库缓存写入失败: {e}')
+        return True
+
+    def _remember(self, geom: Tuple[int, int, int]):
+        self._geom = geom
+        self._banks[geom] = (self.names, self._tmpl_pixels, self._tmpl_hists, self._center_arr,
+                             self.feature_size, dict(self.centers))
+
+    def _load_bank(self, key: str) -> bool:
+        if not BANK_CACHE.exists():
+            return False
+        try:
+            with np.load(BANK_CACHE) as data:
+                if str(data['key']) != key:
+                    return False
+                self.names = data['names'].tolist()
+                self._tmpl_pixels = data['pixels']
+                self._tmpl_hists = data['hists']
+                self._center_arr = data['centers']
+                self.feature_size = tuple(int(v) for v in data['feature_size'])
+        except (OSError, KeyError, ValueError) as e:
+            log(f'[WARN] 模板库缓存读取失败，重建: {e}')
+            return False
+        self.centers = {n: tuple(float(v) for v in c) for n, c in zip(self.names, self._center_arr)}
+        return True
+
+    def _prepare_features(self):
+        """模板只在加载时缩放一次，并预先算好像素与直方图特征。"""
+        self.names = list(self.templates.keys())
+        if not self.names:
+            self._tmpl_pixels = self._tmpl_hists = self._center_arr = None
+            return
+        # 取最小模板尺寸并限制到 FEATURE_SIZE，避免格子被放大
+        w = min(min(t.shape[1] for t in self.templates.values()), FEATURE_SIZE)
+        h = min(min(t.shape[0] for t in self.templates.values()), FEATURE_SIZE)
+        self.feature_size = (w, h)
+        stack = np.stack([cv2.resize(self.templates[n], self.feature_size, interpolation=cv2.INTER_AREA)
+                          for n in self.names])
+        self._tmpl_pixels = self._pixel_features(stack)
+        self._tmpl_hists = self._hist_features(stack)
+        self._center_arr = np.array([self.centers[n] for n in self.names] + [(0.5, 0.5)], dtype=np.float32)
+
+    def _load_classifier(self):
+        from color_classifier import ColorClassifier
+        model = ColorClassifier.load(Path(CONFIG.color_model_file))
+        if model is None:
+            log(f"[WARN] 未找到颜色分类模型 {CONFIG.color_model_file}，使用模板匹配；"
+                f"可运行 python color_classifier.py build 生成")
+            return
+        unknown = [n for n in model.names if n not in self.names]
+        if unknown:
+            log(f"[WARN] 模型类别 {unknown} 没有对应模板，识别为 UNKNOWN")
+        # 不在模板中的类别映射到 len(names)，即 'UNKNOWN'
+        self._class_to_tmpl = np.array([self.names.index(n) if n in self.names else len(self.names)
+                                        for n in model.names])
+        self.classifier = model
+        log(f"[STEP] 使用颜色特征分类器 {CONFIG.color_model_file}")
+
+    @staticmethod
+    def _unit_rows(x: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(x, axis=1, keepdims=True)
+        return x / np.maximum(norm, 1e-6)
+
+    @classmethod
+    def _pixel_features(cls, stack: np.ndarray) -> np.ndarray:
+        """(N,h,w,3) -> (N,D)：按通道去均值后单位化，点积即 TM_CCOEFF_NORMED。"""
+        x = stack.astype(np.float32)
+        x -= x.mean(axis=(1, 2), keepdims=True)
+        return cls._unit_rows(x.reshape(len(x), -1))
+
+    @classmethod
+    def _hist_features(cls, stack: np.ndarray) -> np.ndarray:
+        """(N,h,w,3) -> (N,512)：8x8x8 颜色直方图，去均值后单位化，点积即 HISTCMP_CORREL。"""
+        n = len(stack)
+        shift = 8 - int(np.log2(HIST_BINS))
+        q = (stack >> shift).astype(np.int32)
+        idx = (q[..., 0] * HIST_BINS + q[..., 1]) * HIST_BINS + q[..., 2]
+        bins = HIST_BINS ** 3
+        idx = idx.reshape(n, -1) + (np.arange(n, dtype=np.int32) * bins)[:, None]
+        hists = np.bincount(idx.ravel(), minlength=n * bins).reshape(n, bins).astype(np.float32)
+        hists -= hists.mean(axis=1, keepdims=True)
+        return cls._unit_rows(hists)
+
+    def resize_tiles(self, board_img: np.ndarray, grid: np.ndarray) -> np.ndarray:
+        """按 grid (..., 4)=(y1,y2,x1,x2) 切出格子并缩放到特征尺寸，返回 (N,h,w,3)。
+
+        已设置格子几何且格子不小于该尺寸时，用一次花式索引按步长取样，不做缩放。
+        """
+        cells = grid.reshape(-1, 4)
+        if self._geom is not None:
+            tw, th, stride = self._geom
+            if ((cells[:, 1] - cells[:, 0]) >= th).all() and ((cells[:, 3] - cells[:, 2]) >= tw).all():
+                ys = cells[:, 0, None] + np.arange(0, th, stride)
+                xs = cells[:, 2, None] + np.arange(0, tw, stride)
+                return board_img[ys[:, :, None], xs[:, None, :], :3]
+        w, h = self.feature_size
+        out = np.empty((len(cells), h, w, 3), dtype=np.uint8)
+        for i, (y1, y2, x1, x2) in enumerate(cells):
+            cv2.resize(board_img[y1:y2, x1:x2, :3], (w, h), dst=out[i], interpolation=cv2.INTER_AREA)
+        return out
+
+    def match_stack(self, stack: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """对已缩放的格子栈 (N,h,w,3) 一次性打分，返回 (模板下标, 置信度)。"""
+        if self.classifier is not None:
+            best, conf = self.classifier.predict(stack)
+            return self._class_to_tmpl[best], conf
+        return self._template_stack(stack)
+
+    def _template_stack(self, stack: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """模板匹配打分：0.7*TM_CCOEFF_NORMED + 0.3*直方图相关。"""
+        pix = self._pixel_features(stack)
+        hist = self._hist_features(stack)
+        combined = 0.7 * (pix @ self._tmpl_pixels.T) + 0.3 * (hist @ self._tmpl_hists.T)
+        best = np.argmax(combined, axis=1)
+        return best, combined[np.arange(len(best)), best]
+
+    def match_tiles(self, board_img: np.ndarray, grid: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """批量识别整盘格子，返回 names/confs (rows,cols) 与 centers (rows,cols,2)。"""
+        shape = grid.shape[:-1]
+        if not self.names:
+            return (np.full(shape, 'UNKNOWN'),
+                    np.zeros(shape, dtype=np.float32),
+                    np.full(shape + (2,), 0.5, dtype=np.float32))
+        best, scores = self.match_stack(self.resize_tiles(board_img, grid))
+        # 附加 'UNKNOWN' 保证字符串 dtype 足够宽，后续降级写入不会被截断
+        names = np.array(self.names + ['UNKNOWN'])[best].reshape(shape)
+        centers = self._center_arr[best].reshape(shape + (2,))
+        return names, scores.reshape(shape), centers
+
+    def match_tile(self, tile_img: np.ndarray) -> Tuple[str, float, Tuple[float,float]]:
+        if not self.names:
             return 'UNKNOWN', 0.0, (0.5, 0.5)
-        best_name = 'UNKNOWN'
-        best_score = -1.0
-        for name, tmpl in self.templates.items():
-            h, w = tmpl.shape[:2]
-            resized = cv2.resize(tile_img, (w, h))
-            res = cv2.matchTemplate(resized, tmpl, cv2.TM_CCOEFF_NORMED)
-            score = float(res.max())
-            hist_tile = cv2.calcHist([resized],[0,1,2],None,[8,8,8],[0,256,0,256,0,256])
-            hist_tmpl = cv2.calcHist([tmpl],[0,1,2],None,[8,8,8],[0,256,0,256,0,256])
-            cv2.normalize(hist_tile, hist_tile)
-            cv2.normalize(hist_tmpl, hist_tmpl)
-            hist_score = float(cv2.compareHist(hist_tile, hist_tmpl, cv2.HISTCMP_CORREL))
-            combined = 0.7*score + 0.3*hist_score
-            if combined > best_score:
-                best_score = combined
-                best_name = name
+        h, w = tile_img.shape[:2]
+        grid = np.array([[0, h, 0, w]], dtype=np.int32)
+        best, scores = self.match_stack(self.resize_tiles(tile_img, grid))
+        best_name = (self.names + ['UNKNOWN'])[int(best[0])]
         center_ratio = self.centers.get(best_name, (0.5, 0.5))
-        return best_name, best_score, center_ratio
+        return best_name, float(scores[0]), center_ratio
 
-TEMPLATES = TemplateManager()
+TEMPLATES = METRICS.instrument(TemplateManager(), 'match_tiles', 'match_tile')
@@ -0,0 +1,139 @@
+import sys
+import time
+import types
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='FakeArduino 基于 pty')
+
+from config import CONFIG
+from fake_arduino import FakeArduino
+from actions import MouseActions
+from serial_link import SerialLink
+
+CURSOR = (100, 200)
+
+class Regions:
+    board_region = (0, 0, 600, 600)  # 6x6，每格 100 像素
+
+    def board_ready(self):
+        return True
+
+class Recognizer:
+    center_ratios = None
+
+class SilentArduino(FakeArduino):
+    """执行 S 命令但不回复，模拟回执丢失。"""
+
+    def _reply(self, text: str):
+        if self.lines and self.lines[-1].startswith('S '):
+            return
+        super()._reply(text)
+
+@pytest.fixture(autouse=True)
+def setup(monkeypatch):
+    monkeypatch.setattr(CONFIG, 'rows', 6)
+    monkeypatch.setattr(CONFIG, 'cols', 6)
+    monkeypatch.setitem(sys.modules, 'pyautogui', types.SimpleNamespace(position=lambda: CURSOR, click=lambda: None))
+    monkeypatch.setattr(CONFIG, 'auto_tune', False)
+    monkeypatch.setattr(CONFIG, 'serial_ack_timeout', 0.3)
+    monkeypatch.setattr(CONFIG, 'swap_click_interval', 0.05)
+    monkeypatch.setattr(CONFIG, 'plan_swap_gap', 0.02)
+
+def make(device: FakeArduino) -> MouseActions:
+    device.start()
+    return MouseActions(device.port)
+
+def until(cond, timeout: float = 1.0) -> bool:
+    # 旧协议不回复，假设备可能还没读到最后一条命令
+    deadline = time.perf_counter() + timeout
+    while not cond() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+def lines(device: FakeArduino, cmd: str):
+    return [line for line in device.lines if line.split()[0] == cmd]
+
+def test_v2_handshake_syncs_cursor():
+    dev = FakeArduino()
+    actions = make(dev)
+    try:
+        assert actions.protocol == 2
+        assert lines(dev, 'V')
+        assert (dev.x, dev.y) == CURSOR
+    finally:
+        actions._close_serial()
+        dev.close()
+
+def test_v2_batch_is_pipelined_and_acked():
+    dev = FakeArduino()
+    actions = make(dev)
+    try:
+        actions.swap_batch([((0, 0), (0, 1)), ((3, 3), (4, 3))], Regions(), Recognizer())
+        assert len(lines(dev, 'P')) == 2  # 连接时一次，批开始时一次
+        swaps = lines(dev, 'S')
+        assert len(swaps) == 2
+        # 第一条不等待，第二条由固件等待 plan_swap_gap
+        assert swaps[0].split()[-1] == '0' and swaps[1].split()[-1] == '20'
+        assert dev.clicks == [(50, 50), (150, 50), (350, 350), (350, 450)]
+        assert not actions.link._events
+    finally:
+        actions._close_serial()
+        dev.close()
+
+def test_legacy_firmware_falls_back_to_move_and_click():
+    dev = FakeArduino(legacy=True)
+    actions = make(dev)
+    try:
+        assert actions.protocol == 1
+        assert actions.link is None
+        actions.swap_batch([((0, 0), (0, 1))], Regions(), Recognizer())
+        assert until(lambda: len(lines(dev, 'c')) == 2)
+        assert lines(dev, 'M') == ['M -50 -150', 'M 50 -150']
+    finally:
+        actions._close_serial()
+        dev.close()
+
+def test_ack_timeout_reconnects_without_replay():
+    dev = SilentArduino()
+    actions = make(dev)
+    try:
+        old_ser, old_link = actions.ser, actions.link
+        actions.swap_batch([((0, 0), (0, 1))], Regions(), Recognizer())
+        # 旧串口句柄与读取线程都已关闭后才重新打开
+        assert not old_ser.is_open
+        assert not old_link._reader.is_alive()
+        assert actions.ser is not old_ser and actions.protocol == 2
+        # 固件可能已执行过交换，不能用 M/c 重放
+        assert len(lines(dev, 'S')) == 1
+        assert not lines(dev, 'M') and not lines(dev, 'c')
+    finally:
+        actions._close_serial()
+        dev.close()
+
+def test_late_ack_releases_slot_once():
+    class Port:
+        in_waiting = 0
+
+        def read(self, n):
+            time.sleep(0.01)
+            return b''
+
+        def write(self, data):
+            pass
+
+    link = SerialLink(Port(), max_inflight=2)
+    try:
+        cid = link.send('S', 1, 2)
+        event = link._events[cid]
+        wait = event.wait
+
+        def late(timeout):
+            ok = wait(timeout)
+            link._on_line(f'K {cid}')
+            return ok
+
+        event.wait = late
+        assert link.wait(cid, 0.01) == f'K {cid}'
+        assert link._slots._value == 2
+    finally:
+        link.close()
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from solver import BitboardSolver, Solver, VectorSolver
+
+COLORS = ['red', 'green', 'blue', 'yellow', 'purple', 'orange']
+
+def random_boards(seed: int, count: int):
+    """随机尺寸（含非方形）、随机颜色数的棋盘，部分格子为 UNKNOWN。"""
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        rows, cols = (int(v) for v in rng.integers(1, 10, 2))
+        names = COLORS[:int(rng.integers(2, len(COLORS) + 1))]
+        board = rng.choice(names, (rows, cols)).astype(object)
+        board[rng.random((rows, cols)) < rng.choice([0.0, 0.1, 0.3])] = 'UNKNOWN'
+        yield board
+
+def normalized(matches):
+    return sorted(sorted(group) for group in matches)
+
+# 只比较承诺与 Solver 结果完全一致的引擎；lookahead 按前瞻价值选步，不在此列
+@pytest.mark.parametrize('engine', [BitboardSolver, VectorSolver])
+@pytest.mark.parametrize('seed', range(5))
+def test_engine_matches_reference(engine, seed):
+    ref, fast = Solver(), engine()
+    for board in random_boards(seed, 120):
+        move, score, matches = fast.find_best_move(board)
+        ref_move, ref_score, ref_matches = ref.find_best_move(board)
+        assert (move, score) == (ref_move, ref_score), board
+        assert normalized(matches) == normalized(ref_matches), board
+        assert normalized(fast.find_matches(board)) == normalized(ref.find_matches(board)), board
+        assert fast.swap_scores(board) == ref.swap_scores(board), board
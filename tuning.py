@@ -0,0 +1,203 @@
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+import cv2
+import numpy as np
+from config import CONFIG, BoardConfig
+from metrics import METRICS, log
+
+# 上限为 BoardConfig 默认值（按最慢情况调好的安全值），下限如下
+DEFAULTS = BoardConfig()
+FLOORS: Dict[str, float] = {
+    'swap_click_interval': 0.05,
+    'poll_interval': 0.03,
+    'wait_score_stable_seconds': 0.3,
+    'score_stable_checks': 3,
+    'stable_min_wait': 0.05,
+    'stable_min_still': 0.05,
+    'stable_frames': 2,
+    'stable_timeout': 1.0,
+}
+# stable_frames 的默认值是最少帧数而不是最慢的安全值：动画中途停顿较长时需要更多帧，上限单独给出
+CEILINGS: Dict[str, float] = {
+    'stable_frames': 25,
+}
+# 等待超时为稳定用时的倍数，与旧版检测（wait_score_stable_seconds 的 5 倍）一致
+TIMEOUT_FACTOR = 5
+# 样本数不少于此值才开始调整
+MIN_SAMPLES = 5
+# 探测选中效果时的截图间隔（秒）；格子缩成 SELECT_CELLS x SELECT_CELLS 后比较，边框类高亮也能检出
+SELECT_POLL = 0.01
+SELECT_CELLS = 4
+
+def _clamp(name: str, value: float):
+    hi = CEILINGS.get(name, getattr(DEFAULTS, name))
+    value = min(max(value, FLOORS[name]), hi)
+    return int(math.ceil(value)) if isinstance(hi, int) else round(float(value), 3)
+
+def _small(img: np.ndarray) -> np.ndarray:
+    return cv2.resize(img[:, :, :3], (SELECT_CELLS, SELECT_CELLS), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def _p90(values) -> float:
+    return float(np.percentile(np.asarray(values, dtype=np.float64), 90))
+
+class TimingTuner:
+    """根据最近 tune_window 步的实测延迟在线调整时序参数。
+
+    - 点击到选中：每 tune_probe_every 次交换把第一次点击拆开，轮询该格直到出现选中效果；
+    - 动画：稳定检测记录的首次画面变化时刻、动画持续时间、动画中最长的静止间隔；
+    - 稳定：每次 wait_stable 的总用时。
+    取 P90 乘以 tune_margin 作为新值，并限制在 [FLOORS, BoardConfig 默认值或 CEILINGS] 内；
+    动画中途的最长停顿决定静止窗口的长度：stable_min_still 取该停顿，事件检测另调 stable_frames，
+    旧版检测调 score_stable_checks；
+    出现误识别、交换未生效或等待超时时，各参数翻倍退回并暂停收紧 tune_cooldown 步。
+    学到的值每 tune_window 步写入 config.json 的 timings，下次启动时加载。
+    """
+
+    def __init__(self, persist: bool = True):
+        self.persist = persist
+        self.reset()
+
+    def reset(self):
+        """清空观测与计数（模拟器每次会话重新开始调参）。"""
+        n = max(CONFIG.tune_window, MIN_SAMPLES)
+        self.select: Deque[float] = deque(maxlen=n)
+        self.onset: Deque[float] = deque(maxlen=n)
+        self.anim: Deque[float] = deque(maxlen=n)
+        self.pause: Deque[float] = deque(maxlen=n)
+        self.settle: Deque[float] = deque(maxlen=n)
+        self.moves = 0
+        self.swaps = 0
+        self.cooldown = 0
+        self.backoffs = 0
+        self._board_before: Optional[np.ndarray] = None
+
+    def load(self):
+        """把 config.json 中保存的时序参数应用到 CONFIG。"""
+        if not CONFIG.auto_tune:
+            return
+        from detection import REGIONS
+        loaded = {k: _clamp(k, v) for k, v in REGIONS.timings.items() if k in FLOORS}
+        for name, value in loaded.items():
+            setattr(CONFIG, name, value)
+        if loaded:
+            log(f'[INFO] 已加载自动调参结果: {loaded}')
+
+    def save(self):
+        if not self.persist:
+            return
+        from detection import REGIONS
+        REGIONS.timings = {name: getattr(CONFIG, name) for name in FLOORS}
+        REGIONS.save_config()
+
+    def want_probe(self) -> bool:
+        """本次交换是否拆开第一次点击来测量选中延迟。"""
+        self.swaps += 1
+        return CONFIG.auto_tune and (self.swaps - 1) % max(CONFIG.tune_probe_every, 1) == 0
+
+    def probe_select(self, grab: Callable[[], Optional[np.ndarray]], click: Callable[[], object],
+                     limit: float) -> Optional[float]:
+        """点击并轮询格子图像，返回点击到出现选中效果的延迟；limit 内无变化返回 None（此时已等满 limit）。"""
+        before = grab()
+        start = time.perf_counter()
+        click()
+        if before is None:
+            time.sleep(limit)
+            return None
+        # 截图可能是会被覆盖的视图，基准在下一次截图前算好
+        base = _small(before)
+        while True:
+            elapsed = time.perf_counter() - start
+            img = grab()
+            if img is not None and img.shape == before.shape and \
+                    float(np.abs(_small(img) - base).mean(axis=2).max()) >= CONFIG.board_motion_threshold:
+                self.select.append(elapsed)
+                METRICS.observe('select_delay', elapsed)
+                return elapsed
+            if elapsed >= limit:
+                return None
+            time.sleep(SELECT_POLL)
+
+    def before_swap(self, board: np.ndarray):
+        self._board_before = board.copy()
+
+    def after_recognize(self, board: np.ndarray, recognizer) -> bool:
+        """交换后的新棋盘：重新截图才识别对（稳定判定过早）或棋盘毫无变化（交换未生效）时退回。
+
+        返回交换是否未生效，调用方据此重新同步光标。
+        """
+        before, self._board_before = self._board_before, None
+        if before is None:
+            return False
+        unchanged = before.shape == board.shape and bool((before == board).all())
+        if CONFIG.auto_tune:
+            if recognizer.retry_recovered:
+                self.backoff('稳定后仍识别错误')
+            elif unchanged:
+                self.backoff('交换未生效')
+        return unchanged
+
+    def after_wait(self, checker, stable):
+        """一次稳定等待结束：记录观测并尝试收紧参数。"""
+        if not CONFIG.auto_tune:
+            return
+        self.moves += 1
+        if stable is False:
+            self.backoff('等待稳定超时')
+            return
+        motion_start = getattr(checker, 'motion_start', None)
+        if motion_start is not None:
+            self.onset.append(motion_start)
+            self.anim.append(checker.motion_end - motion_start)
+            self.pause.append(checker.longest_pause)
+        self.settle.append(getattr(checker, 'elapsed', 0.0))
+        self._retune()
+        if self.moves % max(CONFIG.tune_window, 1) == 0:
+            self.save()
+
+    def _retune(self):
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return
+        if len(self.settle) < MIN_SAMPLES:
+            return
+        m = CONFIG.tune_margin
+        event = CONFIG.stability_detector == 'event'
+        settle = _p90(self.settle) * m
+        new = {'wait_score_stable_seconds': settle}
+        if event:
+            new['stable_timeout'] = settle * TIMEOUT_FACTOR
+        if len(self.select) >= MIN_SAMPLES:
+            new['swap_click_interval'] = _p90(self.select) * m
+        if len(self.onset) >= MIN_SAMPLES:
+            new['stable_min_wait'] = _p90(self.onset) * m
+            new['poll_interval'] = float(np.median(self.anim)) / 6
+            # 动画中途的停顿不能被误判为稳定：连续相同帧覆盖的时长要超过最长停顿。
+            # 事件检测确认静止时按 stable_poll_min 轮询，旧版检测按 poll_interval 轮询
+            pause = _p90(self.pause) * m
+            new['stable_min_still'] = pause
+            if event:
+                new['stable_frames'] = pause / CONFIG.stable_poll_min + 1
+            else:
+                new['score_stable_checks'] = pause / _clamp('poll_interval', new['poll_interval']) + 1
+        changed = {}
+        for name, value in new.items():
+            value = _clamp(name, value)
+            if value != getattr(CONFIG, name):
+                setattr(CONFIG, name, value)
+                changed[name] = value
+        if changed:
+            log(f'[STEP] 自动调参: {changed}')
+
+    def backoff(self, reason: str):
+        """各参数翻倍（整数加一）退回，不超过默认值，并暂停收紧。"""
+        self.backoffs += 1
+        self.cooldown = CONFIG.tune_cooldown
+        for name in FLOORS:
+            value = getattr(CONFIG, name)
+            setattr(CONFIG, name, _clamp(name, value + 1 if isinstance(value, int) else value * 2))
+        METRICS.incr('tune_backoffs')
+        log(f'[WARN] {reason}，时序参数退回: {({name: getattr(CONFIG, name) for name in FLOORS})}')
+
+TUNER = TimingTuner()